@@ -1,3 +1,7 @@
+import time
+
+STARTED_AT = time.perf_counter()  # Cold start, before the heavy imports
+
 import os
 import discord
 from discord.ext import commands
@@ -5,6 +9,11 @@ import logging
 import asyncio
 from dotenv import load_dotenv
 import utils.database as db
+from utils.http import http
+from utils.media import media
+from utils.metrics import metrics
+from utils.commandsync import sync_commands
+import config
 import sqlite3
 import os
 
@@ -57,6 +66,7 @@ class SocialMediaBot(commands.Bot):
             'cogs.tiktok',
             'cogs.accounts'
         ]
+        self.ready_seconds = None
 
     async def setup_hook(self):
         logger.info("Starting bot setup...")
@@ -68,11 +78,19 @@ class SocialMediaBot(commands.Bot):
             except Exception as e:
                 logger.error(f"Failed to load extension {extension}: {e}")
 
-        await self.tree.sync()
-        logger.info("Slash commands synced with Discord")
+        # Global syncs are slow and rate limited, only sync when the command tree changed
+        synced = await sync_commands(self, force=config.COMMAND_SYNC_FORCE)
+        if synced is None:
+            logger.info("Slash commands unchanged, sync skipped")
+        else:
+            logger.info(f"Synced {len(synced)} slash commands with Discord")
 
     async def on_ready(self):
         logger.info(f'Logged in as {self.user} (ID: {self.user.id})')
+        if not self.ready_seconds:
+            self.ready_seconds = time.perf_counter() - STARTED_AT
+            metrics.observe('startup.ready_seconds', self.ready_seconds)
+            logger.info(f'Cold start to ready: {self.ready_seconds:.2f}s')
         logger.info('------')
         
         await self.change_presence(
@@ -82,6 +100,12 @@ class SocialMediaBot(commands.Bot):
             )
         )
 
+    async def close(self):
+        """Close the shared HTTP pool and media workers before shutting down"""
+        await http.close()
+        media.close()
+        await super().close()
+
     async def on_command_error(self, ctx, error):
         """Global error handler"""
         if isinstance(error, commands.CommandNotFound):
@@ -0,0 +1,122 @@
+"""
+Cross-post Cog - publish the same content everywhere at once
+Fans one post out to every connected platform concurrently
+"""
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+import asyncio
+import time
+
+from utils.database import async_db
+from utils.outbox import outbox
+from utils.instagram import instagram, containers, users
+from utils.metrics import metrics
+import config
+
+
+class CrossPost(commands.Cog):
+    """Fan-out publishing to Facebook and Instagram"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        # Each publisher returns a short result, or None if the platform is not connected.
+        # Rate limiting is per platform, inside the Graph clients each publisher uses.
+        self.publishers = {
+            'Facebook': self.publish_facebook,
+            'Instagram': self.publish_instagram
+        }
+
+    async def publish_facebook(self, interaction, caption, image_url):
+        """Post the photo to the server's Facebook Page through the publish outbox"""
+        account = await async_db.get_facebook_account(str(interaction.guild_id))
+        if not account:
+            return None
+
+        post_id = await outbox.enqueue({
+            'server_id': str(interaction.guild_id),
+            'page_id': account['page_id'],
+            'message': caption,
+            'image_url': image_url,
+            'platform': 'facebook'
+        }, wait=config.OUTBOX_WAIT_SECONDS)
+        return f"Published `{post_id}`" if post_id else "Queued, will be retried automatically"
+
+    async def publish_instagram(self, interaction, caption, image_url):
+        """Create a media container for the user's Instagram account and wait until it is published"""
+        instagram_cog = self.bot.get_cog('InstagramCog')
+        user = await users.get_user(interaction.user.id)
+        if not user or not instagram_cog:
+            return None
+
+        token = user["instagram_token"]
+        ig_id = user["instagram_id"] or user["username"]
+        # Same preprocessing as /instagram_post; a MediaError is reported as this platform's failure
+        image_url = await instagram_cog.prepared_image_url(interaction, image_url)
+        create_resp = await instagram.post(f"{ig_id}/media", {"image_url": image_url, "caption": caption, "access_token": token})
+        if "id" not in create_resp:
+            raise RuntimeError(f"Failed to create post: {create_resp}")
+
+        publish_resp = await containers.track(create_resp["id"], ig_id, token)
+        return f"Published `{publish_resp['id']}`"
+
+    async def run_publisher(self, name, publisher, interaction, caption, image_url):
+        """Run one platform and time it; failures are returned, not raised"""
+        started = time.monotonic()
+        try:
+            result = await publisher(interaction, caption, image_url)
+            error = None
+        except Exception as e:
+            result, error = None, e
+            metrics.incr(f'crosspost.{name.lower()}_errors')
+        elapsed = time.monotonic() - started
+        metrics.observe(f'crosspost.{name.lower()}_seconds', elapsed)
+        return name, result, error, elapsed
+
+    @app_commands.command(name="post-all", description="Post an image with caption to every connected platform")
+    @app_commands.describe(caption="Text caption for the post", image_url="URL of the image to post")
+    async def post_all(self, interaction: discord.Interaction, caption: str, image_url: str):
+        """Publish to all connected platforms concurrently"""
+        await interaction.response.defer()
+        # Resolve the deferred response now, so later followups (the Instagram image re-host) stay
+        # separate ephemeral messages; the results replace this message at the end
+        await interaction.edit_original_response(content="⏳ Publishing to every connected platform...")
+
+        started = time.monotonic()
+        results = await asyncio.gather(*[
+            self.run_publisher(name, publisher, interaction, caption, image_url)
+            for name, publisher in self.publishers.items()
+        ])
+        total = time.monotonic() - started
+        metrics.observe('crosspost.total_seconds', total)
+
+        published = [result for result in results if result[1]]
+        failed = [result for result in results if result[2]]
+        if not published and not failed:
+            await interaction.edit_original_response(
+                content="❌ No platforms connected. Use `/fb-connect` or `/insta_login_dev` first."
+            )
+            return
+
+        embed = discord.Embed(
+            title="Cross-post Results",
+            description=caption[:150] + ('...' if len(caption) > 150 else ''),
+            color=config.COLOR_ERROR if not published else config.COLOR_WARNING if failed else config.COLOR_SUCCESS
+        )
+        for name, result, error, elapsed in results:
+            if result:
+                value = f"✅ {result} in {elapsed:.1f}s"
+            elif error:
+                value = f"❌ {str(error)[:200]}"
+            else:
+                value = "Not connected"
+            embed.add_field(name=name, value=value, inline=False)
+        embed.set_image(url=image_url)
+        embed.set_footer(text=f"Total time {total:.1f}s")
+
+        await interaction.edit_original_response(content=None, embed=embed)
+
+
+async def setup(bot):
+    await bot.add_cog(CrossPost(bot))
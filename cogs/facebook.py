@@ -6,27 +6,42 @@ All Facebook commands and functionality
 import discord
 from discord import app_commands
 from discord.ext import commands
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
 import aiohttp
-from datetime import datetime
 import asyncio
+import io
+import json
+import logging
 import sys
 import os
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils.database import db
+from utils.database import async_db
 from utils.oauth import oauth
 from utils.scheduler import scheduler
+from utils.graph import graph, GraphAPIError
+from utils.insights import insights as insights_cache
+from utils.harvester import harvester
+from utils.bulk import schedule_bulk, JSON_LINES_EXTENSIONS
+from utils.outbox import outbox
+from utils.upload import upload_facebook_photo, upload_facebook_photo_data, upload_facebook_video
+from utils.media import media, MediaError, upload_filename
+from utils.metrics import metrics
 import config
 
+logger = logging.getLogger(__name__)
+
 
 class Facebook(commands.Cog):
     """Facebook Page commands for Discord bot"""
     
     def __init__(self, bot):
         self.bot = bot
-        self.rate_limiter = RateLimiter()
+        self.account_watcher = None
         print(' Facebook cog initialized')
     
 
@@ -38,16 +53,32 @@ class Facebook(commands.Cog):
         """Start OAuth server and scheduler when cog loads"""
         print(' Loading Facebook cog...')
         
+        # Make sure the hot queries are indexed
+        await async_db.ensure_indexes()
+        
+        # Keep other instances' account changes out of the cache
+        if config.ACCOUNT_CACHE_CHANGE_STREAMS:
+            self.account_watcher = asyncio.create_task(async_db.watch_account_changes())
+        
         # Start OAuth server
         await oauth.start_server()
         
         # Setup scheduler
-        scheduler.set_facebook_callback(self.publish_scheduled_post)
-        scheduler.schedule_check(db)
+        outbox.setup(async_db, scheduler, self.publish_post)
+        scheduler.schedule_check(async_db)
         scheduler.start()
         
+        # Collect insights for every page and Instagram user in the background
+        harvester.start(async_db)
+        
         print(' Facebook cog loaded successfully')
     
+    async def cog_unload(self):
+        """Stop background tasks when cog unloads"""
+        if self.account_watcher:
+            self.account_watcher.cancel()
+        harvester.stop()
+    
     @app_commands.command(name="fb-connect", description="Connect your Facebook Page")
 
 
@@ -59,7 +90,7 @@ class Facebook(commands.Cog):
         server_id = str(interaction.guild_id)
         
         # Check if already connected
-        existing = db.get_facebook_account(server_id)
+        existing = await async_db.get_facebook_account(server_id)
         if existing:
             await interaction.response.send_message(
                 f" Already connected to **{existing.get('page_name', 'Facebook Page')}**!\nUse `/fb-disconnect` to reconnect.",
@@ -112,7 +143,7 @@ class Facebook(commands.Cog):
                 info_msg = f"Connected to: **{selected_page['name']}**"
             
             # Save page account
-            db.save_facebook_account(server_id, {
+            await async_db.save_facebook_account(server_id, {
                 'page_id': selected_page['id'],
                 'page_name': selected_page['name'],
                 'access_token': selected_page['access_token']
@@ -125,7 +156,7 @@ class Facebook(commands.Cog):
             )
             success_embed.add_field(
                 name=" Available Commands",
-                value="`/fb-post` - Post text/link\n`/fb-post-image` - Post image\n`/fb-schedule` - Schedule post\n`/fb-recent` - View recent posts\n`/fb-stats` - Get analytics",
+                value="`/fb-post` - Post text/link\n`/fb-post-image` - Post image\n`/fb-upload` - Upload a file\n`/fb-schedule` - Schedule post\n`/fb-schedule-bulk` - Schedule from a file\n`/fb-recent` - View recent posts\n`/fb-stats` - Get analytics\n`/fb-analytics` - Page trends",
                 inline=False
             )
             
@@ -155,7 +186,7 @@ class Facebook(commands.Cog):
         """Disconnect Facebook Page"""
         server_id = str(interaction.guild_id)
         
-        account = db.get_facebook_account(server_id)
+        account = await async_db.get_facebook_account(server_id)
         if not account:
             await interaction.response.send_message(
                 " No Facebook Page connected.\n\nUse `/fb-connect` to connect a page.",
@@ -164,7 +195,7 @@ class Facebook(commands.Cog):
             return
         
         page_name = account.get('page_name', 'Facebook Page')
-        db.delete_facebook_account(server_id)
+        await async_db.delete_facebook_account(server_id)
         
         embed = discord.Embed(
             title=" Facebook Page Disconnected",
@@ -191,7 +222,7 @@ class Facebook(commands.Cog):
         await interaction.response.defer()
         
         server_id = str(interaction.guild_id)
-        account = db.get_facebook_account(server_id)
+        account = await async_db.get_facebook_account(server_id)
         
         if not account:
             await interaction.followup.send(
@@ -200,27 +231,18 @@ class Facebook(commands.Cog):
             return
         
         try:
-            # Rate limit check
-            await self.rate_limiter.wait()
-            
-            # Post to Facebook
-            post_id = await self.create_post(
-                account['page_id'],
-                account['access_token'],
-                message,
-                link
-            )
-            
-            # Save to database
-            db.save_facebook_post({
+            # Publish through the outbox so transient failures are retried
+            post_id = await outbox.enqueue({
                 'server_id': server_id,
                 'page_id': account['page_id'],
-                'fb_post_id': post_id,
                 'message': message,
                 'link': link,
-                'status': 'published',
                 'platform': 'facebook'
-            })
+            }, wait=config.OUTBOX_WAIT_SECONDS)
+            
+            if not post_id:
+                await interaction.followup.send(embed=self.queued_embed(message))
+                return
             
             # Success message
             embed = discord.Embed(
@@ -258,33 +280,36 @@ class Facebook(commands.Cog):
         await interaction.response.defer()
         
         server_id = str(interaction.guild_id)
-        account = db.get_facebook_account(server_id)
+        account = await async_db.get_facebook_account(server_id)
         
         if not account:
             await interaction.followup.send(" No Facebook Page connected. Use `/fb-connect` first.")
             return
         
         try:
-            await self.rate_limiter.wait()
-            
-            # Post image
-            post_id = await self.post_photo(
-                account['page_id'],
-                account['access_token'],
-                image_url,
-                caption
-            )
-            
-            # Save to database
-            db.save_facebook_post({
+            # Reject bad images now instead of after a round trip through the outbox;
+            # the publisher reuses the processed copy from the cache
+            await media.prepare(image_url, 'facebook')
+        except MediaError as e:
+            await interaction.followup.send(f"❌ Image rejected: {str(e)}")
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Download problems are retried by the outbox
+            logger.warning(f"Could not prepare {image_url} before queueing, the outbox will retry: {e!r}")
+        
+        try:
+            # Publish through the outbox so transient failures are retried
+            post_id = await outbox.enqueue({
                 'server_id': server_id,
                 'page_id': account['page_id'],
-                'fb_post_id': post_id,
                 'message': caption,
                 'image_url': image_url,
-                'status': 'published',
                 'platform': 'facebook'
-            })
+            }, wait=config.OUTBOX_WAIT_SECONDS)
+            
+            if not post_id:
+                await interaction.followup.send(embed=self.queued_embed(caption))
+                return
             
             embed = discord.Embed(
                 title="Image Posted to Facebook!",
@@ -300,6 +325,61 @@ class Facebook(commands.Cog):
         except Exception as e:
             await interaction.followup.send(f"Error posting image: {str(e)}")
     
+    @app_commands.command(name="fb-upload", description="Upload an image or video file to Facebook Page")
+    @app_commands.describe(
+        file="Image or video to upload",
+        caption="Optional: Caption/description for the post"
+    )
+    async def upload(self, interaction: discord.Interaction, file: discord.Attachment, caption: str = None):
+        """Upload an attachment straight to Facebook Page"""
+        await interaction.response.defer()
+        
+        server_id = str(interaction.guild_id)
+        account = await async_db.get_facebook_account(server_id)
+        
+        if not account:
+            await interaction.followup.send("❌ No Facebook Page connected. Use `/fb-connect` first.")
+            return
+        
+        content_type = file.content_type or ''
+        if not content_type.startswith(('image/', 'video/')):
+            await interaction.followup.send("❌ Upload an image or video file.")
+            return
+        
+        try:
+            # The file is streamed from Discord to Facebook without being buffered whole
+            if content_type.startswith('image/'):
+                post_id = await upload_facebook_photo(
+                    account['page_id'], account['access_token'], file.url, file.filename, content_type, caption
+                )
+            else:
+                post_id = await upload_facebook_video(
+                    account['page_id'], account['access_token'], file.url, file.size, caption
+                )
+            
+            await async_db.save_facebook_post({
+                'server_id': server_id,
+                'page_id': account['page_id'],
+                'message': caption,
+                'fb_post_id': post_id,
+                'status': 'published',
+                'platform': 'facebook'
+            })
+            
+            embed = discord.Embed(
+                title="Video Uploaded to Facebook!" if content_type.startswith('video/') else "Image Uploaded to Facebook!",
+                description=caption[:200] if caption else "No caption",
+                color=config.COLOR_SUCCESS
+            )
+            embed.add_field(name="Page", value=account['page_name'])
+            embed.add_field(name="File", value=f"{file.filename} ({file.size / 1024 / 1024:.1f} MB)")
+            embed.add_field(name="Post ID", value=post_id)
+            
+            await interaction.followup.send(embed=embed)
+            
+        except Exception as e:
+            await interaction.followup.send(f"❌ Upload error: {str(e)}")
+    
     @app_commands.command(name="fb-schedule", description="Schedule a Facebook post for later")
     @app_commands.describe(
         message="Text message for your post",
@@ -314,7 +394,7 @@ class Facebook(commands.Cog):
     async def schedule(self, interaction: discord.Interaction, message: str, datetime_str: str, link: str = None):
         """Schedule a Facebook post"""
         server_id = str(interaction.guild_id)
-        account = db.get_facebook_account(server_id)
+        account = await async_db.get_facebook_account(server_id)
         
         if not account:
             await interaction.response.send_message(
@@ -336,7 +416,7 @@ class Facebook(commands.Cog):
                 return
             
             # Save scheduled post
-            post_id = db.save_facebook_post({
+            post = {
                 'server_id': server_id,
                 'page_id': account['page_id'],
                 'message': message,
@@ -344,7 +424,9 @@ class Facebook(commands.Cog):
                 'scheduled_at': scheduled_at,
                 'status': 'scheduled',
                 'platform': 'facebook'
-            })
+            }
+            post_id = await async_db.save_facebook_post(post)
+            scheduler.notify(post)
             
             embed = discord.Embed(
                 title="Facebook Post Scheduled!",
@@ -374,8 +456,52 @@ class Facebook(commands.Cog):
                 ephemeral=True
             )
     
+    @app_commands.command(name="fb-schedule-bulk", description="Schedule many Facebook posts from a CSV or JSON lines file")
+    @app_commands.describe(file="CSV (header: message,scheduled_at,link) or JSON lines; times UTC as YYYY-MM-DD HH:MM")
+    async def schedule_bulk(self, interaction: discord.Interaction, file: discord.Attachment):
+        """Schedule Facebook posts in bulk"""
+        await interaction.response.defer()
+        
+        server_id = str(interaction.guild_id)
+        account = await async_db.get_facebook_account(server_id)
+        
+        if not account:
+            await interaction.followup.send("❌ No Facebook Page connected. Use `/fb-connect` first.")
+            return
+        
+        # A plain .json array can not be streamed row by row, only JSON lines are accepted
+        if not file.filename.lower().endswith(('.csv',) + JSON_LINES_EXTENSIONS):
+            await interaction.followup.send("❌ Upload a `.csv` or `.jsonl` file (one JSON object per line).")
+            return
+        
+        try:
+            result = await schedule_bulk(async_db, scheduler, file.url, file.filename, server_id, account['page_id'])
+            
+            embed = discord.Embed(
+                title="Bulk Schedule Complete",
+                description=f"Scheduled **{result.scheduled:,}** of {result.rows:,} posts for **{account['page_name']}**",
+                color=config.COLOR_SUCCESS if not result.errors else config.COLOR_WARNING
+            )
+            if result.first_at:
+                embed.add_field(
+                    name="📅 Window",
+                    value=f"{result.first_at.strftime('%Y-%m-%d %H:%M')} → {result.last_at.strftime('%Y-%m-%d %H:%M')} UTC",
+                    inline=False
+                )
+            
+            files = []
+            if result.errors:
+                preview = "\n".join(f"Row {row}: {message}" for row, message in result.errors[:10])
+                embed.add_field(name=f"❌ {len(result.errors):,} Rows Rejected", value=preview[:1024], inline=False)
+                files.append(discord.File(io.BytesIO(result.error_report().encode()), filename="schedule_errors.csv"))
+            
+            await interaction.followup.send(embed=embed, files=files)
+        
+        except Exception as e:
+            await interaction.followup.send(f"❌ Bulk scheduling error: {str(e)}")
+    
     @app_commands.command(name="fb-recent", description="View recent posts from your Facebook Page")
-    @app_commands.describe(count="Number of posts to show (max 100, default 10)")
+    @app_commands.describe(count="Number of posts to show (max 10, default 5)")
 
 
 
@@ -383,68 +509,61 @@ class Facebook(commands.Cog):
 
 
 
-    async def recent(self, interaction: discord.Interaction, count: int = 10):
+    async def recent(self, interaction: discord.Interaction, count: int = 5):
         """Get recent posts from Facebook Page"""
         await interaction.response.defer()
         
         server_id = str(interaction.guild_id)
-        account = db.get_facebook_account(server_id)
+        account = await async_db.get_facebook_account(server_id)
         
         if not account:
             await interaction.followup.send("❌ No Facebook Page connected. Use `/fb-connect` first.")
             return
         
         try:
-            await self.rate_limiter.wait()
+            # Only fetch the posts we are going to show
+            count = max(1, min(count, 10))
+            posts = [
+                post async for post in graph.paginate(
+                    f"{account['page_id']}/feed",
+                    {'access_token': account['access_token']},
+                    page_id=account['page_id'],
+                    page_size=count,
+                    fields='id,message,created_time,permalink_url,shares,likes.summary(true),comments.summary(true)',
+                    limit=count
+                )
+            ]
             
-            url = f"{config.FACEBOOK_GRAPH_URL}/{account['page_id']}/feed"
-            params = {
-                'fields': 'id,message,created_time,permalink_url,shares,likes.summary(true),comments.summary(true)',
-                'limit': min(count, 100),
-                'access_token': account['access_token']
-            }
+            if not posts:
+                await interaction.followup.send("📭 No posts found on this page")
+                return
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as resp:
-                    if resp.status != 200:
-                        raise Exception(await resp.text())
-                    
-                    data = await resp.json()
-                    posts = data.get('data', [])
-                    
-                    if not posts:
-                        await interaction.followup.send("📭 No posts found on this page")
-                        return
-                    
-                    embed = discord.Embed(
-                        title=f"📘 Recent Facebook Posts",
-                        description=f"From **{account['page_name']}** ({len(posts)} posts)",
-                        color=config.COLOR_FACEBOOK
-                    )
-                    
-                    for i, post in enumerate(posts[:5], 1):
-                        message = post.get('message', 'No text')[:100]
-                        likes = post.get('likes', {}).get('summary', {}).get('total_count', 0)
-                        comments = post.get('comments', {}).get('summary', {}).get('total_count', 0)
-                        shares = post.get('shares', {}).get('count', 0)
-                        created = post.get('created_time', '')[:10]
-                        
-                        embed.add_field(
-                            name=f"{i}. Post from {created}",
-                            value=f"{message}{'...' if len(post.get('message', '')) > 100 else ''}\n\n👍 {likes} | 💬 {comments} | 🔄 {shares}\n[View Post]({post.get('permalink_url', '#')})",
-                            inline=False
-                        )
-                    
-                    if len(posts) > 5:
-                        embed.set_footer(text=f"Showing 5 of {len(posts)} posts")
-                    
-                    await interaction.followup.send(embed=embed)
+            embed = discord.Embed(
+                title=f"📘 Recent Facebook Posts",
+                description=f"From **{account['page_name']}** (latest {len(posts)} posts)",
+                color=config.COLOR_FACEBOOK
+            )
+            
+            for i, post in enumerate(posts, 1):
+                message = post.get('message', 'No text')[:100]
+                likes = post.get('likes', {}).get('summary', {}).get('total_count', 0)
+                comments = post.get('comments', {}).get('summary', {}).get('total_count', 0)
+                shares = post.get('shares', {}).get('count', 0)
+                created = post.get('created_time', '')[:10]
+                
+                embed.add_field(
+                    name=f"{i}. Post from {created}",
+                    value=f"{message}{'...' if len(post.get('message', '')) > 100 else ''}\n\n👍 {likes} | 💬 {comments} | 🔄 {shares}\n[View Post]({post.get('permalink_url', '#')})",
+                    inline=False
+                )
+            
+            await interaction.followup.send(embed=embed)
         
         except Exception as e:
             await interaction.followup.send(f"❌ Error fetching posts: {str(e)}")
     
-    @app_commands.command(name="fb-stats", description="Get analytics for a Facebook post")
-    @app_commands.describe(post_id="Facebook post ID (format: 123456789_987654321)")
+    @app_commands.command(name="fb-stats", description="Get analytics for Facebook posts")
+    @app_commands.describe(post_id="Facebook post ID(s), comma separated, up to 50 (format: 123456789_987654321)")
 
 
 
@@ -452,83 +571,35 @@ class Facebook(commands.Cog):
 
 
     async def stats(self, interaction: discord.Interaction, post_id: str):
-        """Get analytics for a Facebook post"""
+        """Get analytics for one or more Facebook posts"""
         await interaction.response.defer()
         
         server_id = str(interaction.guild_id)
-        account = db.get_facebook_account(server_id)
+        account = await async_db.get_facebook_account(server_id)
         
         if not account:
             await interaction.followup.send("❌ No Facebook Page connected. Use `/fb-connect` first.")
             return
         
+        post_ids = [p.strip() for p in post_id.replace(' ', ',').split(',') if p.strip()][:50]
+        
         try:
-            await self.rate_limiter.wait()
-            
-            # Get post insights
-            url = f"{config.FACEBOOK_GRAPH_URL}/{post_id}/insights"
-            params = {
-                'metric': 'post_impressions,post_engaged_users,post_clicks,post_reactions_by_type_total',
-                'access_token': account['access_token']
-            }
+            # Fresh snapshots come from the database, the rest go out in one Graph batch call
+            results = await asyncio.gather(*[
+                insights_cache.facebook(pid, server_id, account['page_id'], account['access_token'])
+                for pid in post_ids
+            ], return_exceptions=True)
+            all_insights = dict(zip(post_ids, results))
+            
+            if len(post_ids) == 1:
+                insights = all_insights[post_ids[0]]
+                if isinstance(insights, Exception):
+                    raise insights
+                embed = self.insights_embed(post_ids[0], insights)
+            else:
+                embed = self.insights_summary_embed(all_insights)
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as resp:
-                    if resp.status != 200:
-                        error = await resp.text()
-                        raise Exception(f"API error: {error}")
-                    
-                    data = await resp.json()
-                    insights = {}
-                    
-                    for item in data.get('data', []):
-                        metric_name = item['name']
-                        value = item['values'][0]['value']
-                        insights[metric_name] = value
-                    
-                    # Save analytics
-                    db.save_facebook_analytics({
-                        'post_id': post_id,
-                        'server_id': server_id,
-                        **insights
-                    })
-                    
-                    # Create analytics embed
-                    embed = discord.Embed(
-                        title="📊 Facebook Post Analytics",
-                        description=f"Statistics for post: `{post_id}`",
-                        color=config.COLOR_FACEBOOK
-                    )
-                    
-                    embed.add_field(
-                        name="👁️ Impressions",
-                        value=f"{insights.get('post_impressions', 0):,}",
-                        inline=True
-                    )
-                    embed.add_field(
-                        name="👥 Engaged Users",
-                        value=f"{insights.get('post_engaged_users', 0):,}",
-                        inline=True
-                    )
-                    embed.add_field(
-                        name="🖱️ Clicks",
-                        value=f"{insights.get('post_clicks', 0):,}",
-                        inline=True
-                    )
-                    
-                    # Reactions breakdown
-                    reactions = insights.get('post_reactions_by_type_total', {})
-                    if reactions:
-                        reaction_str = ' | '.join([f"{k}: {v}" for k, v in reactions.items()])
-                        embed.add_field(
-                            name="❤️ Reactions Breakdown",
-                            value=reaction_str,
-                            inline=False
-                        )
-                    
-                    embed.set_footer(text=f"Data fetched at {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}")
-                    
-                    await interaction.followup.send(embed=embed)
+            await interaction.followup.send(embed=embed)
         
         except Exception as e:
             await interaction.followup.send(
@@ -542,30 +613,23 @@ class Facebook(commands.Cog):
         await interaction.response.defer()
         
         server_id = str(interaction.guild_id)
-        account = db.get_facebook_account(server_id)
+        account = await async_db.get_facebook_account(server_id)
         
         if not account:
             await interaction.followup.send("❌ No Facebook Page connected. Use `/fb-connect` first.")
             return
         
         try:
-            await self.rate_limiter.wait()
-            
-            url = f"{config.FACEBOOK_GRAPH_URL}/{post_id}"
             params = {'access_token': account['access_token']}
             
-            async with aiohttp.ClientSession() as session:
-                async with session.delete(url, params=params) as resp:
-                    if resp.status == 200:
-                        embed = discord.Embed(
-                            title="✅ Post Deleted",
-                            description=f"Successfully deleted post: `{post_id}`",
-                            color=config.COLOR_SUCCESS
-                        )
-                        await interaction.followup.send(embed=embed)
-                    else:
-                        error = await resp.text()
-                        raise Exception(error)
+            await graph.delete(post_id, params, page_id=account['page_id'])
+            
+            embed = discord.Embed(
+                title="✅ Post Deleted",
+                description=f"Successfully deleted post: `{post_id}`",
+                color=config.COLOR_SUCCESS
+            )
+            await interaction.followup.send(embed=embed)
         
         except Exception as e:
             await interaction.followup.send(f" Error deleting post: {str(e)}")
@@ -576,65 +640,266 @@ class Facebook(commands.Cog):
         await interaction.response.defer()
         
         server_id = str(interaction.guild_id)
-        account = db.get_facebook_account(server_id)
+        account = await async_db.get_facebook_account(server_id)
         
         if not account:
             await interaction.followup.send(" No Facebook Page connected. Use `/fb-connect` first.")
             return
         
         try:
-            await self.rate_limiter.wait()
-            
-            url = f"{config.FACEBOOK_GRAPH_URL}/{account['page_id']}"
             params = {
                 'fields': 'id,name,fan_count,followers_count,category,about,website',
                 'access_token': account['access_token']
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as resp:
-                    if resp.status != 200:
-                        raise Exception(await resp.text())
-                    
-                    page_data = await resp.json()
-                    
-                    embed = discord.Embed(
-                        title=f"{page_data.get('name', 'Facebook Page')}",
-                        description=page_data.get('about', 'No description'),
-                        color=config.COLOR_FACEBOOK,
-                        url=page_data.get('website', f"https://facebook.com/{page_data['id']}")
-                    )
-                    
-                    embed.add_field(
-                        name=" Fans/Likes",
-                        value=f"{page_data.get('fan_count', 0):,}",
-                        inline=True
-                    )
-                    embed.add_field(
-                        name="Followers",
-                        value=f"{page_data.get('followers_count', 0):,}",
-                        inline=True
-                    )
-                    embed.add_field(
-                        name="Category",
-                        value=page_data.get('category', 'Unknown'),
-                        inline=True
-                    )
-                    embed.add_field(
-                        name="Page ID",
-                        value=page_data['id'],
-                        inline=False
-                    )
-                    
-                    await interaction.followup.send(embed=embed)
+            page_data = await graph.get(account['page_id'], params, page_id=account['page_id'])
+            
+            embed = discord.Embed(
+                title=f"{page_data.get('name', 'Facebook Page')}",
+                description=page_data.get('about', 'No description'),
+                color=config.COLOR_FACEBOOK,
+                url=page_data.get('website', f"https://facebook.com/{page_data['id']}")
+            )
+            
+            embed.add_field(
+                name=" Fans/Likes",
+                value=f"{page_data.get('fan_count', 0):,}",
+                inline=True
+            )
+            embed.add_field(
+                name="Followers",
+                value=f"{page_data.get('followers_count', 0):,}",
+                inline=True
+            )
+            embed.add_field(
+                name="Category",
+                value=page_data.get('category', 'Unknown'),
+                inline=True
+            )
+            embed.add_field(
+                name="Page ID",
+                value=page_data['id'],
+                inline=False
+            )
+            
+            await interaction.followup.send(embed=embed)
         
         except Exception as e:
             await interaction.followup.send(f"❌ Error fetching page info: {str(e)}")
     
+    @app_commands.command(name="fb-analytics", description="Engagement totals, trends and top posts for your Facebook Page")
+    @app_commands.describe(days="Number of days to report on (max 90, default 30)")
+    async def analytics(self, interaction: discord.Interaction, days: int = 30):
+        """Aggregated Page analytics from harvested insights"""
+        await interaction.response.defer()
+        
+        server_id = str(interaction.guild_id)
+        account = await async_db.get_facebook_account(server_id)
+        
+        if not account:
+            await interaction.followup.send("❌ No Facebook Page connected. Use `/fb-connect` first.")
+            return
+        
+        try:
+            days = max(1, min(days, 90))
+            since = datetime.utcnow() - timedelta(days=days)
+            report = await async_db.aggregate_analytics('facebook', account['page_id'], since)
+            
+            if not report['totals']:
+                await interaction.followup.send("No analytics collected for this period yet. Analytics are harvested in the background.")
+                return
+            
+            embed = self.analytics_report_embed(account.get('page_name', 'Facebook Page'), days, report)
+            await interaction.followup.send(embed=embed)
+        
+        except Exception as e:
+            await interaction.followup.send(f"❌ Error building analytics: {str(e)}")
+    
+    @app_commands.command(name="fb-analytics-backfill", description="Rebuild the analytics rollups for your Facebook Page")
+    @app_commands.default_permissions(administrator=True)
+    async def analytics_backfill(self, interaction: discord.Interaction):
+        """Rebuild hourly/daily rollups from the raw analytics series"""
+        await interaction.response.defer(ephemeral=True)
+        
+        server_id = str(interaction.guild_id)
+        account = await async_db.get_facebook_account(server_id)
+        
+        if not account:
+            await interaction.followup.send("❌ No Facebook Page connected. Use `/fb-connect` first.", ephemeral=True)
+            return
+        
+        try:
+            count = await async_db.rebuild_rollups('facebook', account['page_id'])
+            await interaction.followup.send(f"✅ Rebuilt analytics rollups from {count:,} data points", ephemeral=True)
+        
+        except Exception as e:
+            await interaction.followup.send(f"❌ Error rebuilding rollups: {str(e)}", ephemeral=True)
+    
+    @app_commands.command(name="fb-dead-letters", description="List posts that failed to publish for good")
+    @app_commands.default_permissions(administrator=True)
+    async def dead_letters(self, interaction: discord.Interaction):
+        """Inspect dead-lettered posts"""
+        await interaction.response.defer(ephemeral=True)
+        
+        letters = await async_db.get_dead_letters(str(interaction.guild_id), limit=10)
+        if not letters:
+            await interaction.followup.send("✅ No failed posts.", ephemeral=True)
+            return
+        
+        embed = discord.Embed(
+            title="Failed Posts",
+            description="Use `/fb-replay` with an ID to publish a post again",
+            color=config.COLOR_ERROR
+        )
+        for letter in letters:
+            message = letter.get('message') or letter.get('image_url') or ''
+            embed.add_field(
+                name=f"{letter['_id']}",
+                value=(
+                    f"{message[:80]}{'...' if len(message) > 80 else ''}\n"
+                    f"❌ {letter['error'][:200]}\n"
+                    f"{letter.get('attempts', 0)} attempts, failed {letter['failed_at'].strftime('%Y-%m-%d %H:%M UTC')}"
+                ),
+                inline=False
+            )
+        await interaction.followup.send(embed=embed, ephemeral=True)
+    
+    @app_commands.command(name="fb-replay", description="Queue a failed post to be published again")
+    @app_commands.describe(letter_id="ID from /fb-dead-letters")
+    @app_commands.default_permissions(administrator=True)
+    async def replay(self, interaction: discord.Interaction, letter_id: str):
+        """Replay a dead-lettered post"""
+        await interaction.response.defer(ephemeral=True)
+        
+        try:
+            letter, post = await outbox.replay(ObjectId(letter_id), str(interaction.guild_id))
+        except InvalidId:
+            letter, post = None, None
+        
+        if not letter:
+            await interaction.followup.send("❌ No failed post with that ID.", ephemeral=True)
+            return
+        if not post:
+            await interaction.followup.send(
+                "⚠️ That post is no longer marked failed (it is being published or was already published), so it was not requeued.",
+                ephemeral=True
+            )
+            return
+        await interaction.followup.send("✅ Post queued for publishing.", ephemeral=True)
+    
     # Helper Methods
+    def queued_embed(self, message):
+        """Embed for a post that is still waiting in the outbox (e.g. for a retry)"""
+        embed = discord.Embed(
+            title="Post Queued",
+            description=(message or "No caption")[:300],
+            color=config.COLOR_WARNING
+        )
+        embed.add_field(
+            name="Status",
+            value="Facebook did not accept the post yet. It will be retried automatically.",
+            inline=False
+        )
+        return embed
+    
+    def analytics_report_embed(self, page_name, days, report):
+        """Build the aggregated analytics embed from an aggregate_analytics report"""
+        totals = report['totals'][0]
+        embed = discord.Embed(
+            title=f"📈 {page_name} - Last {days} Days",
+            description=f"{totals['posts']} posts tracked",
+            color=config.COLOR_FACEBOOK
+        )
+        
+        embed.add_field(name="👥 Engaged Users", value=f"{totals['engagement']:,}", inline=True)
+        embed.add_field(name="👁️ Impressions", value=f"{totals['reach']:,}", inline=True)
+        embed.add_field(name="📈 Growth", value=f"+{totals['gained']:,} engaged users", inline=True)
+        
+        daily = "\n".join(
+            f"`{day['_id'].strftime('%Y-%m-%d')}` 👥 {day['engagement']:,} | 👁️ {day['reach']:,}"
+            for day in report['daily'][-10:]
+        )
+        embed.add_field(name="📅 Per Day", value=daily or "No data", inline=False)
+        
+        by_type = "\n".join(
+            f"**{group['_id'] or 'unknown'}**: {group['posts']} posts, avg {group['avg_engagement']:,.1f}"
+            for group in report['by_type']
+        )
+        embed.add_field(name="🗂️ By Post Type", value=by_type or "No data", inline=False)
+        
+        top = "\n".join(
+            f"`{post['_id']}` 👥 {post['engagement']:,} (+{post['gained']:,})"
+            for post in report['top_posts']
+        )
+        embed.add_field(name="🏆 Top Posts", value=top or "No data", inline=False)
+        
+        embed.set_footer(text=f"Generated at {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}")
+        return embed
+    
+    def insights_embed(self, post_id, insights):
+        """Build the analytics embed for a single post"""
+        embed = discord.Embed(
+            title="📊 Facebook Post Analytics",
+            description=f"Statistics for post: `{post_id}`",
+            color=config.COLOR_FACEBOOK
+        )
+        
+        embed.add_field(
+            name="👁️ Impressions",
+            value=f"{insights.get('post_impressions', 0):,}",
+            inline=True
+        )
+        embed.add_field(
+            name="👥 Engaged Users",
+            value=f"{insights.get('post_engaged_users', 0):,}",
+            inline=True
+        )
+        embed.add_field(
+            name="🖱️ Clicks",
+            value=f"{insights.get('post_clicks', 0):,}",
+            inline=True
+        )
+        
+        # Reactions breakdown
+        reactions = insights.get('post_reactions_by_type_total', {})
+        if reactions:
+            reaction_str = ' | '.join([f"{k}: {v}" for k, v in reactions.items()])
+            embed.add_field(
+                name="❤️ Reactions Breakdown",
+                value=reaction_str,
+                inline=False
+            )
+        
+        embed.set_footer(text=f"Data fetched at {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}")
+        return embed
+    
+    def insights_summary_embed(self, all_insights):
+        """Build one compact analytics embed for several posts"""
+        embed = discord.Embed(
+            title="📊 Facebook Post Analytics",
+            description=f"Statistics for {len(all_insights)} posts",
+            color=config.COLOR_FACEBOOK
+        )
+        
+        for post_id, insights in list(all_insights.items())[:25]:
+            if isinstance(insights, Exception):
+                value = f"❌ {str(insights)[:200]}"
+            else:
+                value = (
+                    f"👁️ {insights.get('post_impressions', 0):,} | "
+                    f"👥 {insights.get('post_engaged_users', 0):,} | "
+                    f"🖱️ {insights.get('post_clicks', 0):,}"
+                )
+            embed.add_field(name=post_id, value=value, inline=False)
+        
+        if len(all_insights) > 25:
+            embed.set_footer(text=f"Showing 25 of {len(all_insights)} posts")
+        else:
+            embed.set_footer(text=f"Data fetched at {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}")
+        return embed
+    
     async def create_post(self, page_id, access_token, message, link=None):
         """Create a text post on Facebook Page"""
-        url = f"{config.FACEBOOK_GRAPH_URL}/{page_id}/feed"
         params = {
             'message': message,
             'access_token': access_token
@@ -643,14 +908,8 @@ class Facebook(commands.Cog):
         if link:
             params['link'] = link
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, params=params) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data['id']
-                else:
-                    error = await resp.text()
-                    raise Exception(f"Post failed: {error}")
+        data = await graph.post(f"{page_id}/feed", params, page_id=page_id)
+        return data['id']
     
 
 
@@ -658,78 +917,58 @@ class Facebook(commands.Cog):
 
     async def post_photo(self, page_id, access_token, image_url, caption=None):
         """Post photo to Facebook Page"""
-        url = f"{config.FACEBOOK_GRAPH_URL}/{page_id}/photos"
+        image = await media.prepare(image_url, 'facebook')
+        
+        # Each image is uploaded to a page once, later posts attach the same unpublished photo
+        photo_id = await async_db.get_facebook_photo(page_id, image['hash'])
+        if photo_id:
+            try:
+                post_id = await self.post_attached_photo(page_id, access_token, photo_id, caption)
+                metrics.incr('media.photo_reused')
+                return post_id
+            except GraphAPIError as e:
+                if e.retryable:
+                    raise
+                # Deleted or expired on Facebook's side, upload it again
+                await async_db.delete_facebook_photo(page_id, image['hash'])
+        
+        photo_id = await upload_facebook_photo_data(
+            page_id, access_token, image['data'], upload_filename(image), image['content_type'], published=False
+        )
+        await async_db.save_facebook_photo(page_id, image['hash'], photo_id)
+        metrics.incr('media.photo_uploaded')
+        return await self.post_attached_photo(page_id, access_token, photo_id, caption)
+    
+    async def post_attached_photo(self, page_id, access_token, photo_id, caption=None):
+        """Create a Page post showing an already uploaded photo"""
         params = {
-            'url': image_url,
+            'attached_media': json.dumps([{'media_fbid': photo_id}]),
             'access_token': access_token
         }
         
         if caption:
-            params['caption'] = caption
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, params=params) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data['id']
-                else:
-                    error = await resp.text()
-                    raise Exception(f"Image post failed: {error}")
+            params['message'] = caption
+        
+        data = await graph.post(f"{page_id}/feed", params, page_id=page_id)
+        return data['id']
     
 
 
 
     
-    async def publish_scheduled_post(self, post):
-        """Publish a scheduled Facebook post"""
-        try:
-            account = db.get_facebook_account(post['server_id'])
-            if not account:
-                db.update_facebook_post_status(post['_id'], 'failed')
-                print(f"No account found for server {post['server_id']}")
-                return
-            
-            await self.rate_limiter.wait()
-            
-            # Post to Facebook
-            post_id = await self.create_post(
-                post['page_id'],
-                account['access_token'],
-                post['message'],
-                post.get('link')
-            )
-            
-            db.update_facebook_post_status(post['_id'], 'published', post_id)
-            print(f'Published scheduled Facebook post: {post_id}')
-            
-        except Exception as e:
-            print(f'Failed to publish scheduled post {post.get("_id")}: {e}')
-            db.update_facebook_post_status(post['_id'], 'failed')
-
-
-class RateLimiter:
-    """Rate limiter for Facebook API"""
-    def __init__(self):
-        self.calls = []
-        self.max_calls = config.FACEBOOK_MAX_CALLS
-        self.window = config.RATE_LIMIT_WINDOW
-    
-    async def wait(self):
-        """Wait if rate limit reached"""
-        now = datetime.utcnow().timestamp()
-        
-        # Remove old calls outside the time window
-        self.calls = [t for t in self.calls if t > now - self.window]
-        
-        # Check if limit reached
-        if len(self.calls) >= self.max_calls:
-            wait_time = self.calls[0] + self.window - now
-            if wait_time > 0:
-                print(f' Facebook rate limit reached ({self.max_calls}/hour), waiting {wait_time:.0f}s')
-                await asyncio.sleep(wait_time)
-                self.calls = []
-        
-        self.calls.append(now)
+    async def publish_post(self, post):
+        """Publish one outbox job (already leased by the scheduler) and return the Facebook post ID"""
+        account = await async_db.get_facebook_account(post['server_id'])
+        if not account:
+            raise RuntimeError(f"No Facebook account connected for server {post['server_id']}")
+        
+        if post.get('image_url'):
+            post_id = await self.post_photo(post['page_id'], account['access_token'], post['image_url'], post.get('message'))
+        else:
+            post_id = await self.create_post(post['page_id'], account['access_token'], post['message'], post.get('link'))
+        
+        print(f'Published Facebook post: {post_id}')
+        return post_id
 
 
 async def setup(bot):
@@ -2,76 +2,18 @@
 from discord import app_commands, ui
 from discord.ext import commands
 import discord
-import requests
-import sqlite3
-import os
-from urllib.parse import urlencode
+import aiohttp
 import asyncio
-
-DB_PATH = 'database.db'
-
-APP_ID = os.getenv("APP_ID")
-APP_SECRET = os.getenv("APP_SECRET")
-REDIRECT_URI = os.getenv("REDIRECT_URI")
-GRAPH_API_VERSION = "v20.0"
-
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            discord_id TEXT NOT NULL UNIQUE,
-            username TEXT NOT NULL,
-            instagram_token TEXT NOT NULL,
-            instagram_id TEXT
-        );
-    ''')
-    conn.close()
-
-
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
-def insert_user(discord_id, username, token, instagram_id=None):
-    conn = get_db_connection()
-    with conn:
-        conn.execute('''
-            INSERT OR REPLACE INTO users (discord_id, username, instagram_token, instagram_id)
-            VALUES (?, ?, ?, ?)
-        ''', (discord_id, username, token, instagram_id))
-    conn.close()
-
-
-def remove_user(discord_id):
-    conn = get_db_connection()
-    with conn:
-        conn.execute('DELETE FROM users WHERE discord_id = ?', (discord_id,))
-    conn.close()
-
-
-def get_user_data(discord_id):
-    conn = get_db_connection()
-    cursor = conn.execute('SELECT * FROM users WHERE discord_id = ?', (str(discord_id),))
-    row = cursor.fetchone()
-    conn.close()
-    return row
-
-
-def call_api(params, endpoint):
-    resp = requests.get(f"https://graph.instagram.com/{endpoint}", params=params)
-    return resp.json()
-
-
-def call_api_post(params, endpoint):
-    resp = requests.post(f"https://graph.instagram.com/{endpoint}", data=params)
-    try:
-        return resp.json()
-    except ValueError:
-        return {"error": "invalid_json_response", "status_code": resp.status_code, "text": resp.text}
+import io
+from datetime import datetime, timedelta
+from utils.database import async_db
+from utils.graph import GraphAPIError
+from utils.instagram import instagram, containers, users
+from utils.views import RegisteredView
+from utils.insights import insights
+from utils.upload import upload_instagram_video
+from utils.media import media, MediaError, upload_filename
+import config
 
 
 def format_dict(data, indent=0):
@@ -99,41 +41,102 @@ def shorten_url(url, max_len=40):
     return url[:max_len] + "..."
 
 
-class InstagramPostsView(ui.View):
-    def __init__(self, post_data, token):
-        super().__init__(timeout=None)
-        self.post_data = post_data
-        self.token = token
-
-    @ui.button(label="Delete Post", style=discord.ButtonStyle.danger)
-    async def delete_button(self, interaction: discord.Interaction, button: ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        resp = requests.delete(f"https://graph.instagram.com/{self.post_data['id']}", params={"access_token": self.token})
-        result = resp.json() if resp.text else {"status": "success"}
-        await interaction.followup.send(f"Post deleted:\n{format_dict(result)}", ephemeral=True)
-        self.stop()
-
-    @ui.button(label="View Details", style=discord.ButtonStyle.secondary)
-    async def details_button(self, interaction: discord.Interaction, button: ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        await interaction.followup.send(f"Post Details:\n{format_dict(self.post_data)}", ephemeral=True)
-
-    @ui.button(label="View Insights", style=discord.ButtonStyle.primary)
-    async def view_insights(self, interaction: discord.Interaction, button: ui.Button):
+def post_embed(post, position=None):
+    caption = post.get('caption', 'No caption')
+    media_type = post.get('media_type')
+    media_url = post.get('media_url', '')
+    url_short = shorten_url(media_url)
+    timestamp = post.get('timestamp', '')
+
+    embed = discord.Embed(title=f"Post {post['id']}", color=discord.Color.blue())
+    embed.add_field(name="Caption", value=caption, inline=False)
+    embed.add_field(name="Type", value=media_type, inline=True)
+    embed.add_field(name="URL", value=url_short, inline=False)
+    embed.add_field(name="Timestamp", value=timestamp, inline=True)
+    if media_url:
+        embed.set_image(url=media_url)
+    if position:
+        embed.set_footer(text=position)
+    return embed
+
+
+POST_ACTIONS = {
+    "delete": ("Delete Post", discord.ButtonStyle.danger),
+    "details": ("View Details", discord.ButtonStyle.secondary),
+    "insights": ("View Insights", discord.ButtonStyle.primary)
+}
+
+
+def analytics_embed(account, days, report):
+    totals = report['totals'][0]
+    embed = discord.Embed(
+        title=f"Analytics for {account} - last {days} days",
+        description=f"{totals['posts']} posts tracked",
+        color=config.COLOR_INSTAGRAM
+    )
+    embed.add_field(name="Engagement", value=f"{totals['engagement']:,}", inline=True)
+    embed.add_field(name="Reach", value=f"{totals['reach']:,}", inline=True)
+    embed.add_field(name="Growth", value=f"+{totals['gained']:,}", inline=True)
+
+    daily = "\n".join(
+        f"`{day['_id'].strftime('%Y-%m-%d')}` engagement {day['engagement']:,}, reach {day['reach']:,}"
+        for day in report['daily'][-10:]
+    )
+    embed.add_field(name="Per day", value=daily or "No data", inline=False)
+
+    by_type = "\n".join(
+        f"**{group['_id']}**: {group['posts']} posts, avg {group['avg_engagement']:,.1f}"
+        for group in report['by_type']
+    )
+    embed.add_field(name="By media type", value=by_type or "No data", inline=False)
+
+    top = "\n".join(
+        f"`{post['_id']}` {post['engagement']:,} (+{post['gained']:,})"
+        for post in report['top_posts']
+    )
+    embed.add_field(name="Top posts", value=top or "No data", inline=False)
+    return embed
+
+
+class PostActionButton(ui.DynamicItem[ui.Button], template=r'ig:(?P<action>delete|details|insights):(?P<post_id>\d+):(?P<media_type>\w+)'):
+    """Post button whose state lives in its custom_id, so it keeps working after restarts and view timeouts
+
+    The access token is looked up for whoever clicks, it is never kept on the button.
+    """
+
+    def __init__(self, action, post_id, media_type):
+        label, style = POST_ACTIONS[action]
+        super().__init__(ui.Button(label=label, style=style, row=1, custom_id=f"ig:{action}:{post_id}:{media_type}"))
+        self.action = action
+        self.post_id = post_id
+        self.media_type = media_type
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match['action'], match['post_id'], match['media_type'])
+
+    async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
-        post_type = self.post_data.get("media_type", "IMAGE").lower()
+        user = await users.get_user(interaction.user.id)
+        if not user:
+            await interaction.followup.send("You are not registered. Use /insta_login_dev first.", ephemeral=True)
+            return
+        token = user["instagram_token"]
 
-        metrics_map = {
-            "image": "reach,likes,comments,saved",
-            "video": "reach,likes,comments,video_views,shares",
-            "reels": "reach,likes,comments,plays,shares,saved"
-        }
+        if self.action == "delete":
+            result = await instagram.delete(self.post_id, {"access_token": token})
+            await interaction.followup.send(f"Post deleted:\n{format_dict(result)}", ephemeral=True)
+        elif self.action == "details":
+            params = {"fields": "id,caption,media_type,media_url,permalink,timestamp", "access_token": token}
+            post_data = await instagram.get(self.post_id, params)
+            await interaction.followup.send(f"Post Details:\n{format_dict(post_data)}", ephemeral=True)
+        else:
+            await interaction.followup.send(embed=await self.insights_embed(token, user["discord_id"]), ephemeral=True)
 
-        metrics = metrics_map.get(post_type, "reach,likes,comments")
-        params = {"metric": metrics, "access_token": self.token}
-        resp = call_api(params, f"{self.post_data['id']}/insights")
+    async def insights_embed(self, token, discord_id):
+        resp = await insights.instagram(self.post_id, self.media_type, token, discord_id)
 
-        embed = discord.Embed(title=f"Insights for Post {self.post_data['id']}", color=discord.Color.green())
+        embed = discord.Embed(title=f"Insights for Post {self.post_id}", color=discord.Color.green())
         if "data" in resp and isinstance(resp["data"], list):
             for metric in resp["data"]:
                 name = metric.get("name", "Unknown")
@@ -142,16 +145,136 @@ class InstagramPostsView(ui.View):
                     embed.add_field(name=name, value=str(values[-1].get("value", "N/A")), inline=True)
         else:
             embed.description = str(resp)
-        await interaction.followup.send(embed=embed, ephemeral=True)
+        return embed
+
+
+class InstagramPostsView(RegisteredView):
+    """Single-message browser over a user's media; pages are fetched from the Graph cursor as they are reached"""
+
+    def __init__(self, posts):
+        super().__init__(timeout=config.INSTAGRAM_VIEW_TIMEOUT)
+        self.posts = posts  # async iterator from instagram.paginate()
+        self.fetched = []
+        self.index = 0
+        self.exhausted = False
+        self.message = None
+        self._cursor_lock = asyncio.Lock()  # Quick clicks must not advance the generator concurrently
+
+    async def fetch_until(self, index):
+        """Pull items from the cursor until `index` is loaded; returns False if there are not that many"""
+        async with self._cursor_lock:
+            while len(self.fetched) <= index and not self.exhausted:
+                try:
+                    self.fetched.append(await anext(self.posts))
+                except StopAsyncIteration:
+                    self.exhausted = True
+            return index < len(self.fetched)
+
+    @property
+    def post_data(self):
+        return self.fetched[self.index]
+
+    def render(self):
+        total = str(len(self.fetched)) if self.exhausted else f"{len(self.fetched)}+"
+        self.prev_button.disabled = self.index == 0
+        self.next_button.disabled = self.exhausted and self.index >= len(self.fetched) - 1
+
+        for item in [item for item in self.children if isinstance(item, PostActionButton)]:
+            self.remove_item(item)
+        for action in POST_ACTIONS:
+            self.add_item(PostActionButton(action, self.post_data['id'], self.post_data.get('media_type', 'IMAGE')))
+
+        return post_embed(self.post_data, f"Post {self.index + 1} of {total}")
+
+    async def show(self, interaction, index):
+        await interaction.response.defer()
+        try:
+            loaded = await self.fetch_until(index)
+        except GraphAPIError as e:
+            # The cursor is finished after an error, keep browsing what was loaded
+            self.exhausted = True
+            loaded = False
+            await interaction.followup.send(f"Could not load more posts: {e.message}", ephemeral=True)
+        if loaded:
+            self.index = index
+        else:
+            self.index = len(self.fetched) - 1
+        await interaction.edit_original_response(embed=self.render(), view=self)
+
+    async def on_timeout(self):
+        await super().on_timeout()
+        # Drop the cursor and cached posts; the post buttons stay usable through their custom_ids
+        async with self._cursor_lock:
+            self.fetched = self.fetched[self.index:self.index + 1]
+            await self.posts.aclose()
+        if self.message:
+            self.remove_item(self.prev_button)
+            self.remove_item(self.next_button)
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+    @ui.button(label="Previous", style=discord.ButtonStyle.secondary, row=0)
+    async def prev_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, max(self.index - 1, 0))
+
+    @ui.button(label="Next", style=discord.ButtonStyle.secondary, row=0)
+    async def next_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, self.index + 1)
 
 
 class InstagramCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        init_db()
+        self._reports = set()  # Pending publish reports, kept so they are not garbage-collected
+
+    async def cog_load(self):
+        await users.init_db()
+        containers.start()
+        self.bot.add_dynamic_items(PostActionButton)
+
+    async def cog_unload(self):
+        containers.stop()
+        self.bot.remove_dynamic_items(PostActionButton)
+
+    def publish_when_ready(self, interaction, creation_id, ig_id, token, label):
+        """Hand the container to the tracker and report back when it is published or fails"""
+        future = containers.track(creation_id, ig_id, token)
+        future.add_done_callback(lambda f: self._report_soon(interaction, f, label))
+
+    def _report_soon(self, interaction, future, label):
+        task = asyncio.create_task(self.report_publish(interaction, future, label))
+        self._reports.add(task)
+        task.add_done_callback(self._reports.discard)
+
+    async def report_publish(self, interaction, future, label):
+        if future.cancelled() or future.exception():
+            message = f"{label} failed: {future.exception() if not future.cancelled() else 'cancelled'}"
+        else:
+            message = f"{label} published:\n```json\n{future.result()}\n```"
+        try:
+            await interaction.followup.send(message, ephemeral=True)
+        except discord.HTTPException:
+            # Interaction tokens expire after 15 minutes, fall back to a DM
+            await interaction.user.send(message)
+
+    async def prepared_image_url(self, interaction, image_url):
+        """URL for Instagram to fetch: the preprocessed JPEG re-hosted on Discord, or the original without Pillow"""
+        image = await media.prepare(image_url, "instagram")
+        if image["hash"] == image["source_hash"]:
+            return image_url
+        # Instagram only fetches images from a public URL, so the processed copy is sent as an attachment
+        message = await interaction.followup.send(
+            f"Prepared image ({image['width']}x{image['height']}, {image['bytes'] // 1024} KB)",
+            file=discord.File(io.BytesIO(image["data"]), filename=upload_filename(image)),
+            ephemeral=True,
+            wait=True
+        )
+        return message.attachments[0].url
 
     async def get_token_or_error(self, interaction):
-        user = get_user_data(interaction.user.id)
+        user = await users.get_user(interaction.user.id)
         if not user:
             await interaction.response.send_message("You are not registered. Use /insta_login_dev first.", ephemeral=True)
             return None, None
@@ -163,7 +286,7 @@ class InstagramCog(commands.Cog):
     @app_commands.describe(token="Your Instagram access token", username="Your Instagram username", instagram_id="Instagram numeric ID (optional)")
     async def insta_login_dev(self, interaction: discord.Interaction, token: str, username: str, instagram_id: str = None):
         await interaction.response.defer(ephemeral=True)
-        insert_user(str(interaction.user.id), username, token, instagram_id)
+        await users.insert_user(str(interaction.user.id), username, token, instagram_id)
         await interaction.followup.send("Token manually inserted into database.", ephemeral=True)
 
     @app_commands.command(name="instagram_post", description="Post an image with caption")
@@ -174,22 +297,25 @@ class InstagramCog(commands.Cog):
         if not token:
             return
 
+        try:
+            image_url = await self.prepared_image_url(interaction, image_url)
+        except MediaError as e:
+            await interaction.followup.send(f"Image rejected: {e}", ephemeral=True)
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            await interaction.followup.send(f"Could not download the image: {str(e) or 'timed out'}", ephemeral=True)
+            return
+
         params_create = {"image_url": image_url, "caption": caption, "access_token": token}
-        create_resp = call_api_post(params_create, f"{ig_id}/media")
+        create_resp = await instagram.post(f"{ig_id}/media", params_create)
         if "id" not in create_resp:
             await interaction.followup.send(f"Failed to create post: {create_resp}", ephemeral=True)
             return
         creation_id = create_resp["id"]
 
-        # Wait until media is ready
-        for _ in range(10):
-            status = call_api({"fields": "status_code", "access_token": token}, creation_id)
-            if status.get("status_code") == "FINISHED":
-                break
-            await asyncio.sleep(2)
-
-        publish_resp = call_api_post({"creation_id": creation_id, "access_token": token}, f"{ig_id}/media_publish")
-        await interaction.followup.send(f"Post published:\n```json\n{publish_resp}\n```", ephemeral=True)
+        # Publish in the background once the media is ready
+        self.publish_when_ready(interaction, creation_id, ig_id, token, "Post")
+        await interaction.followup.send("Media is processing. You'll get a message when the post is published.", ephemeral=True)
 
     @app_commands.command(name="instagram_post_reel", description="Post a reel with caption")
     @app_commands.describe(caption="Text caption for the reel", video_url="URL of the video to post")
@@ -200,56 +326,106 @@ class InstagramCog(commands.Cog):
             return
 
         params_create = {"media_type": "REELS", "video_url": video_url, "caption": caption, "access_token": token}
-        create_resp = call_api_post(params_create, f"{ig_id}/media")
+        create_resp = await instagram.post(f"{ig_id}/media", params_create)
         if "id" not in create_resp:
             await interaction.followup.send(f"Failed to create reel: {create_resp}", ephemeral=True)
             return
         creation_id = create_resp["id"]
 
-        for _ in range(10):
-            status = call_api({"fields": "status_code", "access_token": token}, creation_id)
-            if status.get("status_code") == "FINISHED":
-                break
-            await asyncio.sleep(2)
+        self.publish_when_ready(interaction, creation_id, ig_id, token, "Reel")
+        await interaction.followup.send("Reel is processing. You'll get a message when it is published.", ephemeral=True)
+
+    @app_commands.command(name="instagram_upload", description="Upload an image or video file as a post or reel")
+    @app_commands.describe(caption="Text caption for the post", file="Image or video to upload")
+    async def instagram_upload(self, interaction: discord.Interaction, caption: str, file: discord.Attachment):
+        await interaction.response.defer(ephemeral=True)
+        token, ig_id = await self.get_token_or_error(interaction)
+        if not token:
+            return
+
+        content_type = file.content_type or ""
+        try:
+            if content_type.startswith("video/"):
+                # Streamed from Discord to Instagram in chunks
+                creation_id = await upload_instagram_video(ig_id, token, file.url, file.size, caption)
+                label = "Reel"
+            elif content_type.startswith("image/"):
+                # Images can only be fetched by Instagram from a URL; the attachment URL is public
+                image_url = await self.prepared_image_url(interaction, file.url)
+                create_resp = await instagram.post(f"{ig_id}/media", {"image_url": image_url, "caption": caption, "access_token": token})
+                if "id" not in create_resp:
+                    await interaction.followup.send(f"Failed to create post: {create_resp}", ephemeral=True)
+                    return
+                creation_id = create_resp["id"]
+                label = "Post"
+            else:
+                await interaction.followup.send("Upload an image or video file.", ephemeral=True)
+                return
+        except MediaError as e:
+            await interaction.followup.send(f"Image rejected: {e}", ephemeral=True)
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            await interaction.followup.send(f"Could not download the file: {str(e) or 'timed out'}", ephemeral=True)
+            return
+        except Exception as e:
+            await interaction.followup.send(f"Upload failed: {e}", ephemeral=True)
+            return
 
-        publish_resp = call_api_post({"creation_id": creation_id, "access_token": token}, f"{ig_id}/media_publish")
-        await interaction.followup.send(f"Reel published:\n```json\n{publish_resp}\n```", ephemeral=True)
+        self.publish_when_ready(interaction, creation_id, ig_id, token, label)
+        await interaction.followup.send(f"{label} is processing. You'll get a message when it is published.", ephemeral=True)
 
-    @app_commands.command(name="instagram_posts", description="Get all your Instagram posts")
+    @app_commands.command(name="instagram_posts", description="Browse your Instagram posts")
     async def get_all_posts(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         token, _ = await self.get_token_or_error(interaction)
         if not token:
             return
 
-        params = {"fields": "id,caption,media_type,media_url,permalink,timestamp", "access_token": token}
-        result = call_api(params, "me/media")
-        if "data" not in result or not result["data"]:
+        posts = instagram.paginate(
+            "me/media",
+            {"access_token": token},
+            page_size=config.INSTAGRAM_LIST_PAGE_SIZE,
+            fields="id,caption,media_type,media_url,permalink,timestamp"
+        )
+
+        # One message for the whole listing, later pages are fetched as the user pages through
+        view = InstagramPostsView(posts)
+        try:
+            found = await view.fetch_until(0)
+        except GraphAPIError as e:
+            view.stop()
+            await interaction.followup.send(f"Could not load your posts: {e.message}", ephemeral=True)
+            return
+        if not found:
+            view.stop()
             await interaction.followup.send("No posts found.", ephemeral=True)
             return
+        try:
+            await view.fetch_until(1)  # Know whether there is a next post before rendering
+        except GraphAPIError:
+            view.exhausted = True
+        view.message = await interaction.followup.send(embed=view.render(), view=view, ephemeral=True, wait=True)
+
+    @app_commands.command(name="insta_analytics", description="Engagement totals, trends and top posts for your account")
+    @app_commands.describe(days="Number of days to report on (max 90, default 30)")
+    async def insta_analytics(self, interaction: discord.Interaction, days: int = 30):
+        await interaction.response.defer(ephemeral=True)
+        token, ig_id = await self.get_token_or_error(interaction)
+        if not token:
+            return
 
-        for post in result["data"]:
-            caption = post.get('caption', 'No caption')
-            media_type = post.get('media_type')
-            media_url = post.get('media_url', '')
-            url_short = shorten_url(media_url)
-            timestamp = post.get('timestamp', '')
-
-            embed = discord.Embed(title=f"Post {post['id']}", color=discord.Color.blue())
-            embed.add_field(name="Caption", value=caption, inline=False)
-            embed.add_field(name="Type", value=media_type, inline=True)
-            embed.add_field(name="URL", value=url_short, inline=False)
-            embed.add_field(name="Timestamp", value=timestamp, inline=True)
-            if media_url:
-                embed.set_image(url=media_url)
-
-            view = InstagramPostsView(post, token)
-            await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+        days = max(1, min(days, 90))
+        since = datetime.utcnow() - timedelta(days=days)
+        report = await async_db.aggregate_analytics('instagram', ig_id, since)
+        if not report['totals']:
+            await interaction.followup.send("No analytics collected for this period yet. Analytics are harvested in the background.", ephemeral=True)
+            return
+        await interaction.followup.send(embed=analytics_embed(ig_id, days, report), ephemeral=True)
 
     @app_commands.command(name="disconnect", description="Disconnect your Instagram account from the bot")
     async def disconnect(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
-        remove_user(str(interaction.user.id))
+        await users.remove_user(str(interaction.user.id))
         await interaction.followup.send("Your Instagram account has been disconnected.", ephemeral=True)
 
 
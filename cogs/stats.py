@@ -0,0 +1,39 @@
+"""
+Stats Cog - bot metrics for the owner
+Shows the in-process counters, gauges and timings that utils and cogs report
+"""
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+import io
+
+from utils.metrics import metrics
+import config
+
+
+class Stats(commands.Cog):
+    """Owner-only view of the bot's metrics"""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(name="bot-stats", description="Show the bot's metrics (bot owner only)")
+    async def bot_stats(self, interaction: discord.Interaction):
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("❌ Only the bot owner can see the metrics.", ephemeral=True)
+            return
+
+        report = "\n".join(metrics.report()) or "No metrics recorded yet"
+        if len(report) <= 4000:
+            embed = discord.Embed(title="Bot Metrics", description=f"```\n{report}\n```", color=config.COLOR_SUCCESS)
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        else:
+            # Too long for an embed, send the full report as a file
+            await interaction.response.send_message(
+                file=discord.File(io.BytesIO(report.encode()), filename="metrics.txt"), ephemeral=True
+            )
+
+
+async def setup(bot):
+    await bot.add_cog(Stats(bot))
@@ -25,20 +25,94 @@ OAUTH_PORT = 8080
 # Database Configuration
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
 DATABASE_NAME = os.getenv('DATABASE_NAME', 'social_media_bot')
+MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', 50))
+MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', 0))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', 60000))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', 5000))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv('MONGODB_SOCKET_TIMEOUT_MS', 20000))
+ACCOUNT_CACHE_SIZE = int(os.getenv('ACCOUNT_CACHE_SIZE', 1000))  # Decrypted accounts kept in memory
+ACCOUNT_CACHE_TTL = int(os.getenv('ACCOUNT_CACHE_TTL', 300))  # Seconds before a cached account is re-read
+ACCOUNT_CACHE_CHANGE_STREAMS = os.getenv('ACCOUNT_CACHE_CHANGE_STREAMS', 'false').lower() == 'true'  # Multi-instance invalidation
+INSIGHTS_FRESHNESS_SECONDS = int(os.getenv('INSIGHTS_FRESHNESS_SECONDS', 900))  # Stored insights younger than this are served without a Graph call
+INSIGHTS_CACHE_SIZE = int(os.getenv('INSIGHTS_CACHE_SIZE', 1000))  # Instagram insight responses kept in memory
+ANALYTICS_HARVEST_INTERVAL = int(os.getenv('ANALYTICS_HARVEST_INTERVAL', 3600))  # Seconds between background insight harvests (0 = off)
+ANALYTICS_HARVEST_POSTS = int(os.getenv('ANALYTICS_HARVEST_POSTS', 25))  # Most recent posts harvested per page/account
+ANALYTICS_HARVEST_CONCURRENCY = int(os.getenv('ANALYTICS_HARVEST_CONCURRENCY', 5))  # Pages/accounts harvested in parallel
+ANALYTICS_HARVEST_MAX_CALLS = int(os.getenv('ANALYTICS_HARVEST_MAX_CALLS', 150))  # Graph calls per harvest run; accounts over budget go first next run
+ANALYTICS_HARVEST_RESERVE = float(os.getenv('ANALYTICS_HARVEST_RESERVE', 0.5))  # Share of each rate limit bucket the harvester leaves to commands
+ROLLUP_BACKFILL_BATCH = int(os.getenv('ROLLUP_BACKFILL_BATCH', 1000))  # Series points folded into rollups per bulk write when rebuilding
+ANALYTICS_TTL_DAYS = int(os.getenv('ANALYTICS_TTL_DAYS', 0))  # Expire analytics snapshots and series points after N days (0 = keep forever)
 
 # Security Configuration
 ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY')
 
-# Rate Limiting
-RATE_LIMIT_WINDOW = 3600  # 1 hour in seconds
+# Rate Limiting (token buckets refilled over the window)
+RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', 60))  # Seconds; the *_MAX_CALLS limits are per window
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 0))  # Calls allowed back-to-back before refill pacing kicks in (0 = a full window's worth)
+FACEBOOK_PAGE_MAX_CALLS = int(os.getenv('FACEBOOK_PAGE_MAX_CALLS', FACEBOOK_MAX_CALLS))  # Per page, per window
+FACEBOOK_ENDPOINT_MAX_CALLS = {  # Per endpoint class, per window
+    'read': FACEBOOK_MAX_CALLS,
+    'insights': FACEBOOK_MAX_CALLS,
+    'publish': int(os.getenv('FACEBOOK_PUBLISH_MAX_CALLS', FACEBOOK_MAX_CALLS))
+}
+GRAPH_USAGE_THROTTLE_PERCENT = int(os.getenv('GRAPH_USAGE_THROTTLE_PERCENT', 75))  # Slow down above this usage
+GRAPH_BATCH_WINDOW_MS = int(os.getenv('GRAPH_BATCH_WINDOW_MS', 20))  # Reads issued within this window share one batch call
+GRAPH_USAGE_BACKOFF_SECONDS = int(os.getenv('GRAPH_USAGE_BACKOFF_SECONDS', 300))  # Pause when usage hits 100%
 
 # Scheduler Configuration
-SCHEDULER_CHECK_INTERVAL = 60  # Check every 60 seconds
+SCHEDULER_RECONCILE_INTERVAL = int(os.getenv('SCHEDULER_RECONCILE_INTERVAL', 300))  # Seconds between database reloads
+SCHEDULER_LOAD_LIMIT = int(os.getenv('SCHEDULER_LOAD_LIMIT', 5000))  # Max upcoming posts loaded per reload
+SCHEDULER_PUBLISH_CONCURRENCY = int(os.getenv('SCHEDULER_PUBLISH_CONCURRENCY', 10))  # Posts published in parallel
+SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', 300))  # How long a claimed post stays locked to one instance
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 6))  # Publish attempts before a post is dead-lettered
+OUTBOX_BACKOFF_INITIAL = float(os.getenv('OUTBOX_BACKOFF_INITIAL', 30))  # Seconds before the first retry, doubled per attempt
+OUTBOX_BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', 3600))  # Max seconds between retries
+OUTBOX_WAIT_SECONDS = float(os.getenv('OUTBOX_WAIT_SECONDS', 20))  # How long /fb-post waits for the result before reporting it queued
+BULK_SCHEDULE_CHUNK = int(os.getenv('BULK_SCHEDULE_CHUNK', 500))  # Posts per insert_many in /fb-schedule-bulk
+BULK_SCHEDULE_MAX_ROWS = int(os.getenv('BULK_SCHEDULE_MAX_ROWS', 10000))  # Rows accepted per bulk file
+
+# HTTP Client Configuration (shared connection pool)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 100))  # Max open connections
+HTTP_POOL_SIZE_PER_HOST = int(os.getenv('HTTP_POOL_SIZE_PER_HOST', 20))  # Max connections per host
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))  # Seconds
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 30))  # Seconds an idle connection stays open
+HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', 60))  # Seconds per request
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 10))  # Seconds to get a connection
+
+# Discord UI Views
+VIEW_TIMEOUT = int(os.getenv('VIEW_TIMEOUT', 600))  # Seconds before an idle view is dropped
+VIEW_REGISTRY_MAX_LIVE = int(os.getenv('VIEW_REGISTRY_MAX_LIVE', 500))  # Live views kept in memory before the least recently used is stopped
+
+# Startup
+COMMAND_SYNC_STATE_PATH = os.getenv('COMMAND_SYNC_STATE_PATH', 'command_sync.json')  # Hash of the last synced slash command tree
+COMMAND_SYNC_FORCE = os.getenv('COMMAND_SYNC_FORCE', 'false').lower() == 'true'  # Sync on every start, even if unchanged
+
+# Metrics
+METRICS_LOG_INTERVAL = int(os.getenv('METRICS_LOG_INTERVAL', 900))  # Seconds between metrics reports in the log (0 = off)
+
+# Media Uploads (streamed from Discord attachments)
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024))  # Bytes per downloaded/uploaded chunk
+UPLOAD_READ_AHEAD = int(os.getenv('UPLOAD_READ_AHEAD', 2))  # Chunks downloaded ahead of the upload
+UPLOAD_CHUNK_RETRIES = int(os.getenv('UPLOAD_CHUNK_RETRIES', 5))  # Attempts per chunk before the upload fails
+
+# Image Preprocessing and Media Store (resizing needs Pillow, otherwise images are posted as-is)
+MEDIA_WORKERS = int(os.getenv('MEDIA_WORKERS', 2))  # Worker processes for image work (0 = one per CPU)
+MEDIA_CACHE_SIZE = int(os.getenv('MEDIA_CACHE_SIZE', 1000))  # Processed images remembered by content hash (bytes are in the media store)
+MEDIA_CACHE_TTL = int(os.getenv('MEDIA_CACHE_TTL', 3600))  # Seconds a processed image is kept
+MEDIA_MAX_DOWNLOAD_BYTES = int(os.getenv('MEDIA_MAX_DOWNLOAD_BYTES', 30 * 1024 * 1024))  # Larger source images are refused
+MEDIA_MAX_PIXELS = int(os.getenv('MEDIA_MAX_PIXELS', 50_000_000))  # Larger source images are refused
+MEDIA_JPEG_QUALITY = int(os.getenv('MEDIA_JPEG_QUALITY', 85))
+MEDIA_FACEBOOK_MAX_SIDE = int(os.getenv('MEDIA_FACEBOOK_MAX_SIDE', 2048))  # Longest side after resizing, in pixels
+MEDIA_INSTAGRAM_MAX_SIDE = int(os.getenv('MEDIA_INSTAGRAM_MAX_SIDE', 1440))
+MEDIA_STORE_PATH = os.getenv('MEDIA_STORE_PATH', 'media_store')  # Directory of content-addressed media files
+MEDIA_STORE_MAX_BYTES = int(os.getenv('MEDIA_STORE_MAX_BYTES', 1024 * 1024 * 1024))  # Least recently used files are deleted above this
 
 # Facebook API URLs
 FACEBOOK_OAUTH_URL = 'https://www.facebook.com/v21.0/dialog/oauth'
 FACEBOOK_TOKEN_URL = f'https://graph.facebook.com/{FACEBOOK_API_VERSION}/oauth/access_token'
 FACEBOOK_GRAPH_URL = f'https://graph.facebook.com/{FACEBOOK_API_VERSION}'
+FACEBOOK_VIDEO_URL = f'https://graph-video.facebook.com/{FACEBOOK_API_VERSION}'
 
 # Discord Embed Colors
 COLOR_FACEBOOK = 0x1877F2  # Facebook blue
@@ -71,6 +145,18 @@ validate_config()
 # Instagram Configuration
 # ================================
 INSTAGRAM_GRAPH_URL = "https://graph.instagram.com"
-INSTAGRAM_MAX_CALLS = 100        # Max API calls allowed in rate window
-RATE_LIMIT_WINDOW = 60           # Time window in seconds (same used for rate limiter)
+INSTAGRAM_DB_PATH = os.getenv('INSTAGRAM_DB_PATH', 'database.db')  # SQLite file for Instagram users
+INSTAGRAM_MAX_CALLS = int(os.getenv('INSTAGRAM_MAX_CALLS', 100))  # Max API calls for the app per RATE_LIMIT_WINDOW
+INSTAGRAM_ACCOUNT_MAX_CALLS = int(os.getenv('INSTAGRAM_ACCOUNT_MAX_CALLS', INSTAGRAM_MAX_CALLS))  # Per Instagram account, per window
+INSTAGRAM_CONTAINER_TIMEOUT = int(os.getenv('INSTAGRAM_CONTAINER_TIMEOUT', 600))  # Seconds before a processing upload is failed
+INSTAGRAM_CONTAINER_POLL_INITIAL = float(os.getenv('INSTAGRAM_CONTAINER_POLL_INITIAL', 2))  # First status check delay
+INSTAGRAM_CONTAINER_POLL_MAX = float(os.getenv('INSTAGRAM_CONTAINER_POLL_MAX', 30))  # Max backoff between status checks
+INSTAGRAM_LIST_PAGE_SIZE = int(os.getenv('INSTAGRAM_LIST_PAGE_SIZE', 25))  # Media items fetched per Graph page
+INSTAGRAM_VIEW_TIMEOUT = int(os.getenv('INSTAGRAM_VIEW_TIMEOUT', 600))  # Seconds an idle post browser keeps its state
+INSTAGRAM_BATCH_REQUESTS = os.getenv('INSTAGRAM_BATCH_REQUESTS', 'false').lower() == 'true'  # Coalesce insight reads via the Graph batch endpoint
+INSTAGRAM_ENDPOINT_MAX_CALLS = {  # Per endpoint class, per window
+    'read': INSTAGRAM_MAX_CALLS,
+    'insights': INSTAGRAM_MAX_CALLS,
+    'publish': int(os.getenv('INSTAGRAM_PUBLISH_MAX_CALLS', 50))
+}
 COLOR_INSTAGRAM = 0xE1306C       # Instagram pink accent color
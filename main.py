@@ -4,11 +4,19 @@ Loads all cogs (Facebook, Instagram, LinkedIn, TikTok, Accounts)
 and starts the bot.
 """
 
+import time
+
+STARTED_AT = time.perf_counter()  # Cold start, before the heavy imports
+
 import discord
 from discord.ext import commands
 import asyncio
 import traceback
 import config
+from utils.http import http
+from utils.media import media
+from utils.metrics import metrics
+from utils.commandsync import sync_commands
 
 # -------------------------------------------------------------
 # Bot setup
@@ -17,40 +25,78 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+
+class SocialBot(commands.Bot):
+    """Bot that also owns the shared HTTP connection pool and the media worker processes"""
+
+    ready_once = False
+    metrics_task = None
+
+    async def setup_hook(self):
+        """Runs once before connecting: load cogs and sync slash commands if they changed"""
+        print('\nLoading extensions...')
+        started = time.perf_counter()
+        for cog in COGS:
+            try:
+                await self.load_extension(cog)
+                print(f'Loaded cog: {cog}')
+            except Exception as e:
+                print(f' Failed to load cog {cog}: {e}')
+                traceback.print_exc()
+        metrics.observe('startup.cogs_seconds', time.perf_counter() - started)
+
+        # Sync slash commands (global syncs are slow and rate limited, so only when the tree changed)
+        started = time.perf_counter()
+        try:
+            synced = await sync_commands(self, force=config.COMMAND_SYNC_FORCE)
+            if synced is None:
+                print('\n Slash commands unchanged, sync skipped\n')
+            else:
+                print(f'\n Synced {len(synced)} slash commands\n')
+            print("📜 Available Commands:")
+            for cmd in self.tree.get_commands():
+                print(f'  /{cmd.name} - {cmd.description}')
+        except Exception as e:
+            print(f' Failed to sync commands: {e}')
+        metrics.observe('startup.sync_seconds', time.perf_counter() - started)
+
+        if config.METRICS_LOG_INTERVAL:
+            self.metrics_task = asyncio.create_task(metrics.log_every(config.METRICS_LOG_INTERVAL))
+
+    async def close(self):
+        if self.metrics_task:
+            self.metrics_task.cancel()
+        await http.close()
+        media.close()
+        await super().close()
+
+
+bot = SocialBot(command_prefix='!', intents=intents)
 
 # List of all cogs to load
 COGS = [
     "cogs.instagram",
-    "cogs.facebook"
+    "cogs.facebook",
+    "cogs.crosspost",
+    "cogs.stats"
 ]
 
 
 @bot.event
 async def on_ready():
-    """Called when the bot is ready."""
+    """Called when the bot is ready (again after every reconnect)."""
+    if bot.ready_once:
+        print(f'Reconnected as: {bot.user.name}')
+        return
+    bot.ready_once = True
+
+    ready_seconds = time.perf_counter() - STARTED_AT
+    metrics.observe('startup.ready_seconds', ready_seconds)
+
     print('\n' + '=' * 70)
     print(f'Bot logged in as: {bot.user.name} (ID: {bot.user.id})')
     print('=' * 70)
-    print('\nLoading extensions...')
-
-    for cog in COGS:
-        try:
-            await bot.load_extension(cog)
-            print(f'Loaded cog: {cog}')
-        except Exception as e:
-            print(f' Failed to load cog {cog}: {e}')
-            traceback.print_exc()
-
-    # Sync slash commands
-    try:
-        synced = await bot.tree.sync()
-        print(f'\n Synced {len(synced)} slash commands\n')
-        print("📜 Available Commands:")
-        for cmd in synced:
-            print(f'  /{cmd.name} - {cmd.description}')
-    except Exception as e:
-        print(f' Failed to sync commands: {e}')
+    print(f'\nCold start to ready: {ready_seconds:.2f}s')
 
     print('\n' + '=' * 70)
     print('Bot is ready! Use commands in Discord.')
@@ -112,7 +158,7 @@ except Exception as e:
 if __name__ == "__main__":
     try:
         print("\nStarting Social Media Discord Bot...\n")
-        bot.run(config.DISCORD_TOKEN)
+        bot.run(config.DISCORD_TOKEN, root_logger=True)  # INFO logs from utils (metrics reports) too
     except KeyboardInterrupt:
         print("\nBot stopped by user")
     except Exception as e:
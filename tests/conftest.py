@@ -0,0 +1,43 @@
+"""
+Shared test setup
+config.py validates these settings on import; tests that need a package that is not installed are skipped
+"""
+
+import base64
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DISCORD_TOKEN', 'test-token')
+os.environ.setdefault('FACEBOOK_APP_ID', 'test-app')
+os.environ.setdefault('FACEBOOK_APP_SECRET', 'test-secret')
+os.environ.setdefault('ENCRYPTION_KEY', base64.urlsafe_b64encode(b'0' * 32).decode())
+os.environ.setdefault('ANALYTICS_HARVEST_INTERVAL', '0')
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """Synchronous Database on a throwaway MongoDB database; skipped when no server is reachable"""
+    for package in ('dotenv', 'cryptography', 'motor'):
+        pytest.importorskip(package)
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+    import config
+    from utils.database import Database
+
+    probe = MongoClient(config.MONGODB_URI, serverSelectionTimeoutMS=500)
+    try:
+        probe.admin.command('ping')
+    except PyMongoError:
+        pytest.skip('MongoDB is not reachable')
+    finally:
+        probe.close()
+
+    monkeypatch.setattr(config, 'DATABASE_NAME', f'{config.DATABASE_NAME}_test')
+    database = Database()
+    database.client.drop_database(config.DATABASE_NAME)
+    yield database
+    database.client.drop_database(config.DATABASE_NAME)
+    database.client.close()
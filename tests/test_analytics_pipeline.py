@@ -0,0 +1,37 @@
+"""
+The analytics report against MongoDB (skipped when none is reachable)
+"""
+
+from datetime import datetime, timedelta
+import pytest
+
+for package in ('dotenv', 'cryptography', 'motor'):
+    pytest.importorskip(package)
+
+
+def point(post_id, ts, engaged):
+    return {
+        'ts': ts,
+        'meta': {'platform': 'facebook', 'post_id': post_id, 'account_id': 'page', 'media_type': 'photo'},
+        'post_engaged_users': engaged,
+        'post_impressions': engaged * 10
+    }
+
+
+@pytest.mark.parametrize('window_functions', [True, False])
+def test_daily_totals_sum_day_over_day_gains(database, window_functions):
+    from utils.database import MONGODB_5_0, analytics_pipeline
+    if window_functions and database.server_version() < MONGODB_5_0:
+        pytest.skip('$setWindowFields needs MongoDB 5.0')
+
+    today = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    days = [today - timedelta(days=n) for n in (3, 2, 1, 0)]
+    # Lifetime counters: 'old' gains 10 a day, 'new' is published two days ago
+    points = [point('old', ts, 100 + 10 * n) for n, ts in enumerate(days)]
+    points += [point('new', days[2], 5), point('new', days[3], 8)]
+    database._apply_rollups(points)
+
+    pipeline = analytics_pipeline('facebook', 'page', days[1], window_functions=window_functions)
+    report = next(database.db['analytics_daily'].aggregate(pipeline))
+    assert [day['engagement'] for day in report['daily']] == [10, 10 + 5, 10 + 3]
+    assert report['totals'][0]['engagement'] == 130 + 8
@@ -0,0 +1,134 @@
+"""
+Bulk schedule file parsing
+"""
+
+import asyncio
+import importlib
+import pytest
+
+for package in ('dotenv', 'aiohttp'):
+    pytest.importorskip(package)
+
+from utils.bulk import parse_rows, iter_rows
+
+bulk = importlib.import_module('utils.bulk')
+
+
+def rows(text, is_csv):
+    async def lines():
+        for line in text.splitlines(keepends=True):
+            yield line
+
+    async def collect():
+        return [item async for item in parse_rows(lines(), is_csv)]
+
+    return asyncio.run(collect())
+
+
+def test_json_lines_quote_does_not_swallow_following_rows():
+    text = (
+        '{"message": "New 5\\" screen", "scheduled_at": "2030-01-01 10:00"}\n'
+        '{"message": "second", "scheduled_at": "2030-01-01 11:00"}\n'
+        '{"message": "third", "scheduled_at": "2030-01-01 12:00"}\n'
+    )
+    parsed = rows(text, is_csv=False)
+    assert [number for number, _ in parsed] == [1, 2, 3]
+    assert parsed[0][1]['message'] == 'New 5" screen'
+    assert parsed[2][1]['message'] == 'third'
+
+
+def test_bad_json_line_is_one_error():
+    parsed = rows('{"message": "ok"}\n{broken\n{"message": "also ok"}\n', is_csv=False)
+    assert isinstance(parsed[1][1], ValueError)
+    assert parsed[2][1] == {'message': 'also ok'}
+
+
+def test_csv_quoted_field_spans_lines():
+    text = 'message,scheduled_at\n"line one\nline ""two""",2030-01-01 10:00\nplain,2030-01-01 11:00\n'
+    parsed = rows(text, is_csv=True)
+    assert parsed == [
+        (1, {'message': 'line one\nline "two"', 'scheduled_at': '2030-01-01 10:00'}),
+        (2, {'message': 'plain', 'scheduled_at': '2030-01-01 11:00'})
+    ]
+
+
+def test_csv_unterminated_quote_is_reported():
+    parsed = rows('message,scheduled_at\n"never closed,2030-01-01 10:00\n', is_csv=True)
+    assert len(parsed) == 1
+    assert isinstance(parsed[0][1], ValueError)
+
+
+def test_row_count_stops_at_the_cap(monkeypatch):
+    import importlib
+    from datetime import datetime, timedelta
+    import config
+
+    bulk = importlib.import_module('utils.bulk')
+    when = (datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M')
+
+    async def iter_rows(url, filename):
+        for number in range(1, 5):
+            yield number, {'message': f'post {number}', 'scheduled_at': when}
+
+    class FakeDb:
+        async def save_facebook_posts(self, posts):
+            return {}
+
+    class FakeScheduler:
+        def horizon(self):
+            return datetime.utcnow()
+
+        def notify_many(self, posts):
+            pass
+
+    monkeypatch.setattr(bulk, 'iter_rows', iter_rows)
+    monkeypatch.setattr(config, 'BULK_SCHEDULE_MAX_ROWS', 2)
+    result = asyncio.run(bulk.schedule_bulk(FakeDb(), FakeScheduler(), 'url', 'posts.csv', 'server', 'page'))
+    assert result.rows == 2
+    assert result.scheduled == 2
+    assert len(result.errors) == 1
+
+
+def download(monkeypatch, data, chunk_size):
+    """Serve `data` as the attachment, in chunks of `chunk_size` bytes"""
+    class Content:
+        async def iter_chunked(self, size):
+            for start in range(0, len(data), chunk_size):
+                yield data[start:start + chunk_size]
+
+    class Response:
+        content = Content()
+
+        def raise_for_status(self):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            pass
+
+    class Session:
+        closed = False
+
+        def get(self, url):
+            return Response()
+
+    monkeypatch.setattr(bulk.http, '_session', Session())
+
+
+def test_long_rows_are_read_whole(monkeypatch):
+    caption = 'é' * 100_000  # Well over aiohttp's readline buffer, multi-byte characters across chunk edges
+    data = '\ufeff'.encode() + (
+        f'{{"message": "{caption}", "scheduled_at": "2030-01-01 10:00"}}\n'
+        '{"message": "short", "scheduled_at": "2030-01-01 11:00"}'
+    ).encode()
+    download(monkeypatch, data, 4097)
+
+    async def collect():
+        return [row async for row in iter_rows('https://example.com/posts.jsonl', 'posts.jsonl')]
+
+    parsed = asyncio.run(collect())
+    assert [number for number, _ in parsed] == [1, 2]
+    assert parsed[0][1]['message'] == caption
+    assert parsed[1][1]['message'] == 'short'
@@ -0,0 +1,46 @@
+"""
+/post-all keeps its results on the original response
+"""
+
+import asyncio
+import pytest
+
+for package in ('dotenv', 'cryptography', 'motor', 'aiohttp', 'discord'):
+    pytest.importorskip(package)
+
+from cogs.crosspost import CrossPost
+
+
+class FakeInteraction:
+    """Records the order of response edits and followups"""
+
+    def __init__(self):
+        self.calls = []
+        self.response = self
+        self.followup = self
+
+    async def defer(self, **kwargs):
+        self.calls.append(('defer', kwargs))
+
+    async def edit_original_response(self, **kwargs):
+        self.calls.append(('edit', kwargs))
+
+    async def send(self, *args, **kwargs):
+        self.calls.append(('followup', kwargs))
+
+
+def test_rehosted_image_does_not_replace_the_deferred_response():
+    cog = CrossPost(None)
+
+    async def rehosting_publisher(interaction, caption, image_url):
+        await interaction.followup.send("Prepared image", ephemeral=True)
+        return "Published `1`"
+
+    cog.publishers = {'Instagram': rehosting_publisher}
+    interaction = FakeInteraction()
+    asyncio.run(CrossPost.post_all.callback(cog, interaction, "caption", "https://example.com/a.jpg"))
+
+    kinds = [kind for kind, _ in interaction.calls]
+    assert kinds == ['defer', 'edit', 'followup', 'edit']
+    assert interaction.calls[2][1]['ephemeral']
+    assert interaction.calls[-1][1]['embed'].title == "Cross-post Results"
@@ -0,0 +1,55 @@
+"""
+Replaying a dead letter only requeues a post that is still failed
+"""
+
+import asyncio
+import pytest
+
+for package in ('dotenv', 'cryptography', 'motor'):
+    pytest.importorskip(package)
+
+from utils.database import AsyncDatabase
+
+
+class FakeCollection:
+    """Just enough of a Motor collection, matching filters by equality"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def _find(self, query):
+        return next((doc for doc in self.docs if all(doc.get(key) == value for key, value in query.items())), None)
+
+    async def find_one(self, query):
+        return self._find(query)
+
+    async def delete_one(self, query):
+        self.docs.remove(self._find(query))
+
+    async def find_one_and_update(self, query, update, return_document=None):
+        doc = self._find(query)
+        if doc:
+            doc.update(update['$set'])
+        return doc
+
+
+def replay(status):
+    database = AsyncDatabase()
+    database.facebook_dead_letters = FakeCollection([{'_id': 'letter', 'server_id': 'guild', 'post_id': 'post'}])
+    database.facebook_posts = FakeCollection([{'_id': 'post', 'status': status}])
+    letter, post = asyncio.run(database.replay_dead_letter('letter', 'guild'))
+    return letter, post, database
+
+
+def test_failed_post_is_requeued_and_the_letter_removed():
+    letter, post, database = replay('failed')
+    assert post['status'] == 'scheduled'
+    assert database.facebook_dead_letters.docs == []
+
+
+@pytest.mark.parametrize('status', ['publishing', 'published'])
+def test_post_that_is_not_failed_is_left_alone(status):
+    letter, post, database = replay(status)
+    assert letter and post is None
+    assert database.facebook_posts.docs[0]['status'] == status
+    assert len(database.facebook_dead_letters.docs) == 1
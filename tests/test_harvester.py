@@ -0,0 +1,72 @@
+"""
+The analytics harvester stays within its own call budget and behind command traffic
+"""
+
+import asyncio
+import importlib
+import pytest
+
+for package in ('dotenv', 'cryptography', 'motor', 'aiohttp', 'apscheduler'):
+    pytest.importorskip(package)
+
+import config
+from utils.harvester import AnalyticsHarvester
+from utils.ratelimit import TokenBucket
+
+harvester_module = importlib.import_module('utils.harvester')
+
+
+class FakeDB:
+    def __init__(self, pages):
+        self.pages = pages
+
+    async def iter_facebook_accounts(self):
+        for page_id in self.pages:
+            yield {'page_id': page_id, 'access_token': 'token', 'server_id': 'guild'}
+
+
+@pytest.fixture
+def harvester(monkeypatch):
+    harvester = AnalyticsHarvester()
+    harvester.db = FakeDB([f'page{i}' for i in range(5)])
+    harvester.harvested = []
+
+    async def harvest_facebook_page(account):
+        harvester.harvested.append(account['page_id'])
+        return 1
+
+    async def all_users():
+        return []
+
+    monkeypatch.setattr(harvester, 'harvest_facebook_page', harvest_facebook_page)
+    monkeypatch.setattr(harvester_module.users, 'all_users', all_users)
+    monkeypatch.setattr(config, 'ANALYTICS_HARVEST_POSTS', 25)  # 2 calls per page
+    monkeypatch.setattr(config, 'ANALYTICS_HARVEST_MAX_CALLS', 6)
+    monkeypatch.setattr(config, 'ANALYTICS_HARVEST_RESERVE', 0.0)
+    return harvester
+
+
+def test_run_stops_at_budget_and_next_run_resumes(harvester):
+    asyncio.run(harvester.harvest())
+    assert harvester.harvested == ['page0', 'page1', 'page2']
+
+    harvester.harvested = []
+    asyncio.run(harvester.harvest())
+    assert harvester.harvested == ['page3', 'page4', 'page0']
+
+
+def test_can_spare_keeps_the_reserve():
+    bucket = TokenBucket(100, 60)
+    bucket.tokens = 90
+    assert bucket.can_spare(40, reserve=0.5)
+    assert not bucket.can_spare(45, reserve=0.5)
+
+
+def test_can_spare_never_jumps_the_queue():
+    bucket = TokenBucket(100, 60)
+
+    async def run():
+        async with bucket._lock:
+            return bucket.can_spare(1, reserve=0.0)
+
+    assert not asyncio.run(run())
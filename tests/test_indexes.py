@@ -0,0 +1,41 @@
+"""
+Index and collection setup; tests that need a MongoDB server are skipped when none is reachable
+"""
+
+import pytest
+
+for package in ('dotenv', 'cryptography', 'motor'):
+    pytest.importorskip(package)
+
+import config
+
+
+def test_hot_queries_use_indexes(database):
+    database.ensure_indexes()
+    assert database.find_collection_scans() == []
+
+
+def test_changed_ttl_updates_the_existing_index(database, monkeypatch):
+    monkeypatch.setattr(config, 'ANALYTICS_TTL_DAYS', 30)
+    database.ensure_indexes()
+    monkeypatch.setattr(config, 'ANALYTICS_TTL_DAYS', 7)
+    database.ensure_indexes()
+    assert database.facebook_analytics.index_information()['fetched_at_ttl']['expireAfterSeconds'] == 7 * 86400
+
+    monkeypatch.setattr(config, 'ANALYTICS_TTL_DAYS', 0)
+    database.ensure_indexes()
+    assert 'fetched_at_ttl' not in database.facebook_analytics.index_information()
+
+
+def test_series_layout_follows_the_server_version(monkeypatch):
+    from utils.database import index_specs, series_is_timeseries
+
+    assert series_is_timeseries(None, (5, 0))
+    assert not series_is_timeseries(None, (4, 4))
+    # An existing collection keeps its layout after a server upgrade
+    assert not series_is_timeseries({'name': 'analytics_series', 'options': {}}, (6, 0))
+
+    monkeypatch.setattr(config, 'ANALYTICS_TTL_DAYS', 7)
+    names = lambda specs: {options['name'] for _, _, options in specs}
+    assert 'ts_ttl' in names(index_specs(timeseries=False))
+    assert 'ts_ttl' not in names(index_specs(timeseries=True))
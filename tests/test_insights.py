@@ -0,0 +1,104 @@
+"""
+Insights must never leak between Discord servers or users
+"""
+
+import asyncio
+import importlib
+import pytest
+
+for package in ('dotenv', 'cryptography', 'motor', 'aiohttp'):
+    pytest.importorskip(package)
+
+from utils.database import analytics_query, analytics_upsert
+from utils.insights import InsightsCache
+
+# The package re-exports the global `insights` object under the module's name
+insights_module = importlib.import_module('utils.insights')
+
+
+class FakeAnalytics:
+    """facebook_analytics stand-in that applies the same filters as the real queries"""
+
+    def __init__(self):
+        self.docs = []
+
+    async def get_analytics(self, post_id, server_id=None, max_age=None):
+        query = analytics_query(post_id, server_id, max_age)
+        for doc in self.docs:
+            if all(doc.get(key) == value for key, value in query.items() if key != 'fetched_at'):
+                return doc
+        return None
+
+    async def save_facebook_analytics(self, data):
+        query, update = analytics_upsert(data)
+        self.docs = [doc for doc in self.docs if any(doc.get(key) != value for key, value in query.items())]
+        self.docs.append(update['$set'])
+
+
+class FakeBatcher:
+    def __init__(self):
+        self.tokens = []
+
+    async def get(self, path, params, page_id=None, endpoint=None):
+        self.tokens.append(params['access_token'])
+        return {'data': [{'name': 'post_impressions', 'values': [{'value': params['access_token']}]}]}
+
+
+def test_snapshot_queries_are_scoped_to_the_server():
+    assert analytics_query('post', 'A') == {'post_id': 'post', 'server_id': 'A'}
+    assert analytics_upsert({'post_id': 'post', 'server_id': 'A'})[0] == {'post_id': 'post', 'server_id': 'A'}
+
+
+def test_guild_b_misses_guild_a_snapshot(monkeypatch):
+    db, batcher = FakeAnalytics(), FakeBatcher()
+    monkeypatch.setattr(insights_module, 'async_db', db)
+    monkeypatch.setattr(insights_module.graph, 'batcher', batcher)
+    cache = InsightsCache(freshness=900)
+
+    async def run():
+        first = await cache.facebook('post', 'A', 'page-a', 'token-a')
+        again = await cache.facebook('post', 'A', 'page-a', 'token-a')
+        other = await cache.facebook('post', 'B', 'page-b', 'token-b')
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert first == again == {'post_impressions': 'token-a'}
+    assert other == {'post_impressions': 'token-b'}
+    assert batcher.tokens == ['token-a', 'token-b']
+
+
+def test_concurrent_requests_from_two_guilds_do_not_share_a_call(monkeypatch):
+    db, batcher = FakeAnalytics(), FakeBatcher()
+    monkeypatch.setattr(insights_module, 'async_db', db)
+    monkeypatch.setattr(insights_module.graph, 'batcher', batcher)
+    cache = InsightsCache(freshness=900)
+
+    async def run():
+        return await asyncio.gather(
+            cache.facebook('post', 'A', 'page-a', 'token-a'),
+            cache.facebook('post', 'B', 'page-b', 'token-b')
+        )
+
+    a, b = asyncio.run(run())
+    assert a['post_impressions'] == 'token-a'
+    assert b['post_impressions'] == 'token-b'
+
+
+def test_instagram_cache_is_per_user(monkeypatch):
+    calls = []
+
+    async def batch_get(path, params, endpoint_class=None):
+        calls.append(params['access_token'])
+        return {'data': [{'name': 'reach', 'values': [{'value': params['access_token']}]}]}
+
+    monkeypatch.setattr(insights_module.instagram, 'batch_get', batch_get)
+    cache = InsightsCache(freshness=900)
+
+    async def run():
+        await cache.instagram('media', 'IMAGE', 'token-1', 1)
+        await cache.instagram('media', 'IMAGE', 'token-1', 1)
+        return await cache.instagram('media', 'IMAGE', 'token-2', 2)
+
+    other = asyncio.run(run())
+    assert calls == ['token-1', 'token-2']
+    assert other['data'][0]['values'][0]['value'] == 'token-2'
@@ -0,0 +1,105 @@
+"""
+Instagram cog: the post browser reads its Graph cursor one caller at a time, and failures are reported to the user
+"""
+
+import asyncio
+import importlib
+import pytest
+
+for package in ('dotenv', 'cryptography', 'motor', 'aiohttp', 'discord'):
+    pytest.importorskip(package)
+
+from cogs.instagram import InstagramCog, InstagramPostsView
+from utils.graph import GraphAPIError
+
+instagram_cog_module = importlib.import_module('cogs.instagram')
+
+
+async def slow_posts(count):
+    for number in range(count):
+        await asyncio.sleep(0)
+        yield {'id': str(number)}
+
+
+def test_quick_next_clicks_share_the_cursor():
+    async def run():
+        view = InstagramPostsView(slow_posts(5))
+        loaded = await asyncio.gather(view.fetch_until(1), view.fetch_until(2))
+        view.stop()
+        return loaded, [post['id'] for post in view.fetched]
+
+    assert asyncio.run(run()) == ([True, True], ['0', '1', '2'])
+
+
+class FakeInteraction:
+    def __init__(self):
+        self.sent = []
+        self.edits = []
+        self.response = self
+        self.followup = self
+
+    async def defer(self, **kwargs):
+        pass
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+    async def edit_original_response(self, **kwargs):
+        self.edits.append(kwargs)
+
+
+async def failing_posts():
+    raise GraphAPIError(400, {'error': {'message': 'Invalid OAuth access token', 'code': 190}})
+    yield
+
+
+def test_expired_token_is_reported_when_listing(monkeypatch):
+    cog = InstagramCog(None)
+
+    async def get_token_or_error(interaction):
+        return 'token', 'ig'
+
+    monkeypatch.setattr(cog, 'get_token_or_error', get_token_or_error)
+    monkeypatch.setattr(instagram_cog_module.instagram, 'paginate', lambda *args, **kwargs: failing_posts())
+    interaction = FakeInteraction()
+    asyncio.run(InstagramCog.get_all_posts.callback(cog, interaction))
+    assert interaction.sent == ["Could not load your posts: Invalid OAuth access token"]
+
+
+def test_error_while_paging_keeps_the_loaded_posts():
+    async def posts_then_error():
+        yield {'id': '0'}
+        raise GraphAPIError(400, {'error': {'message': 'Invalid OAuth access token', 'code': 190}})
+
+    async def run():
+        view = InstagramPostsView(posts_then_error())
+        await view.fetch_until(0)
+        interaction = FakeInteraction()
+        await view.show(interaction, 1)
+        view.stop()
+        return view, interaction
+
+    view, interaction = asyncio.run(run())
+    assert view.index == 0 and view.exhausted
+    assert interaction.sent == ["Could not load more posts: Invalid OAuth access token"]
+    assert interaction.edits[0]['view'] is view
+
+
+@pytest.mark.parametrize('error', [
+    instagram_cog_module.aiohttp.ClientConnectionError('Connection reset'),
+    asyncio.TimeoutError()
+])
+def test_download_failure_is_reported_when_posting(monkeypatch, error):
+    cog = InstagramCog(None)
+
+    async def get_token_or_error(interaction):
+        return 'token', 'ig'
+
+    async def prepared_image_url(interaction, image_url):
+        raise error
+
+    monkeypatch.setattr(cog, 'get_token_or_error', get_token_or_error)
+    monkeypatch.setattr(cog, 'prepared_image_url', prepared_image_url)
+    interaction = FakeInteraction()
+    asyncio.run(InstagramCog.instagram_post.callback(cog, interaction, "caption", "https://example.com/a.jpg"))
+    assert interaction.sent == [f"Could not download the image: {str(error) or 'timed out'}"]
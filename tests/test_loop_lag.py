@@ -0,0 +1,113 @@
+"""
+Event-loop lag under concurrent Instagram command load
+
+A ticker measures how late the loop wakes it while many user lookups and Graph calls run at once.
+The blocking baseline runs the same lookups on the loop, the way the cog used sqlite3 before.
+Run with -s to see the numbers.
+"""
+
+import asyncio
+import time
+import pytest
+
+for package in ('dotenv', 'aiohttp'):
+    pytest.importorskip(package)
+
+from aiohttp import web
+from utils.http import http
+from utils.instagram import InstagramClient, UserStore
+
+CONCURRENT_COMMANDS = 20
+SLOW_CALL_SECONDS = 0.02
+
+
+async def max_loop_lag(work, interval=0.005):
+    """Run `work()` and return the longest delay past `interval` seen by a ticker task"""
+    lags = []
+
+    async def ticker():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - started - interval)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    try:
+        await work()
+        await asyncio.sleep(interval * 2)  # Let the ticker record a wake-up delayed by the work
+    finally:
+        task.cancel()
+    return max(lags, default=0.0)
+
+
+@pytest.fixture
+def slow_store(tmp_path, monkeypatch):
+    """User store whose queries take SLOW_CALL_SECONDS, like a busy disk"""
+    store = UserStore(str(tmp_path / 'users.db'))
+    store._init_db()
+    store._insert_user('1', 'user', 'token', 'ig')
+    get_user = store._get_user
+
+    def slow_get_user(discord_id):
+        time.sleep(SLOW_CALL_SECONDS)
+        return get_user(discord_id)
+
+    monkeypatch.setattr(store, '_get_user', slow_get_user)
+    return store
+
+
+def test_user_lookups_do_not_block_the_loop(slow_store):
+    async def blocking():
+        async def command():
+            return slow_store._get_user('1')  # What the cog did before: sqlite3 on the loop
+        await asyncio.gather(*(command() for _ in range(CONCURRENT_COMMANDS)))
+
+    async def non_blocking():
+        await asyncio.gather(*(slow_store.get_user('1') for _ in range(CONCURRENT_COMMANDS)))
+
+    before = asyncio.run(max_loop_lag(blocking))
+    after = asyncio.run(max_loop_lag(non_blocking))
+    print(f'\nuser lookups: max loop lag {before * 1000:.0f}ms blocking, {after * 1000:.0f}ms async')
+    assert before >= CONCURRENT_COMMANDS * SLOW_CALL_SECONDS * 0.8
+    assert after < before / 4
+
+
+def test_graph_calls_do_not_block_the_loop():
+    async def slow_graph(request):
+        await asyncio.sleep(SLOW_CALL_SECONDS * 5)
+        return web.json_response({'id': request.match_info['media_id']})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{media_id}', slow_graph)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+
+        client = InstagramClient()
+        client.base_url = f'http://127.0.0.1:{port}'
+
+        async def commands():
+            responses = await asyncio.gather(*(
+                client.get(str(number), {'access_token': f'token{number}'})
+                for number in range(CONCURRENT_COMMANDS)
+            ))
+            assert [resp['id'] for resp in responses] == [str(number) for number in range(CONCURRENT_COMMANDS)]
+
+        try:
+            started = time.perf_counter()
+            lag = await max_loop_lag(commands)
+            elapsed = time.perf_counter() - started
+        finally:
+            await http.close()
+            await runner.cleanup()
+        return lag, elapsed
+
+    lag, elapsed = asyncio.run(run())
+    print(f'\ngraph calls: max loop lag {lag * 1000:.0f}ms, {CONCURRENT_COMMANDS} calls in {elapsed:.2f}s')
+    # Sequential blocking calls would take CONCURRENT_COMMANDS * 0.1s and stall the loop for all of it
+    assert elapsed < CONCURRENT_COMMANDS * SLOW_CALL_SECONDS * 5 / 2
+    assert lag < 0.1
@@ -0,0 +1,83 @@
+"""
+Processed images are found on disk again after a restart
+"""
+
+import asyncio
+import importlib
+import pytest
+
+for package in ('dotenv', 'aiohttp'):
+    pytest.importorskip(package)
+
+from utils.mediastore import MediaStore
+
+media_module = importlib.import_module('utils.media')
+
+
+@pytest.fixture
+def restart(monkeypatch, tmp_path):
+    """Build a fresh store and processor over the same directory, as after a bot restart"""
+    downloads = []
+    monkeypatch.setattr(media_module, 'Image', None)  # Pass-through processing, Pillow or not
+
+    def restart():
+        monkeypatch.setattr(media_module, 'store', MediaStore(str(tmp_path), 10 ** 6))
+        processor = media_module.MediaProcessor()
+        processed = []
+
+        async def download(url):
+            downloads.append(url)
+            return b'image bytes', 'image/jpeg'
+
+        original = processor._process
+
+        async def process(data, content_type, key):
+            processed.append(key)
+            return await original(data, content_type, key)
+
+        monkeypatch.setattr(processor, 'download', download)
+        monkeypatch.setattr(processor, '_process', process)
+        return processor, processed
+
+    return restart
+
+
+def test_prepared_image_survives_restart(restart):
+    processor, processed = restart()
+    first = asyncio.run(processor.prepare('https://example.com/a.jpg', 'facebook'))
+    assert len(processed) == 1
+
+    processor, processed = restart()
+    second = asyncio.run(processor.prepare('https://example.com/a.jpg', 'facebook'))
+    assert processed == []
+    assert second['hash'] == first['hash']
+    assert second['data'] == b'image bytes'
+
+
+def test_concurrent_first_reads_wait_for_the_scan(tmp_path):
+    async def run():
+        await MediaStore(str(tmp_path), 10 ** 6).put(b'stored')
+        store = MediaStore(str(tmp_path), 10 ** 6)
+        digests = list((await asyncio.to_thread(store._scan)))
+        return await asyncio.gather(*(store.get(digests[0][0]) for _ in range(5)))
+
+    assert asyncio.run(run()) == [b'stored'] * 5
+
+
+def test_metadata_records_count_against_the_size_limit(tmp_path):
+    async def run():
+        store = MediaStore(str(tmp_path), 200)
+        for number in range(20):
+            await store.put_meta(f'source{number}.facebook', {'hash': f'{number:064x}'})
+        return store
+
+    store = asyncio.run(run())
+    assert 0 < store._size <= 200
+    assert len(list((tmp_path / 'meta').iterdir())) == len(store._index)
+    assert asyncio.run(store.get_meta('source0.facebook')) is None
+    assert asyncio.run(store.get_meta('source19.facebook')) == {'hash': f'{19:064x}'}
+
+
+def test_upload_filename_follows_the_format():
+    assert media_module.upload_filename({'hash': 'a' * 64, 'content_type': 'image/gif'}) == 'a' * 16 + '.gif'
+    assert media_module.upload_filename({'hash': 'a' * 64, 'content_type': 'image/jpeg'}) == 'a' * 16 + '.jpg'
@@ -0,0 +1,63 @@
+"""
+Collected metrics can be read back through the report
+"""
+
+import asyncio
+import importlib
+import logging
+import pytest
+
+for package in ('dotenv', 'aiohttp', 'discord'):
+    pytest.importorskip(package)
+
+from utils.cache import TTLCache
+from utils.metrics import Metrics, metrics
+import utils.http  # noqa: F401 - registers the HTTP pool gauge
+
+metrics_module = importlib.import_module('utils.metrics')
+
+
+def test_report_reads_back_counters_gauges_and_timings():
+    registry = Metrics()
+    registry.incr('outbox.published', 3)
+    registry.gauge('queue.depth', lambda: 7)
+    registry.gauge('pool', lambda: {'reuse_ratio': 0.5})
+    registry.observe('publish_seconds', 2.0)
+
+    assert registry.report() == [
+        'outbox.published 3',
+        'pool.reuse_ratio 0.500',
+        'queue.depth 7',
+        'publish_seconds count=1 avg=2.000 p50=2.000 p95=2.000 max=2.000'
+    ]
+
+
+def test_cache_and_http_stats_are_reported():
+    cache = TTLCache('test_cache', 10, 60)
+    cache.set('key', 'value')
+    cache.get('key')
+    cache.get('other')
+
+    report = metrics.report()
+    assert 'test_cache.cache.hit_ratio 0.500' in report
+    assert 'test_cache.cache.size 1' in report
+    assert any(line.startswith('http.reuse_ratio ') for line in report)
+
+
+def test_report_is_logged_periodically(monkeypatch, caplog):
+    registry = Metrics()
+    registry.incr('harvester.posts', 5)
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) > 2:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(metrics_module.asyncio, 'sleep', sleep)
+    with caplog.at_level(logging.INFO, logger='utils.metrics'):
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(registry.log_every(60))
+
+    assert sleeps == [60, 60, 60]
+    assert [record.getMessage() for record in caplog.records] == ['Metrics:\nharvester.posts 5'] * 2
@@ -0,0 +1,96 @@
+"""
+Publish leases: renewed while publishing, and never published twice
+"""
+
+from datetime import datetime
+import asyncio
+import pytest
+
+for package in ('dotenv', 'aiohttp', 'apscheduler'):
+    pytest.importorskip(package)
+
+import config
+from utils.outbox import Outbox
+from utils.scheduler import PostScheduler
+
+
+class FakeDb:
+    def __init__(self, renewals=True):
+        self.renewals = renewals
+        self.renewed = 0
+        self.recorded = []
+        self.statuses = []
+
+    async def claim_facebook_post(self, post_id, owner, lease_seconds):
+        return {'_id': post_id, 'scheduled_at': datetime.utcnow(), 'lease_owner': owner}
+
+    async def renew_facebook_post_lease(self, post_id, owner, lease_seconds):
+        self.renewed += 1
+        return self.renewals
+
+    async def record_facebook_post_id(self, post_id, owner, fb_post_id):
+        self.recorded.append(fb_post_id)
+
+    async def update_facebook_post_status(self, post_id, status, fb_post_id=None, owner=None):
+        self.statuses.append((status, fb_post_id))
+
+
+def publish_with(db, callback):
+    scheduler = PostScheduler()
+    scheduler.db = db
+    scheduler.facebook_callback = callback
+    asyncio.run(scheduler._publish({'_id': 'post'}))
+
+
+def test_lease_is_renewed_while_the_callback_waits(monkeypatch):
+    monkeypatch.setattr(config, 'SCHEDULER_LEASE_SECONDS', 0.03)
+    db = FakeDb()
+    done = []
+
+    async def slow_publish(post):
+        await asyncio.sleep(0.1)
+        done.append(post['_id'])
+
+    publish_with(db, slow_publish)
+    assert done == ['post']
+    assert db.renewed >= 2
+
+
+def test_publish_is_cancelled_when_the_lease_is_lost(monkeypatch):
+    monkeypatch.setattr(config, 'SCHEDULER_LEASE_SECONDS', 0.03)
+    db = FakeDb(renewals=False)
+    done = []
+
+    async def slow_publish(post):
+        await asyncio.sleep(0.1)
+        done.append(post['_id'])
+
+    publish_with(db, slow_publish)
+    assert done == []
+
+
+def test_post_id_is_recorded_before_the_status():
+    db = FakeDb()
+    outbox = Outbox()
+    outbox.db = db
+
+    async def publisher(post):
+        return 'page_1'
+
+    outbox.publisher = publisher
+    asyncio.run(outbox.process({'_id': 'post', 'lease_owner': 'me'}))
+    assert db.recorded == ['page_1']
+    assert db.statuses == [('published', 'page_1')]
+
+
+def test_already_published_post_skips_graph():
+    db = FakeDb()
+    outbox = Outbox()
+    outbox.db = db
+
+    async def publisher(post):
+        raise AssertionError('published twice')
+
+    outbox.publisher = publisher
+    asyncio.run(outbox.process({'_id': 'post', 'lease_owner': 'me', 'fb_post_id': 'page_1'}))
+    assert db.statuses == [('published', 'page_1')]
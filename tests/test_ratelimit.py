@@ -0,0 +1,64 @@
+"""
+Token bucket throughput under sustained load, on a simulated clock
+"""
+
+import asyncio
+import importlib
+import pytest
+
+pytest.importorskip('dotenv')
+
+import config
+from utils.ratelimit import TokenBucket, GraphRateLimiter
+
+ratelimit = importlib.import_module('utils.ratelimit')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the bucket's clock and sleep so waiting is instant but still measured"""
+    now = [1000.0]
+
+    async def sleep(seconds):
+        # A real sleep always lets some time pass, even for float rounding leftovers
+        now[0] += max(seconds, 1e-6)
+
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(ratelimit.asyncio, 'sleep', sleep)
+    return now
+
+
+def run_calls(acquire, count, clock):
+    started = clock[0]
+
+    async def run():
+        await asyncio.gather(*(acquire() for _ in range(count)))
+
+    asyncio.run(run())
+    return clock[0] - started
+
+
+def test_default_window_is_one_minute():
+    assert config.RATE_LIMIT_WINDOW == 60
+
+
+def test_bucket_holds_a_full_window_by_default(clock):
+    bucket = TokenBucket(180, 60)
+    assert run_calls(bucket.acquire, 180, clock) == 0
+
+
+def test_sustained_throughput_matches_max_calls_per_window(clock):
+    limiter = GraphRateLimiter('test', 180, 180, {'publish': 180}, config.RATE_LIMIT_WINDOW)
+
+    async def call():
+        await limiter.acquire(page_id='page', endpoint='publish')
+
+    # One window's worth immediately, the next window's worth over 60 seconds
+    elapsed = run_calls(call, 360, clock)
+    assert 59 <= elapsed <= 61
+
+
+def test_burst_limit_still_paces_at_the_window_rate(clock):
+    bucket = TokenBucket(180, 60, burst=10)
+    elapsed = run_calls(bucket.acquire, 100, clock)
+    assert elapsed == pytest.approx(90 / 3, rel=0.01)
@@ -0,0 +1,108 @@
+"""
+Streaming download setup and teardown
+"""
+
+import asyncio
+import importlib
+import json
+import pytest
+
+for package in ('dotenv', 'aiohttp'):
+    pytest.importorskip(package)
+
+import aiohttp
+from yarl import URL
+from utils.upload import StreamSource
+
+upload_module = importlib.import_module('utils.upload')
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status = status
+        self.released = False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            url = URL('https://example.com/')
+            raise aiohttp.ClientResponseError(aiohttp.RequestInfo(url, 'GET', {}, url), (), status=self.status)
+
+    def release(self):
+        self.released = True
+
+
+def test_failed_response_is_released(monkeypatch):
+    resp = FakeResponse(404)
+
+    class Session:
+        closed = False
+
+        async def get(self, url, timeout=None):
+            return resp
+
+    monkeypatch.setattr(upload_module.http, '_session', Session())
+
+    async def run():
+        async with StreamSource('https://example.com/video.mp4'):
+            pass
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(run())
+    assert resp.released
+
+
+class FakeChunkResponse(FakeResponse):
+    def __init__(self, status, body):
+        super().__init__(status)
+        self.body = body
+
+    async def json(self, content_type=None):
+        return json.loads(self.body)
+
+    async def text(self):
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class OneChunkSource:
+    def __init__(self, url):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def chunks(self):
+        yield b'video'
+
+
+def test_reel_chunk_is_resent_after_a_server_error_page(monkeypatch):
+    responses = [FakeChunkResponse(503, '<html>Service Unavailable</html>'), FakeChunkResponse(200, '{"success": true}')]
+
+    class Session:
+        closed = False
+
+        def post(self, url, headers=None, data=None):
+            return responses.pop(0)
+
+    async def create_container(endpoint, params):
+        return {'id': 'container', 'uri': 'https://upload.example.com/container'}
+
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(upload_module.http, '_session', Session())
+    monkeypatch.setattr(upload_module.instagram, 'post', create_container)
+    monkeypatch.setattr(upload_module, 'StreamSource', OneChunkSource)
+    monkeypatch.setattr(upload_module.asyncio, 'sleep', no_sleep)
+
+    container = asyncio.run(upload_module.upload_instagram_video('ig', 'token', 'https://example.com/v.mp4', 5))
+    assert container == 'container'
+    assert responses == []
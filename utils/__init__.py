@@ -2,12 +2,40 @@
 Utility modules for Facebook Discord Bot
 """
 
-from .database import Database, db
+from .database import Database, AsyncDatabase, db, async_db
 from .oauth import FacebookOAuth, oauth
 from .scheduler import PostScheduler, scheduler
+from .http import HttpClient, http
+from .metrics import Metrics, metrics
+from .cache import TTLCache, SingleFlight
+from .ratelimit import TokenBucket, GraphRateLimiter, facebook_limiter, instagram_limiter
+from .graph import GraphAPI, GraphAPIError, graph, graph_video
+from .outbox import Outbox, outbox
+from .views import ViewRegistry, RegisteredView, views
+from .insights import InsightsCache, insights
+from .harvester import AnalyticsHarvester, harvester
+from .bulk import BulkScheduleResult, schedule_bulk
+from .upload import UploadError, StreamSource
+from .mediastore import MediaStore, store
+from .media import MediaError, MediaProcessor, media
+from .commandsync import sync_commands, tree_hash
 
 __all__ = [
-    'Database', 'db',
+    'Database', 'AsyncDatabase', 'db', 'async_db',
     'FacebookOAuth', 'oauth',
-    'PostScheduler', 'scheduler'
+    'PostScheduler', 'scheduler',
+    'HttpClient', 'http',
+    'Metrics', 'metrics',
+    'TTLCache', 'SingleFlight',
+    'TokenBucket', 'GraphRateLimiter', 'facebook_limiter', 'instagram_limiter',
+    'GraphAPI', 'GraphAPIError', 'graph', 'graph_video',
+    'Outbox', 'outbox',
+    'ViewRegistry', 'RegisteredView', 'views',
+    'InsightsCache', 'insights',
+    'AnalyticsHarvester', 'harvester',
+    'BulkScheduleResult', 'schedule_bulk',
+    'UploadError', 'StreamSource',
+    'MediaStore', 'store',
+    'MediaError', 'MediaProcessor', 'media',
+    'sync_commands', 'tree_hash'
 ]
@@ -0,0 +1,195 @@
+"""
+Bulk post scheduling
+Streams a CSV or JSON lines attachment, validates each row and inserts posts in chunks
+"""
+
+from datetime import datetime
+import csv
+import io
+import json
+from urllib.parse import urlparse
+from utils.http import http
+import config
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+MAX_MESSAGE_LENGTH = 63206  # Graph API limit for a post message
+MAX_RECORD_LENGTH = 4 * MAX_MESSAGE_LENGTH  # A CSV record still open after this much text has a stray quote
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class BulkScheduleResult:
+    """Counts and per-row errors of one bulk schedule run"""
+
+    def __init__(self):
+        self.rows = 0
+        self.scheduled = 0
+        self.errors = []  # (row number, message)
+        self.first_at = None
+        self.last_at = None
+
+    def error(self, row, message):
+        self.errors.append((row, message))
+
+    def error_report(self):
+        """CSV text with one line per failed row"""
+        lines = ['row,error']
+        lines += [f'{row},"{message.replace(chr(34), chr(39))}"' for row, message in self.errors]
+        return '\n'.join(lines) + '\n'
+
+
+async def iter_lines(url):
+    """Yield the lines of a remote file as it downloads
+
+    Lines are split here instead of with the stream's readline, which fails on lines longer than its
+    buffer ("Chunk too big") and would abort the whole import over one long caption.
+    """
+    async with http.session.get(url) as resp:
+        resp.raise_for_status()
+        encoding = 'utf-8-sig'  # Only the first line can start with a byte order mark
+        pending = b''
+        async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            *lines, pending = (pending + chunk).split(b'\n')
+            for line in lines:
+                # Whole lines only, so a multi-byte character is never cut in half
+                yield (line + b'\n').decode(encoding)
+                encoding = 'utf-8'
+        if pending:
+            yield pending.decode(encoding)
+
+
+async def iter_csv_records(lines):
+    """Yield the fields of each CSV record, or a ValueError for one that can not be parsed
+
+    A quoted field may contain newlines: the csv module reports such a record as cut off
+    ("unexpected end of data"), and lines are joined until it parses.
+    """
+    pending = ''
+    async for line in lines:
+        pending += line
+        try:
+            records = list(csv.reader(io.StringIO(pending), strict=True))
+        except csv.Error as e:
+            if 'unexpected end of data' in str(e) and len(pending) <= MAX_RECORD_LENGTH:
+                continue
+            records = [ValueError(f'Unreadable row: {e}')]
+        pending = ''
+        for record in records:
+            if record:
+                yield record
+    if pending.strip():
+        yield ValueError('Unreadable row: unterminated quoted field')
+
+
+async def parse_rows(lines, is_csv):
+    """Yield (row number, row dict) from CSV (with a header) or JSON lines text
+
+    Rows that cannot be parsed are yielded as (row number, ValueError).
+    """
+    row_number = 0
+    if is_csv:
+        header = None
+        async for record in iter_csv_records(lines):
+            if header is None:
+                if isinstance(record, Exception):
+                    raise ValueError(f'Unreadable header: {record}')
+                header = [name.strip().lower() for name in record]
+                continue
+            row_number += 1
+            yield row_number, record if isinstance(record, Exception) else dict(zip(header, record))
+        return
+
+    # JSON lines: one object per line, a quote inside a string never continues the record
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError('Expected a JSON object')
+            yield row_number, row
+        except ValueError as e:
+            yield row_number, ValueError(f'Unreadable row: {e}')
+
+
+def iter_rows(url, filename):
+    """Stream the rows of a CSV or JSON lines attachment (see parse_rows)"""
+    return parse_rows(iter_lines(url), filename.lower().endswith('.csv'))
+
+
+def build_post(row, server_id, page_id, now):
+    """Validate one row and turn it into a scheduled post document (raises ValueError)"""
+    message = str(row.get('message') or '').strip()
+    if not message:
+        raise ValueError('Missing message')
+    if len(message) > MAX_MESSAGE_LENGTH:
+        raise ValueError(f'Message longer than {MAX_MESSAGE_LENGTH} characters')
+
+    when = str(row.get('scheduled_at') or row.get('datetime') or '').strip()
+    try:
+        scheduled_at = datetime.strptime(when, DATE_FORMAT)
+    except ValueError:
+        raise ValueError(f'Invalid scheduled_at "{when}" (format: YYYY-MM-DD HH:MM)')
+    if scheduled_at <= now:
+        raise ValueError(f'scheduled_at {when} is not in the future')
+
+    link = str(row.get('link') or '').strip() or None
+    if link and urlparse(link).scheme not in ('http', 'https'):
+        raise ValueError(f'Invalid link "{link}"')
+
+    return {
+        'server_id': server_id,
+        'page_id': page_id,
+        'message': message,
+        'link': link,
+        'scheduled_at': scheduled_at,
+        'status': 'scheduled',
+        'platform': 'facebook'
+    }
+
+
+async def schedule_bulk(db, scheduler, url, filename, server_id, page_id):
+    """Stream, validate and insert every row; the scheduler is notified once at the end"""
+    result = BulkScheduleResult()
+    now = datetime.utcnow()
+    horizon = scheduler.horizon()
+    chunk, rows, upcoming = [], [], []
+
+    async def flush():
+        failed = await db.save_facebook_posts(chunk)
+        for index, post in enumerate(chunk):
+            if index in failed:
+                result.error(rows[index], failed[index])
+                continue
+            result.scheduled += 1
+            # Only posts the scheduler keeps in memory are held on to
+            if post['scheduled_at'] <= horizon:
+                upcoming.append(post)
+        chunk.clear()
+        rows.clear()
+
+    async for row_number, row in iter_rows(url, filename):
+        if row_number > config.BULK_SCHEDULE_MAX_ROWS:
+            result.error(row_number, f'File has more than {config.BULK_SCHEDULE_MAX_ROWS} rows, the rest was skipped')
+            break
+        result.rows = row_number
+        try:
+            if isinstance(row, Exception):
+                raise row
+            post = build_post(row, server_id, page_id, now)
+        except ValueError as e:
+            result.error(row_number, str(e))
+            continue
+
+        result.first_at = min(result.first_at or post['scheduled_at'], post['scheduled_at'])
+        result.last_at = max(result.last_at or post['scheduled_at'], post['scheduled_at'])
+        chunk.append(post)
+        rows.append(row_number)
+        if len(chunk) >= config.BULK_SCHEDULE_CHUNK:
+            await flush()
+
+    if chunk:
+        await flush()
+    scheduler.notify_many(upcoming)
+    return result
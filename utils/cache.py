@@ -0,0 +1,84 @@
+"""
+In-process caches for the bot
+Memory-only, nothing here is ever written to disk or the database
+"""
+
+from collections import OrderedDict
+import asyncio
+import time
+from utils.metrics import metrics
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        metrics.gauge(f'{name}.cache', self.stats)
+
+    def get(self, key):
+        """Return the cached value or None"""
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            metrics.incr(f'{self.name}.misses')
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        metrics.incr(f'{self.name}.hits')
+        return entry[1]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry if full"""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop one entry"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Get hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one in-flight call"""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # key -> future
+
+    async def do(self, key, fn):
+        """Await `fn()`, or the call already running for `key`"""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            metrics.incr(f'{self.name}.coalesced')
+        # One waiter giving up must not cancel the call for the others
+        return await asyncio.shield(future)
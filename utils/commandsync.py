@@ -0,0 +1,52 @@
+"""
+Slash command sync, skipped when nothing changed
+Hashes the serialized command tree and only calls Discord when it differs from the last synced one
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from utils.metrics import metrics
+import config
+
+
+def tree_hash(tree, application_id):
+    """SHA-256 of the command tree as it would be sent to Discord"""
+    payload = sorted(
+        (command.to_dict(tree) for command in tree.get_commands()),
+        key=lambda command: (command.get('type', 1), command['name'])
+    )
+    data = json.dumps({'application_id': application_id, 'commands': payload}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def read_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_state(path, state):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+async def sync_commands(bot, force=False):
+    """Sync the global command tree if it changed; returns the synced commands, or None if skipped"""
+    application_id = str(bot.application_id)
+    digest = tree_hash(bot.tree, application_id)
+    state = await asyncio.to_thread(read_state, config.COMMAND_SYNC_STATE_PATH)
+    if not force and state.get(application_id) == digest:
+        metrics.incr('startup.command_sync_skipped')
+        return None
+
+    synced = await bot.tree.sync()
+    state[application_id] = digest
+    await asyncio.to_thread(write_state, config.COMMAND_SYNC_STATE_PATH, state)
+    metrics.incr('startup.command_syncs')
+    return synced
@@ -1,71 +1,528 @@
 """
 Database module for Facebook Discord Bot
-Handles all MongoDB operations
+Handles all MongoDB operations (async Motor API for the bot, sync PyMongo API for scripts)
 """
 
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import MongoClient, ReturnDocument, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, OperationFailure
+from motor.motor_asyncio import AsyncIOMotorClient
+from datetime import datetime, timedelta
+import asyncio
+import copy
 from cryptography.fernet import Fernet
+from utils.cache import TTLCache
 import config
 
 
-class Database:
-    """Database handler for Facebook"""
-    
+def client_options():
+    """Connection pool and timeout settings shared by both clients"""
+    return {
+        'maxPoolSize': config.MONGODB_MAX_POOL_SIZE,
+        'minPoolSize': config.MONGODB_MIN_POOL_SIZE,
+        'maxIdleTimeMS': config.MONGODB_MAX_IDLE_TIME_MS,
+        'serverSelectionTimeoutMS': config.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        'connectTimeoutMS': config.MONGODB_CONNECT_TIMEOUT_MS,
+        'socketTimeoutMS': config.MONGODB_SOCKET_TIMEOUT_MS
+    }
+
+
+def index_specs(timeseries=True):
+    """Indexes for the hot query paths, as (collection, keys, options)
+
+    `timeseries` tells whether analytics_series is a time-series collection, which expires points itself.
+    """
+    specs = [
+        ('facebook_accounts', [('server_id', ASCENDING)], {'unique': True, 'name': 'server_id_unique'}),
+        # Partial indexes: only posts waiting to be published are indexed
+        ('facebook_posts', [('scheduled_at', ASCENDING)],
+         {'partialFilterExpression': {'status': 'scheduled'}, 'name': 'scheduled_due'}),
+        ('facebook_posts', [('lease_expires_at', ASCENDING)],
+         {'partialFilterExpression': {'status': 'publishing'}, 'name': 'publishing_leases'}),
+        ('facebook_posts', [('server_id', ASCENDING), ('created_at', DESCENDING)], {'name': 'server_recent'}),
+        ('facebook_dead_letters', [('server_id', ASCENDING), ('failed_at', DESCENDING)], {'name': 'server_failed'}),
+        ('facebook_media', [('page_id', ASCENDING), ('hash', ASCENDING)], {'unique': True, 'name': 'page_hash'}),
+        ('facebook_analytics', [('post_id', ASCENDING), ('server_id', ASCENDING), ('fetched_at', DESCENDING)],
+         {'name': 'post_server_latest'}),
+        ('analytics_series', [('meta.post_id', ASCENDING), ('ts', ASCENDING)], {'name': 'post_series'}),
+        ('analytics_series', [('meta.account_id', ASCENDING), ('ts', ASCENDING)], {'name': 'account_series'})
+    ]
+    for collection in ROLLUP_COLLECTIONS:
+        specs += [
+            (collection, [('post_id', ASCENDING), ('platform', ASCENDING), ('bucket', ASCENDING)],
+             {'unique': True, 'name': 'post_bucket'}),
+            (collection, [('account_id', ASCENDING), ('platform', ASCENDING), ('bucket', ASCENDING)],
+             {'name': 'account_bucket'})
+        ]
+    if config.ANALYTICS_TTL_DAYS:
+        specs.append(('facebook_analytics', [('fetched_at', ASCENDING)],
+                      {'expireAfterSeconds': config.ANALYTICS_TTL_DAYS * 86400, 'name': 'fetched_at_ttl'}))
+        if not timeseries:
+            specs.append(('analytics_series', [('ts', ASCENDING)],
+                          {'expireAfterSeconds': config.ANALYTICS_TTL_DAYS * 86400, 'name': 'ts_ttl'}))
+    return specs
+
+
+# TTL indexes dropped again when ANALYTICS_TTL_DAYS is turned off, as (collection, name)
+TTL_INDEXES = [('facebook_analytics', 'fetched_at_ttl'), ('analytics_series', 'ts_ttl')]
+MONGODB_5_0 = (5, 0)  # Time-series collections and window functions ($setWindowFields)
+
+
+def series_is_timeseries(series, version):
+    """Whether analytics_series is, or will be created as, a time-series collection
+
+    `series` is its list_collections entry (None if missing), `version` the server's (major, minor).
+    Servers before MongoDB 5.0 get a plain collection with a TTL index instead.
+    """
+    if series:
+        return 'timeseries' in series.get('options', {})
+    return version >= MONGODB_5_0
+
+
+def series_options():
+    """Options for the analytics_series time-series collection (MongoDB 5.0+)"""
+    options = {'timeseries': {'timeField': 'ts', 'metaField': 'meta', 'granularity': 'hours'}}
+    if config.ANALYTICS_TTL_DAYS:
+        options['expireAfterSeconds'] = config.ANALYTICS_TTL_DAYS * 86400
+    return options
+
+
+# create_index errors when an index with the same name or keys already exists with other options
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+INDEX_NOT_FOUND = 27
+NAMESPACE_NOT_FOUND = 26
+
+
+def ttl_update(collection, keys, options):
+    """collMod command that changes a TTL index's expiry in place instead of rebuilding it"""
+    return {'collMod': collection, 'index': {'keyPattern': dict(keys), 'expireAfterSeconds': options['expireAfterSeconds']}}
+
+
+def series_ttl_update():
+    """collMod command that applies the current ANALYTICS_TTL_DAYS to the existing time series"""
+    return {'collMod': 'analytics_series', 'expireAfterSeconds': config.ANALYTICS_TTL_DAYS * 86400 or 'off'}
+
+
+def conflicting_index(keys, options, error):
+    """The existing index that blocks create_index: the same name with other keys, or the same keys"""
+    return options['name'] if error.code == INDEX_KEY_SPECS_CONFLICT else keys
+
+
+ROLLUP_COLLECTIONS = {
+    'analytics_hourly': lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    'analytics_daily': lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0)
+}
+
+
+def point_engagement(point):
+    """(engagement, reach) for one harvested series point"""
+    if point['meta']['platform'] == 'facebook':
+        return point.get('post_engaged_users') or 0, point.get('post_impressions') or 0
+    engagement = sum(point.get(name) or 0 for name in ('likes', 'comments', 'saved', 'shares'))
+    return engagement, point.get('reach') or 0
+
+
+def rollup_updates(points):
+    """Upserts that fold series points into the hourly and daily rollups, per collection
+
+    Metrics are lifetime counters, so a bucket keeps the highest value seen (and the lowest
+    engagement, for growth); replaying a point never changes a bucket except for `samples`.
+    """
+    updates = {collection: [] for collection in ROLLUP_COLLECTIONS}
+    for point in points:
+        meta = point['meta']
+        engagement, reach = point_engagement(point)
+        maxima = {'engagement': engagement, 'reach': reach}
+        for name, value in point.items():
+            if name not in ('_id', 'ts', 'meta') and isinstance(value, (int, float)):
+                maxima[f'metrics.{name}'] = value
+
+        for collection, truncate in ROLLUP_COLLECTIONS.items():
+            updates[collection].append(UpdateOne(
+                {'platform': meta['platform'], 'post_id': meta['post_id'], 'bucket': truncate(point['ts'])},
+                {
+                    '$setOnInsert': {'account_id': meta['account_id'], 'media_type': meta.get('media_type')},
+                    '$max': maxima,
+                    '$min': {'first_engagement': engagement},
+                    '$inc': {'samples': 1}
+                },
+                upsert=True
+            ))
+    return updates
+
+
+def series_filter(platform=None, account_id=None):
+    """analytics_series filter for one platform and/or account (everything when both are None)"""
+    query = {}
+    if platform:
+        query['meta.platform'] = platform
+    if account_id:
+        query['meta.account_id'] = account_id
+    return query
+
+
+def rollup_filter(platform=None, account_id=None):
+    """Rollup filter matching series_filter"""
+    query = {}
+    if platform:
+        query['platform'] = platform
+    if account_id:
+        query['account_id'] = account_id
+    return query
+
+
+def previous_day_stages(window_functions=True):
+    """Stages that add each daily bucket's previous_engagement/previous_reach (0 for a post's first day)
+
+    $setWindowFields needs MongoDB 5.0; older servers regroup each post's days and walk them with $reduce.
+    """
+    if window_functions:
+        return [{'$setWindowFields': {
+            'partitionBy': '$post_id',
+            'sortBy': {'bucket': 1},
+            'output': {
+                'previous_engagement': {'$shift': {'output': '$engagement', 'by': -1, 'default': 0}},
+                'previous_reach': {'$shift': {'output': '$reach', 'by': -1, 'default': 0}}
+            }
+        }}]
+    return [
+        {'$sort': {'bucket': 1}},
+        {'$group': {'_id': '$post_id', 'days': {'$push': '$$ROOT'}}},
+        {'$project': {'days': {'$reduce': {
+            'input': '$days',
+            'initialValue': {'previous': {'engagement': 0, 'reach': 0}, 'days': []},
+            'in': {
+                'previous': '$$this',
+                'days': {'$concatArrays': ['$$value.days', [{'$mergeObjects': ['$$this', {
+                    'previous_engagement': '$$value.previous.engagement',
+                    'previous_reach': '$$value.previous.reach'
+                }]}]]}
+            }
+        }}}},
+        {'$unwind': '$days.days'},
+        {'$replaceRoot': {'newRoot': '$days.days'}}
+    ]
+
+
+def analytics_pipeline(platform, account_id, since, until=None, top=5, window_functions=True):
+    """Aggregation over analytics_daily: per-day totals, per-post-type engagement, top posts and growth
+
+    Daily buckets hold lifetime counters, so per-day totals sum each post's change since its
+    previous day (the day before `since` is read only as that baseline).
+    """
+    start = ROLLUP_COLLECTIONS['analytics_daily'](since)
+    return [
+        {'$match': {
+            'account_id': account_id,
+            'platform': platform,
+            'bucket': {
+                '$gte': start - timedelta(days=1),
+                '$lte': until or datetime.utcnow()
+            }
+        }},
+        *previous_day_stages(window_functions),
+        {'$match': {'bucket': {'$gte': start}}},
+        {'$sort': {'bucket': 1}},
+        {'$group': {
+            '_id': '$post_id',
+            'media_type': {'$first': '$media_type'},
+            'days': {'$push': {
+                'day': '$bucket',
+                'engagement': {'$subtract': ['$engagement', '$previous_engagement']},
+                'reach': {'$subtract': ['$reach', '$previous_reach']}
+            }},
+            'engagement': {'$last': '$engagement'},
+            'reach': {'$last': '$reach'},
+            'first_engagement': {'$first': '$first_engagement'}
+        }},
+        {'$set': {'gained': {'$subtract': ['$engagement', '$first_engagement']}}},
+        {'$facet': {
+            'daily': [
+                {'$unwind': '$days'},
+                {'$group': {
+                    '_id': '$days.day',
+                    'engagement': {'$sum': '$days.engagement'},
+                    'reach': {'$sum': '$days.reach'},
+                    'posts': {'$sum': 1}
+                }},
+                {'$sort': {'_id': 1}}
+            ],
+            'by_type': [
+                {'$group': {
+                    '_id': '$media_type',
+                    'posts': {'$sum': 1},
+                    'engagement': {'$sum': '$engagement'},
+                    'avg_engagement': {'$avg': '$engagement'}
+                }},
+                {'$sort': {'engagement': -1}}
+            ],
+            'top_posts': [
+                {'$sort': {'engagement': -1}},
+                {'$limit': top},
+                {'$project': {'media_type': 1, 'engagement': 1, 'reach': 1, 'gained': 1}}
+            ],
+            'totals': [
+                {'$group': {
+                    '_id': None,
+                    'posts': {'$sum': 1},
+                    'engagement': {'$sum': '$engagement'},
+                    'reach': {'$sum': '$reach'},
+                    'gained': {'$sum': '$gained'}
+                }}
+            ]
+        }}
+    ]
+
+
+def prepare_posts(posts):
+    """Stamp new post documents the way save_facebook_post does"""
+    now = datetime.utcnow()
+    for post in posts:
+        post['created_at'] = now
+
+
+def bulk_errors(error):
+    """{index: message} from an unordered insert_many failure"""
+    return {item['index']: item.get('errmsg', 'Insert failed') for item in error.details.get('writeErrors', [])}
+
+
+def due_posts_query(until=None):
+    """Posts due before `until` (default: now), plus posts whose publish lease expired"""
+    now = datetime.utcnow()
+    return {
+        '$or': [
+            {'status': 'scheduled', 'scheduled_at': {'$lte': until or now}},
+            {'status': 'publishing', 'lease_expires_at': {'$lt': now}}
+        ]
+    }
+
+
+def claim_update(post_id, owner, lease_seconds):
+    """Filter and update that lease one due post to `owner`"""
+    now = datetime.utcnow()
+    query = {
+        '_id': post_id,
+        '$or': [
+            {'status': 'scheduled'},
+            {'status': 'publishing', 'lease_expires_at': {'$lt': now}}
+        ]
+    }
+    update = {
+        '$set': {
+            'status': 'publishing',
+            'lease_owner': owner,
+            'lease_expires_at': now + timedelta(seconds=lease_seconds)
+        },
+        '$inc': {'attempts': 1}
+    }
+    return query, update
+
+
+def renew_update(post_id, owner, lease_seconds):
+    """Filter and update that extend a lease still held by `owner`"""
+    return {'_id': post_id, 'status': 'publishing', 'lease_owner': owner}, {
+        '$set': {'lease_expires_at': datetime.utcnow() + timedelta(seconds=lease_seconds)}
+    }
+
+
+def status_update(post_id, status, fb_post_id=None, owner=None):
+    """Filter and update for a post status change; with `owner`, only while that lease is held"""
+    update = {
+        'status': status,
+        'published_at': datetime.utcnow()
+    }
+    if fb_post_id:
+        update['fb_post_id'] = fb_post_id
+
+    query = {'_id': post_id}
+    if owner:
+        query['lease_owner'] = owner
+    return query, {'$set': update, '$unset': {'lease_owner': '', 'lease_expires_at': ''}}
+
+
+def retry_update(post_id, owner, retry_at, error):
+    """Filter and update that put a leased post back in the queue for a later attempt"""
+    return {'_id': post_id, 'lease_owner': owner}, {
+        '$set': {'status': 'scheduled', 'scheduled_at': retry_at, 'last_error': error},
+        '$unset': {'lease_owner': '', 'lease_expires_at': ''}
+    }
+
+
+def dead_letter(post, error, retryable):
+    """Dead-letter document for a post that will not be retried"""
+    letter = {key: value for key, value in post.items() if key not in ('_id', 'lease_owner', 'lease_expires_at')}
+    letter.update({'post_id': post['_id'], 'error': error, 'retryable': retryable, 'failed_at': datetime.utcnow()})
+    return letter
+
+
+def replay_update(post_id):
+    """Filter and update that put a failed post back in the queue, due now
+
+    Only a post still marked failed matches, so a replay never resets one that is being (or was) published.
+    """
+    return {'_id': post_id, 'status': 'failed'}, {
+        '$set': {'status': 'scheduled', 'scheduled_at': datetime.utcnow(), 'attempts': 0},
+        '$unset': {'last_error': '', 'lease_owner': '', 'lease_expires_at': ''}
+    }
+
+
+def log_status_update(post_id, status, matched):
+    if matched:
+        print(f'✅ Updated post {post_id} status to {status}')
+    else:
+        print(f'⚠️ Lease on post {post_id} lost, status {status} not written')
+
+
+def analytics_upsert(analytics_data):
+    """Filter and update that replace a post's snapshot (per server) with fresh metrics"""
+    analytics_data = {**analytics_data, 'fetched_at': datetime.utcnow()}
+    return {'post_id': analytics_data['post_id'], 'server_id': analytics_data.get('server_id')}, {'$set': analytics_data}
+
+
+def analytics_upserts(snapshots):
+    """Bulk version of analytics_upsert"""
+    return [UpdateOne(*analytics_upsert(snapshot), upsert=True) for snapshot in snapshots]
+
+
+def analytics_query(post_id, server_id=None, max_age=None):
+    """Filter for a post's snapshot, optionally only a fresh one
+
+    With `server_id` only that server's snapshot matches, so one guild never reads another's insights.
+    """
+    query = {'post_id': post_id}
+    if server_id is not None:
+        query['server_id'] = str(server_id)
+    if max_age is not None:
+        query['fetched_at'] = {'$gte': datetime.utcnow() - timedelta(seconds=max_age)}
+    return query
+
+
+class TokenCipher:
+    """Fernet encryption for stored access tokens"""
+
+    def __init__(self):
+        self.cipher = Fernet(config.ENCRYPTION_KEY.encode())
+
+    def encrypt(self, text):
+        """Encrypt access token"""
+        return self.cipher.encrypt(text.encode()).decode()
+
+    def decrypt(self, encrypted):
+        """Decrypt access token"""
+        return self.cipher.decrypt(encrypted.encode()).decode()
+
+
+class Database(TokenCipher):
+    """Synchronous database handler for Facebook (for scripts, not the bot's event loop)"""
+
     def __init__(self):
         """Initialize MongoDB connection"""
         try:
-            self.client = MongoClient(config.MONGODB_URI)
+            self.client = MongoClient(config.MONGODB_URI, **client_options())
             self.db = self.client[config.DATABASE_NAME]
-            
+
             # Facebook collections
             self.facebook_accounts = self.db['facebook_accounts']
             self.facebook_posts = self.db['facebook_posts']
             self.facebook_analytics = self.db['facebook_analytics']
-            
+            self.analytics_series = self.db['analytics_series']
+            self.facebook_dead_letters = self.db['facebook_dead_letters']
+            self.facebook_media = self.db['facebook_media']
+            self._server_version = None
+
             # Initialize encryption
-            self.cipher = Fernet(config.ENCRYPTION_KEY.encode())
-            
+            super().__init__()
+
             print('✅ Database connected')
         except Exception as e:
             print(f'❌ Database connection failed: {e}')
             raise
-    
-    def encrypt(self, text):
-        """Encrypt access token"""
-        return self.cipher.encrypt(text.encode()).decode()
-    
-    def decrypt(self, encrypted):
-        """Decrypt access token"""
-        return self.cipher.decrypt(encrypted.encode()).decode()
-    
+
+    def server_version(self):
+        """(major, minor) of the MongoDB server"""
+        if not self._server_version:
+            self._server_version = tuple(self.db.command('buildInfo')['versionArray'][:2])
+        return self._server_version
+
+    def ensure_indexes(self):
+        """Create indexes for the hot query paths; existing ones whose options changed are updated"""
+        series = next(self.db.list_collections(filter={'name': 'analytics_series'}), None)
+        timeseries = series_is_timeseries(series, self.server_version())
+        if not series:
+            self.db.create_collection('analytics_series', **(series_options() if timeseries else {}))
+        elif timeseries:
+            self.db.command(series_ttl_update())
+        for collection, keys, options in index_specs(timeseries):
+            self._ensure_index(collection, keys, options)
+        if not config.ANALYTICS_TTL_DAYS:
+            for collection, name in TTL_INDEXES:
+                try:
+                    self.db[collection].drop_index(name)
+                except OperationFailure as e:
+                    if e.code not in (INDEX_NOT_FOUND, NAMESPACE_NOT_FOUND):
+                        raise
+        print('✅ Database indexes ensured')
+
+    def _ensure_index(self, collection, keys, options):
+        try:
+            self.db[collection].create_index(keys, **options)
+            return
+        except OperationFailure as e:
+            if e.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+                raise
+            error = e
+
+        # A changed ANALYTICS_TTL_DAYS only needs the expiry updated
+        if 'expireAfterSeconds' in options and error.code == INDEX_OPTIONS_CONFLICT:
+            try:
+                self.db.command(ttl_update(collection, keys, options))
+                return
+            except OperationFailure:
+                pass  # More than the expiry differs
+        print(f'⚠️ Rebuilding index {options["name"]} on {collection}: {error}')
+        self.db[collection].drop_index(conflicting_index(keys, options, error))
+        self.db[collection].create_index(keys, **options)
+
+    def find_collection_scans(self):
+        """Explain the hot queries and return the names of those that fall back to a COLLSCAN"""
+        queries = {
+            'get_facebook_account': self.facebook_accounts.find({'server_id': '0'}),
+            'get_facebook_scheduled_posts': self.facebook_posts.find(due_posts_query()).sort('scheduled_at', 1),
+            'get_posts_by_server': self.facebook_posts.find({'server_id': '0'}).sort('created_at', -1).limit(10),
+            'get_analytics': self.facebook_analytics.find(analytics_query('0', '0')).sort('fetched_at', -1).limit(1)
+        }
+        return [
+            name for name, cursor in queries.items()
+            if 'COLLSCAN' in str(cursor.explain()['queryPlanner']['winningPlan'])
+        ]
+
     # Facebook Account Methods
     def save_facebook_account(self, server_id, account_data):
         """Save Facebook page for a Discord server"""
         account_data['access_token'] = self.encrypt(account_data['access_token'])
         account_data['server_id'] = str(server_id)
         account_data['connected_at'] = datetime.utcnow()
-        
+
         self.facebook_accounts.update_one(
             {'server_id': str(server_id)},
             {'$set': account_data},
             upsert=True
         )
         print(f'✅ Saved Facebook account for server {server_id}')
-    
+
     def get_facebook_account(self, server_id):
         """Get Facebook page for a server"""
         account = self.facebook_accounts.find_one({'server_id': str(server_id)})
         if account and 'access_token' in account:
             account['access_token'] = self.decrypt(account['access_token'])
         return account
-    
+
     def delete_facebook_account(self, server_id):
         """Delete Facebook account"""
         result = self.facebook_accounts.delete_one({'server_id': str(server_id)})
         print(f'✅ Deleted Facebook account for server {server_id}')
         return result.deleted_count > 0
-    
+
     # Post Methods
     def save_facebook_post(self, post_data):
         """Save a Facebook post (scheduled or published)"""
@@ -73,50 +530,405 @@ class Database:
         result = self.facebook_posts.insert_one(post_data)
         print(f'✅ Saved post with ID {result.inserted_id}')
         return result.inserted_id
-    
-    def get_facebook_scheduled_posts(self):
-        """Get Facebook posts that need to be published"""
-        posts = list(self.facebook_posts.find({
-            'status': 'scheduled',
-            'scheduled_at': {'$lte': datetime.utcnow()}
-        }))
-        return posts
-    
-    def update_facebook_post_status(self, post_id, status, fb_post_id=None):
-        """Update post status after publishing"""
-        update = {
-            'status': status,
-            'published_at': datetime.utcnow()
-        }
-        if fb_post_id:
-            update['fb_post_id'] = fb_post_id
-        
-        self.facebook_posts.update_one(
-            {'_id': post_id},
-            {'$set': update}
-        )
-        print(f'✅ Updated post {post_id} status to {status}')
-    
+
+    def save_facebook_posts(self, posts):
+        """Save many posts in one round trip; returns {index: error} for the ones that failed"""
+        prepare_posts(posts)
+        try:
+            self.facebook_posts.insert_many(posts, ordered=False)
+        except BulkWriteError as e:
+            return bulk_errors(e)
+        return {}
+
+    def get_facebook_scheduled_posts(self, until=None, limit=None):
+        """Get Facebook posts due before `until` (default: now), plus posts whose publish lease expired"""
+        cursor = self.facebook_posts.find(due_posts_query(until)).sort('scheduled_at', 1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def claim_facebook_post(self, post_id, owner, lease_seconds):
+        """Atomically lease a due post for publishing; returns None if another instance holds it"""
+        query, update = claim_update(post_id, owner, lease_seconds)
+        return self.facebook_posts.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+
+    def update_facebook_post_status(self, post_id, status, fb_post_id=None, owner=None):
+        """Update post status after publishing; with `owner`, only while that lease is still held"""
+        query, update = status_update(post_id, status, fb_post_id, owner)
+        result = self.facebook_posts.update_one(query, update)
+        log_status_update(post_id, status, result.matched_count)
+        return result.matched_count > 0
+
+    def get_dead_letters(self, server_id, limit=10):
+        """Most recent dead-lettered posts for a server"""
+        return list(self.facebook_dead_letters.find(
+            {'server_id': str(server_id)}
+        ).sort('failed_at', -1).limit(limit))
+
+    def replay_dead_letter(self, letter_id, server_id):
+        """Requeue a dead letter's post and remove the letter
+
+        Returns (letter, post); letter is None if not found, post is None if the post is no longer failed.
+        """
+        letter = self.facebook_dead_letters.find_one({'_id': letter_id, 'server_id': str(server_id)})
+        if not letter:
+            return None, None
+        query, update = replay_update(letter['post_id'])
+        post = self.facebook_posts.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+        if post:
+            self.facebook_dead_letters.delete_one({'_id': letter_id})
+        return letter, post
+
     def get_posts_by_server(self, server_id, limit=10):
         """Get posts for a server"""
         return list(self.facebook_posts.find(
             {'server_id': str(server_id)}
         ).sort('created_at', -1).limit(limit))
-    
+
     # Analytics Methods
     def save_facebook_analytics(self, analytics_data):
-        """Save Facebook post analytics"""
-        analytics_data['fetched_at'] = datetime.utcnow()
-        result = self.facebook_analytics.insert_one(analytics_data)
-        return result.inserted_id
-    
-    def get_analytics(self, post_id):
-        """Get latest analytics for a post"""
+        """Save the latest analytics snapshot for a post (one document per post)"""
+        # Snapshots are not series points: the rollups are fed only by save_analytics_points (the harvester),
+        # so an on-demand fetch never shows up in /fb-analytics until the next harvest
+        query, update = analytics_upsert(analytics_data)
+        self.facebook_analytics.update_one(query, update, upsert=True)
+
+    def aggregate_analytics(self, platform, account_id, since, until=None, top=5):
+        """Run the analytics report pipeline on the server"""
+        pipeline = analytics_pipeline(platform, account_id, since, until, top, self.server_version() >= MONGODB_5_0)
+        return next(self.db['analytics_daily'].aggregate(pipeline, allowDiskUse=True))
+
+    def rebuild_rollups(self, platform=None, account_id=None, batch_size=None):
+        """Rebuild the hourly/daily rollups from analytics_series in streaming batches; returns points read"""
+        query = series_filter(platform, account_id)
+        for collection in ROLLUP_COLLECTIONS:
+            self.db[collection].delete_many(rollup_filter(platform, account_id))
+
+        batch_size = batch_size or config.ROLLUP_BACKFILL_BATCH
+        cursor = self.analytics_series.find(query).sort('ts', 1).batch_size(batch_size)
+        count, batch = 0, []
+        for point in cursor:
+            batch.append(point)
+            if len(batch) >= batch_size:
+                count += self._apply_rollups(batch)
+                batch = []
+        return count + self._apply_rollups(batch)
+
+    def _apply_rollups(self, points):
+        if points:
+            for collection, updates in rollup_updates(points).items():
+                self.db[collection].bulk_write(updates, ordered=False)
+        return len(points)
+
+    def get_analytics(self, post_id, server_id=None, max_age=None):
+        """Get latest analytics for a post (of one server when given), only if fetched within `max_age` seconds"""
         return self.facebook_analytics.find_one(
-            {'post_id': post_id},
+            analytics_query(post_id, server_id, max_age),
+            sort=[('fetched_at', -1)]
+        )
+
+
+class AsyncDatabase(TokenCipher):
+    """Async (Motor) database handler used by the bot, so no PyMongo call blocks the event loop"""
+
+    def __init__(self):
+        """Initialize Motor client (connects lazily on first operation)"""
+        try:
+            self.client = AsyncIOMotorClient(config.MONGODB_URI, **client_options())
+            self.db = self.client[config.DATABASE_NAME]
+
+            # Facebook collections
+            self.facebook_accounts = self.db['facebook_accounts']
+            self.facebook_posts = self.db['facebook_posts']
+            self.facebook_analytics = self.db['facebook_analytics']
+            self.analytics_series = self.db['analytics_series']
+            self.facebook_dead_letters = self.db['facebook_dead_letters']
+            self.facebook_media = self.db['facebook_media']
+            self._server_version = None
+
+            # Decrypted account records, memory-only
+            self.account_cache = TTLCache('account_cache', config.ACCOUNT_CACHE_SIZE, config.ACCOUNT_CACHE_TTL)
+
+            # Initialize encryption
+            super().__init__()
+        except Exception as e:
+            print(f'❌ Database connection failed: {e}')
+            raise
+
+    async def server_version(self):
+        """(major, minor) of the MongoDB server"""
+        if not self._server_version:
+            self._server_version = tuple((await self.db.command('buildInfo'))['versionArray'][:2])
+        return self._server_version
+
+    async def ensure_indexes(self):
+        """Create indexes for the hot query paths; existing ones whose options changed are updated"""
+        cursor = await self.db.list_collections(filter={'name': 'analytics_series'})
+        series = next(iter(await cursor.to_list(length=1)), None)
+        timeseries = series_is_timeseries(series, await self.server_version())
+        if not series:
+            await self.db.create_collection('analytics_series', **(series_options() if timeseries else {}))
+        elif timeseries:
+            await self.db.command(series_ttl_update())
+        for collection, keys, options in index_specs(timeseries):
+            await self._ensure_index(collection, keys, options)
+        if not config.ANALYTICS_TTL_DAYS:
+            for collection, name in TTL_INDEXES:
+                try:
+                    await self.db[collection].drop_index(name)
+                except OperationFailure as e:
+                    if e.code not in (INDEX_NOT_FOUND, NAMESPACE_NOT_FOUND):
+                        raise
+        print('✅ Database indexes ensured')
+
+    async def _ensure_index(self, collection, keys, options):
+        try:
+            await self.db[collection].create_index(keys, **options)
+            return
+        except OperationFailure as e:
+            if e.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+                raise
+            error = e
+
+        # A changed ANALYTICS_TTL_DAYS only needs the expiry updated
+        if 'expireAfterSeconds' in options and error.code == INDEX_OPTIONS_CONFLICT:
+            try:
+                await self.db.command(ttl_update(collection, keys, options))
+                return
+            except OperationFailure:
+                pass  # More than the expiry differs
+        print(f'⚠️ Rebuilding index {options["name"]} on {collection}: {error}')
+        await self.db[collection].drop_index(conflicting_index(keys, options, error))
+        await self.db[collection].create_index(keys, **options)
+
+    # Facebook Account Methods
+    async def save_facebook_account(self, server_id, account_data):
+        """Save Facebook page for a Discord server"""
+        account_data['access_token'] = self.encrypt(account_data['access_token'])
+        account_data['server_id'] = str(server_id)
+        account_data['connected_at'] = datetime.utcnow()
+
+        await self.facebook_accounts.update_one(
+            {'server_id': str(server_id)},
+            {'$set': account_data},
+            upsert=True
+        )
+        self.account_cache.invalidate(str(server_id))
+        print(f'✅ Saved Facebook account for server {server_id}')
+
+    async def get_facebook_account(self, server_id):
+        """Get Facebook page for a server (served from the in-process cache when possible)"""
+        account = self.account_cache.get(str(server_id))
+        if account is not None:
+            return copy.deepcopy(account)
+
+        account = await self.facebook_accounts.find_one({'server_id': str(server_id)})
+        if account and 'access_token' in account:
+            account['access_token'] = self.decrypt(account['access_token'])
+        if account:
+            self.account_cache.set(str(server_id), copy.deepcopy(account))
+        return account
+
+    async def delete_facebook_account(self, server_id):
+        """Delete Facebook account"""
+        result = await self.facebook_accounts.delete_one({'server_id': str(server_id)})
+        self.account_cache.invalidate(str(server_id))
+        print(f'✅ Deleted Facebook account for server {server_id}')
+        return result.deleted_count > 0
+
+    async def iter_facebook_accounts(self):
+        """Yield every connected page with its decrypted token"""
+        projection = {'server_id': 1, 'page_id': 1, 'page_name': 1, 'access_token': 1}
+        async for account in self.facebook_accounts.find({}, projection):
+            if 'access_token' in account:
+                account['access_token'] = self.decrypt(account['access_token'])
+            yield account
+
+    async def watch_account_changes(self):
+        """Invalidate cached accounts changed by other bot instances (needs a replica set)"""
+        while True:
+            try:
+                async with self.facebook_accounts.watch(full_document='updateLookup') as stream:
+                    print('✅ Watching facebook_accounts for changes')
+                    async for change in stream:
+                        document = change.get('fullDocument')
+                        if document and 'server_id' in document:
+                            self.account_cache.invalidate(document['server_id'])
+                        else:
+                            # Deletes only carry the _id, so drop everything
+                            self.account_cache.clear()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f'❌ Account change stream error: {e}')
+                self.account_cache.clear()
+                await asyncio.sleep(config.ACCOUNT_CACHE_TTL)
+
+    # Post Methods
+    async def save_facebook_post(self, post_data):
+        """Save a Facebook post (scheduled or published)"""
+        post_data['created_at'] = datetime.utcnow()
+        result = await self.facebook_posts.insert_one(post_data)
+        print(f'✅ Saved post with ID {result.inserted_id}')
+        return result.inserted_id
+
+    async def save_facebook_posts(self, posts):
+        """Save many posts in one round trip; returns {index: error} for the ones that failed"""
+        prepare_posts(posts)
+        try:
+            await self.facebook_posts.insert_many(posts, ordered=False)
+        except BulkWriteError as e:
+            return bulk_errors(e)
+        return {}
+
+    async def get_facebook_scheduled_posts(self, until=None, limit=None):
+        """Get Facebook posts due before `until` (default: now), plus posts whose publish lease expired"""
+        cursor = self.facebook_posts.find(due_posts_query(until)).sort('scheduled_at', 1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def claim_facebook_post(self, post_id, owner, lease_seconds):
+        """Atomically lease a due post for publishing; returns None if another instance holds it"""
+        query, update = claim_update(post_id, owner, lease_seconds)
+        return await self.facebook_posts.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+
+    async def renew_facebook_post_lease(self, post_id, owner, lease_seconds):
+        """Extend a publish lease; False if it expired and another instance took the post"""
+        query, update = renew_update(post_id, owner, lease_seconds)
+        result = await self.facebook_posts.update_one(query, update)
+        return result.matched_count > 0
+
+    async def record_facebook_post_id(self, post_id, owner, fb_post_id):
+        """Store the Facebook post ID as soon as Graph returns it, before the status is updated
+
+        A later holder of the lease sees it and does not publish the post again.
+        """
+        await self.facebook_posts.update_one({'_id': post_id, 'lease_owner': owner}, {'$set': {'fb_post_id': fb_post_id}})
+
+    async def update_facebook_post_status(self, post_id, status, fb_post_id=None, owner=None):
+        """Update post status after publishing; with `owner`, only while that lease is still held"""
+        query, update = status_update(post_id, status, fb_post_id, owner)
+        result = await self.facebook_posts.update_one(query, update)
+        log_status_update(post_id, status, result.matched_count)
+        return result.matched_count > 0
+
+    async def retry_facebook_post(self, post_id, owner, retry_at, error):
+        """Release a leased post for another attempt at `retry_at`; False if the lease was lost"""
+        query, update = retry_update(post_id, owner, retry_at, error)
+        result = await self.facebook_posts.update_one(query, update)
+        return result.matched_count > 0
+
+    async def dead_letter_facebook_post(self, post, error, retryable=False):
+        """Mark a leased post failed and record it in facebook_dead_letters"""
+        await self.facebook_dead_letters.insert_one(dead_letter(post, error, retryable))
+        query, update = status_update(post['_id'], 'failed', owner=post.get('lease_owner'))
+        update['$set']['last_error'] = error
+        await self.facebook_posts.update_one(query, update)
+
+    async def get_dead_letters(self, server_id, limit=10):
+        """Most recent dead-lettered posts for a server"""
+        cursor = self.facebook_dead_letters.find(
+            {'server_id': str(server_id)}
+        ).sort('failed_at', -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def replay_dead_letter(self, letter_id, server_id):
+        """Requeue a dead letter's post and remove the letter
+
+        Returns (letter, post); letter is None if not found, post is None if the post is no longer failed.
+        """
+        letter = await self.facebook_dead_letters.find_one({'_id': letter_id, 'server_id': str(server_id)})
+        if not letter:
+            return None, None
+        query, update = replay_update(letter['post_id'])
+        post = await self.facebook_posts.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+        if post:
+            await self.facebook_dead_letters.delete_one({'_id': letter_id})
+        return letter, post
+
+    async def get_posts_by_server(self, server_id, limit=10):
+        """Get posts for a server"""
+        cursor = self.facebook_posts.find(
+            {'server_id': str(server_id)}
+        ).sort('created_at', -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    # Media Methods
+    async def get_facebook_photo(self, page_id, content_hash):
+        """Get the unpublished photo ID already uploaded to a page for this content, or None"""
+        doc = await self.facebook_media.find_one({'page_id': page_id, 'hash': content_hash})
+        return doc['photo_id'] if doc else None
+
+    async def save_facebook_photo(self, page_id, content_hash, photo_id):
+        """Remember the photo ID an image was uploaded as on a page"""
+        await self.facebook_media.update_one(
+            {'page_id': page_id, 'hash': content_hash},
+            {'$set': {'photo_id': photo_id, 'uploaded_at': datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def delete_facebook_photo(self, page_id, content_hash):
+        """Forget a photo ID (e.g. Facebook no longer accepts it)"""
+        await self.facebook_media.delete_one({'page_id': page_id, 'hash': content_hash})
+
+    # Analytics Methods
+    async def save_facebook_analytics(self, analytics_data):
+        """Save the latest analytics snapshot for a post (one document per post)"""
+        # Snapshots are not series points: the rollups are fed only by save_analytics_points (the harvester),
+        # so an on-demand fetch never shows up in /fb-analytics until the next harvest
+        query, update = analytics_upsert(analytics_data)
+        await self.facebook_analytics.update_one(query, update, upsert=True)
+
+    async def save_facebook_analytics_many(self, snapshots):
+        """Upsert many analytics snapshots in one round trip"""
+        if snapshots:
+            await self.facebook_analytics.bulk_write(analytics_upserts(snapshots), ordered=False)
+
+    async def save_analytics_points(self, points):
+        """Append harvested metrics to the analytics_series time series and fold them into the rollups"""
+        if points:
+            await self.analytics_series.insert_many(points, ordered=False)
+            await self._apply_rollups(points)
+
+    async def aggregate_analytics(self, platform, account_id, since, until=None, top=5):
+        """Run the analytics report pipeline on the server"""
+        pipeline = analytics_pipeline(platform, account_id, since, until, top, await self.server_version() >= MONGODB_5_0)
+        results = await self.db['analytics_daily'].aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+        return results[0]
+
+    async def rebuild_rollups(self, platform=None, account_id=None, batch_size=None):
+        """Rebuild the hourly/daily rollups from analytics_series in streaming batches; returns points read"""
+        query = series_filter(platform, account_id)
+        for collection in ROLLUP_COLLECTIONS:
+            await self.db[collection].delete_many(rollup_filter(platform, account_id))
+
+        batch_size = batch_size or config.ROLLUP_BACKFILL_BATCH
+        cursor = self.analytics_series.find(query).sort('ts', 1).batch_size(batch_size)
+        count, batch = 0, []
+        async for point in cursor:
+            batch.append(point)
+            if len(batch) >= batch_size:
+                count += await self._apply_rollups(batch)
+                batch = []
+        return count + await self._apply_rollups(batch)
+
+    async def _apply_rollups(self, points):
+        if points:
+            await asyncio.gather(*(
+                self.db[collection].bulk_write(updates, ordered=False)
+                for collection, updates in rollup_updates(points).items()
+            ))
+        return len(points)
+
+    async def get_analytics(self, post_id, server_id=None, max_age=None):
+        """Get latest analytics for a post (of one server when given), only if fetched within `max_age` seconds"""
+        return await self.facebook_analytics.find_one(
+            analytics_query(post_id, server_id, max_age),
             sort=[('fetched_at', -1)]
         )
 
 
-# Global database instance
+# Global database instances
 db = Database()
+async_db = AsyncDatabase()
@@ -0,0 +1,196 @@
+"""
+Facebook Graph API client
+Rate-limited requests over the shared HTTP pool with Graph error parsing and request batching
+"""
+
+import asyncio
+import json
+from urllib.parse import urlencode, urlparse, parse_qsl
+from utils.http import http
+from utils.metrics import metrics
+from utils.ratelimit import facebook_limiter
+import config
+
+
+# Graph error codes worth retrying: unknown/temporary errors and the app, user, page and BUC rate limits
+RETRYABLE_CODES = {1, 2, 4, 17, 32, 341, 613, 80001}
+
+
+class GraphAPIError(Exception):
+    """Error response from the Graph API"""
+
+    def __init__(self, status, body):
+        error = body.get('error', {}) if isinstance(body, dict) else {}
+        self.status = status
+        self.code = error.get('code')
+        self.subcode = error.get('error_subcode')
+        self.message = error.get('message') or str(body)
+        self.transient = bool(error.get('is_transient'))
+        super().__init__(f"{self.message} (HTTP {status}, code {self.code})")
+
+    @property
+    def retryable(self):
+        """Whether the same call may succeed later (server errors, throttling, transient errors)"""
+        return self.transient or self.code in RETRYABLE_CODES or (self.status or 0) >= 500 or self.status == 429
+
+
+def next_page_params(page, params):
+    """Params for the page after `page`, or None when there is no next page"""
+    paging = page.get('paging', {}) if isinstance(page, dict) else {}
+    if not paging.get('next'):
+        return None
+    after = paging.get('cursors', {}).get('after')
+    if after:
+        return {**params, 'after': after}
+    # Time-based paging (since/until) only comes as a full URL
+    return {**params, **dict(parse_qsl(urlparse(paging['next']).query))}
+
+
+class GraphBatcher:
+    """Coalesces GET requests made within a short window into Graph `batch` calls"""
+
+    MAX_BATCH = 50  # Graph API limit per batch call
+
+    def __init__(self, base_url, limiter, window=None):
+        self.base_url = base_url
+        self.limiter = limiter
+        self.window = config.GRAPH_BATCH_WINDOW_MS / 1000 if window is None else window
+        self._pending = {}  # (access_token, page_id, endpoint) -> list of (relative_url, future)
+        self._timers = {}
+        self._flushes = set()  # The event loop only keeps weak references to tasks
+
+    def get(self, path, params, page_id=None, endpoint='read'):
+        """Queue a GET; returns an awaitable resolving to that request's JSON body"""
+        params = dict(params)
+        access_token = params.pop('access_token')
+        relative_url = f"{path}?{urlencode(params)}" if params else path
+
+        key = (access_token, page_id, endpoint)
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((relative_url, future))
+
+        if len(pending) >= self.MAX_BATCH:
+            self._flush_soon(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush_soon, key)
+        return future
+
+    async def batch(self, requests, access_token, page_id=None, endpoint='read'):
+        """Send explicitly grouped (path, params) GETs; returns bodies or GraphAPIError per request"""
+        results = []
+        for start in range(0, len(requests), self.MAX_BATCH):
+            chunk = [
+                f"{path}?{urlencode(params)}" if params else path
+                for path, params in requests[start:start + self.MAX_BATCH]
+            ]
+            results += await self._send(chunk, access_token, page_id, endpoint)
+        return results
+
+    def _flush_soon(self, key):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        pending = self._pending.pop(key, [])
+        if pending:
+            task = asyncio.create_task(self._flush(key, pending))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, key, pending):
+        try:
+            results = await self._send([url for url, _ in pending], *key)
+        except Exception as e:
+            results = [e] * len(pending)
+        for (_, future), result in zip(pending, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _send(self, relative_urls, access_token, page_id, endpoint):
+        """One HTTP call for up to 50 sub-requests; split the responses back out"""
+        await self.limiter.acquire(page_id, endpoint)
+        metrics.observe('graph.batch_size', len(relative_urls))
+
+        data = {
+            'access_token': access_token,
+            'include_headers': 'false',
+            'batch': json.dumps([{'method': 'GET', 'relative_url': url} for url in relative_urls])
+        }
+        async with http.session.post(f"{self.base_url}/", data=data) as resp:
+            self.limiter.update_from_headers(resp.headers, page_id)
+            body = await resp.json(content_type=None)
+            if resp.status != 200:
+                raise GraphAPIError(resp.status, body)
+
+        results = []
+        for item in body:
+            if item is None:
+                results.append(GraphAPIError(504, {'error': {'message': 'Batch sub-request timed out'}}))
+                continue
+            try:
+                item_body = json.loads(item.get('body') or '{}')
+            except ValueError:
+                item_body = item.get('body')
+            if item.get('code') != 200:
+                results.append(GraphAPIError(item.get('code'), item_body))
+            else:
+                results.append(item_body)
+        return results
+
+
+class GraphAPI:
+    """Client for the Facebook Graph API"""
+
+    def __init__(self, base_url, limiter):
+        self.base_url = base_url
+        self.limiter = limiter
+        self.batcher = GraphBatcher(base_url, limiter)
+
+    async def request(self, method, path, params=None, data=None, page_id=None, endpoint='read'):
+        """Make a Graph API call and return the JSON body, raising GraphAPIError on failure"""
+        await self.limiter.acquire(page_id, endpoint)
+
+        url = f"{self.base_url}/{path}"
+        async with http.session.request(method, url, params=params, data=data) as resp:
+            self.limiter.update_from_headers(resp.headers, page_id)
+            try:
+                body = await resp.json(content_type=None)
+            except ValueError:
+                body = await resp.text()
+            if resp.status != 200:
+                raise GraphAPIError(resp.status, body)
+            return body
+
+    async def get(self, path, params, page_id=None, endpoint='read'):
+        return await self.request('GET', path, params=params, page_id=page_id, endpoint=endpoint)
+
+    async def paginate(self, path, params, page_id=None, page_size=25, fields=None, limit=None, endpoint='read'):
+        """Yield items from a cursor-paginated edge page by page; stop early after `limit` items"""
+        params = {**params, 'limit': min(page_size, limit) if limit else page_size}
+        if fields:
+            params['fields'] = fields
+
+        yielded = 0
+        while params is not None:
+            page = await self.get(path, params, page_id=page_id, endpoint=endpoint)
+            for item in page.get('data', []):
+                yield item
+                yielded += 1
+                if limit and yielded >= limit:
+                    return
+            params = next_page_params(page, params)
+
+    async def post(self, path, params, page_id=None, endpoint='publish'):
+        return await self.request('POST', path, params=params, page_id=page_id, endpoint=endpoint)
+
+    async def delete(self, path, params, page_id=None, endpoint='publish'):
+        return await self.request('DELETE', path, params=params, page_id=page_id, endpoint=endpoint)
+
+
+# Global Graph API clients (video uploads have their own host)
+graph = GraphAPI(config.FACEBOOK_GRAPH_URL, facebook_limiter)
+graph_video = GraphAPI(config.FACEBOOK_VIDEO_URL, facebook_limiter)
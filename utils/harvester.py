@@ -0,0 +1,192 @@
+"""
+Background analytics harvester
+Periodically collects insights for recent posts of every connected Facebook page and Instagram user
+"""
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from datetime import datetime
+import asyncio
+import functools
+import math
+import time
+from utils.graph import graph, GraphBatcher
+from utils.instagram import instagram, users, _account_key
+from utils.insights import insights, parse_insights, FACEBOOK_METRICS
+from utils.metrics import metrics
+from utils.ratelimit import facebook_limiter, instagram_limiter
+import config
+
+HEADROOM_POLL_SECONDS = 5
+
+
+class AnalyticsHarvester:
+    """Keeps facebook_analytics snapshots current and appends every run to the analytics_series time series"""
+
+    def __init__(self):
+        self.scheduler = AsyncIOScheduler()
+        self.db = None
+        self.is_running = False
+        self._offset = 0  # Where the next run starts in the account list
+
+    def start(self, db):
+        """Harvest every ANALYTICS_HARVEST_INTERVAL seconds, starting now"""
+        if self.is_running or not config.ANALYTICS_HARVEST_INTERVAL:
+            return
+        self.db = db
+        self.scheduler.add_job(
+            self.harvest,
+            'interval',
+            seconds=config.ANALYTICS_HARVEST_INTERVAL,
+            id='harvest_analytics',
+            name='Harvest Post Analytics',
+            next_run_time=datetime.now(),
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True  # The job survives a stop/start when the cog is reloaded
+        )
+        if not self.scheduler.running:
+            self.scheduler.start()
+        self.is_running = True
+        print(f'✅ Analytics harvester started (runs every {config.ANALYTICS_HARVEST_INTERVAL}s)')
+
+    def stop(self):
+        """Stop harvesting"""
+        if self.is_running:
+            self.scheduler.shutdown()
+            self.is_running = False
+
+    async def harvest(self):
+        """Collect insights for all pages and accounts, a few at a time, within the run's call budget"""
+        started = time.monotonic()
+        semaphore = asyncio.Semaphore(config.ANALYTICS_HARVEST_CONCURRENCY)
+        budget = [config.ANALYTICS_HARVEST_MAX_CALLS]
+
+        # (limiter, page id, Graph calls it makes, job)
+        posts = config.ANALYTICS_HARVEST_POSTS
+        jobs = [
+            (facebook_limiter, account['page_id'], 1 + math.ceil(posts / GraphBatcher.MAX_BATCH),
+             functools.partial(self.harvest_facebook_page, account))
+            async for account in self.db.iter_facebook_accounts()
+        ]
+        jobs += [
+            (instagram_limiter, _account_key({'access_token': user['instagram_token']}), 1 + posts,
+             functools.partial(self.harvest_instagram_user, user))
+            for user in await users.all_users()
+        ]
+        # Start with the accounts the last run had no budget left for
+        offset = self._offset % len(jobs) if jobs else 0
+        jobs = jobs[offset:] + jobs[:offset]
+
+        async def bounded(limiter, page_id, calls, job):
+            async with semaphore:
+                if calls > budget[0]:
+                    return None
+                budget[0] -= calls
+                await self.wait_for_headroom(limiter, calls, page_id)
+                try:
+                    return await job()
+                except Exception as e:
+                    metrics.incr('harvester.errors')
+                    print(f'❌ Error harvesting analytics: {e}')
+                    return 0
+
+        results = await asyncio.gather(*(bounded(*job) for job in jobs))
+        skipped = [index for index, result in enumerate(results) if result is None]
+        self._offset = offset + skipped[0] if skipped else 0
+        harvested = sum(result for result in results if result)
+
+        metrics.incr('harvester.posts', harvested)
+        metrics.incr('harvester.skipped', len(skipped))
+        metrics.observe('harvester.run_seconds', time.monotonic() - started)
+        print(f'📊 Harvested analytics for {harvested} posts' + (f', {len(skipped)} accounts left for the next run' if skipped else ''))
+
+    async def wait_for_headroom(self, limiter, calls, page_id=None):
+        """Hold back while commands need the rate limits; the harvester never queues ahead of them"""
+        while not limiter.can_spare(calls, page_id, 'insights', config.ANALYTICS_HARVEST_RESERVE):
+            metrics.incr('harvester.yielded')
+            await asyncio.sleep(HEADROOM_POLL_SECONDS)
+
+    async def harvest_facebook_page(self, account):
+        """Insights for a page's recent posts, fetched in Graph batch calls"""
+        page_id = account['page_id']
+        token = account['access_token']
+        posts = [
+            post async for post in graph.paginate(
+                f"{page_id}/posts",
+                {'access_token': token},
+                page_id=page_id,
+                page_size=config.ANALYTICS_HARVEST_POSTS,
+                fields='id,status_type',
+                limit=config.ANALYTICS_HARVEST_POSTS
+            )
+        ]
+        results = await graph.batcher.batch(
+            [(f"{post['id']}/insights", {'metric': FACEBOOK_METRICS}) for post in posts],
+            token, page_id=page_id, endpoint='insights'
+        )
+
+        now = datetime.utcnow()
+        snapshots, points = [], []
+        for post, data in zip(posts, results):
+            if isinstance(data, Exception):
+                metrics.incr('harvester.post_errors')
+                continue
+            values = parse_insights(data)
+            snapshots.append({'post_id': post['id'], 'server_id': account['server_id'], **values})
+            points.append({
+                'ts': now,
+                'meta': {
+                    'platform': 'facebook',
+                    'post_id': post['id'],
+                    'account_id': page_id,
+                    'server_id': account['server_id'],
+                    'media_type': post.get('status_type', 'unknown')
+                },
+                **values
+            })
+
+        await self.db.save_facebook_analytics_many(snapshots)
+        await self.db.save_analytics_points(points)
+        return len(points)
+
+    async def harvest_instagram_user(self, user):
+        """Insights for an Instagram user's recent media; also refreshes the in-memory insights cache"""
+        token = user['instagram_token']
+        posts = [
+            post async for post in instagram.paginate(
+                "me/media",
+                {"access_token": token},
+                page_size=config.ANALYTICS_HARVEST_POSTS,
+                fields="id,media_type",
+                limit=config.ANALYTICS_HARVEST_POSTS
+            )
+        ]
+        responses = await asyncio.gather(*(
+            insights.refresh_instagram(post['id'], post.get('media_type', 'IMAGE'), token, user['discord_id'])
+            for post in posts
+        ))
+
+        now = datetime.utcnow()
+        points = []
+        for post, resp in zip(posts, responses):
+            if "data" not in resp:
+                metrics.incr('harvester.post_errors')
+                continue
+            points.append({
+                'ts': now,
+                'meta': {
+                    'platform': 'instagram',
+                    'post_id': post['id'],
+                    'account_id': user['instagram_id'] or user['username'],
+                    'discord_id': user['discord_id'],
+                    'media_type': post.get('media_type', 'IMAGE')
+                },
+                **parse_insights(resp)
+            })
+
+        await self.db.save_analytics_points(points)
+        return len(points)
+
+
+# Global analytics harvester
+harvester = AnalyticsHarvester()
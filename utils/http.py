@@ -0,0 +1,101 @@
+"""
+Shared HTTP client for the bot
+Keeps one pooled aiohttp session alive for all Graph API traffic
+"""
+
+import aiohttp
+import time
+from utils.metrics import metrics
+import config
+
+
+class HttpClient:
+    """Bot-wide aiohttp session with a keep-alive connection pool"""
+
+    def __init__(self):
+        self._session = None
+        self._requests = 0
+        self._connections_created = 0
+        self._connections_reused = 0
+        self._queued = 0
+        self._queue_wait_total = 0.0
+
+    @property
+    def session(self):
+        """Return the shared session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=config.HTTP_POOL_SIZE,
+                limit_per_host=config.HTTP_POOL_SIZE_PER_HOST,
+                ttl_dns_cache=config.HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=config.HTTP_TOTAL_TIMEOUT,
+                connect=config.HTTP_CONNECT_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                trace_configs=[self._trace_config()]
+            )
+            print('✅ HTTP connection pool opened')
+        return self._session
+
+    async def close(self):
+        """Close the shared session and its connection pool"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+            print('✅ HTTP connection pool closed')
+        self._session = None
+
+    def _trace_config(self):
+        """Hook connection pool events to collect statistics"""
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self._requests += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self._connections_created += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self._connections_reused += 1
+
+        async def on_connection_queued_start(session, ctx, params):
+            ctx.queued_at = time.monotonic()
+
+        async def on_connection_queued_end(session, ctx, params):
+            self._queued += 1
+            self._queue_wait_total += time.monotonic() - ctx.queued_at
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_connection_queued_start.append(on_connection_queued_start)
+        trace.on_connection_queued_end.append(on_connection_queued_end)
+        return trace
+
+    def stats(self):
+        """Get connection pool statistics"""
+        open_connections = 0
+        if self._session and not self._session.closed:
+            connector = self._session.connector
+            idle = sum(len(conns) for conns in getattr(connector, '_conns', {}).values())
+            open_connections = idle + len(getattr(connector, '_acquired', ()))
+
+        acquired = self._connections_created + self._connections_reused
+        return {
+            'requests': self._requests,
+            'open_connections': open_connections,
+            'connections_created': self._connections_created,
+            'connections_reused': self._connections_reused,
+            'reuse_ratio': self._connections_reused / acquired if acquired else 0.0,
+            'queued_requests': self._queued,
+            'avg_queue_wait_ms': (self._queue_wait_total / self._queued * 1000) if self._queued else 0.0
+        }
+
+
+# Global HTTP client
+http = HttpClient()
+metrics.gauge('http', http.stats)
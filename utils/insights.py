@@ -0,0 +1,96 @@
+"""
+Read-through post insights
+Facebook snapshots are served from MongoDB while fresh, Instagram insights from memory;
+concurrent requests for the same post share one Graph API call
+"""
+
+from utils.cache import TTLCache, SingleFlight
+from utils.database import async_db
+from utils.graph import graph
+from utils.instagram import instagram
+from utils.metrics import metrics
+import config
+
+FACEBOOK_METRICS = 'post_impressions,post_engaged_users,post_clicks,post_reactions_by_type_total'
+
+INSTAGRAM_METRICS = {
+    "image": "reach,likes,comments,saved",
+    "video": "reach,likes,comments,video_views,shares",
+    "reels": "reach,likes,comments,plays,shares,saved"
+}
+
+SNAPSHOT_FIELDS = ('_id', 'post_id', 'server_id', 'fetched_at')
+
+
+def parse_insights(data):
+    """Flatten a Graph insights response into {metric: latest value}"""
+    insights = {}
+    for item in data.get('data', []):
+        values = item.get('values', [])
+        if values:
+            insights[item['name']] = values[-1].get('value')
+    return insights
+
+
+class InsightsCache:
+    """Insights for Facebook and Instagram posts with a freshness window and single-flight fetching"""
+
+    def __init__(self, freshness=None):
+        self.freshness = freshness or config.INSIGHTS_FRESHNESS_SECONDS
+        if freshness is None and config.ANALYTICS_HARVEST_INTERVAL:
+            # The harvester keeps snapshots current, serve them until the next run is overdue
+            self.freshness = max(self.freshness, config.ANALYTICS_HARVEST_INTERVAL * 2)
+        self.flights = SingleFlight('insights')
+        self.instagram_cache = TTLCache('instagram_insights', config.INSIGHTS_CACHE_SIZE, self.freshness)
+
+    async def facebook(self, post_id, server_id, page_id, access_token):
+        """Latest insights for a Facebook post; raises GraphAPIError if they have to be fetched and that fails"""
+        snapshot = await async_db.get_analytics(post_id, server_id, max_age=self.freshness)
+        if snapshot:
+            metrics.incr('insights.facebook.fresh')
+            return {key: value for key, value in snapshot.items() if key not in SNAPSHOT_FIELDS}
+
+        # Keyed per server: a call made with one page's token must not answer another server
+        return await self.flights.do(
+            ('facebook', str(server_id), post_id),
+            lambda: self._fetch_facebook(post_id, server_id, page_id, access_token)
+        )
+
+    async def _fetch_facebook(self, post_id, server_id, page_id, access_token):
+        metrics.incr('insights.facebook.fetched')
+        params = {'metric': FACEBOOK_METRICS, 'access_token': access_token}
+        data = await graph.batcher.get(f"{post_id}/insights", params, page_id=page_id, endpoint='insights')
+
+        insights = parse_insights(data)
+        # Snapshot only, no series point: the post's status_type (the rollups' media_type) is not known here
+        await async_db.save_facebook_analytics({'post_id': post_id, 'server_id': server_id, **insights})
+        return insights
+
+    async def instagram(self, post_id, media_type, access_token, discord_id):
+        """Insights response for an Instagram post; only successful responses are cached
+
+        Responses are cached per Discord user, so each user only sees what their own token fetched.
+        """
+        cached = self.instagram_cache.get((str(discord_id), post_id))
+        if cached is not None:
+            return cached
+        return await self.refresh_instagram(post_id, media_type, access_token, discord_id)
+
+    async def refresh_instagram(self, post_id, media_type, access_token, discord_id):
+        """Fetch an Instagram post's insights even if a cached response is still fresh"""
+        return await self.flights.do(
+            ('instagram', str(discord_id), post_id),
+            lambda: self._fetch_instagram(post_id, media_type, access_token, discord_id)
+        )
+
+    async def _fetch_instagram(self, post_id, media_type, access_token, discord_id):
+        metrics.incr('insights.instagram.fetched')
+        params = {"metric": INSTAGRAM_METRICS.get(media_type.lower(), "reach,likes,comments"), "access_token": access_token}
+        resp = await instagram.batch_get(f"{post_id}/insights", params, endpoint_class='insights')
+        if "data" in resp and isinstance(resp["data"], list):
+            self.instagram_cache.set((str(discord_id), post_id), resp)
+        return resp
+
+
+# Global insights cache
+insights = InsightsCache()
@@ -0,0 +1,275 @@
+"""
+Instagram helpers for the Discord bot
+Async Graph API client and async SQLite user store
+"""
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import random
+import sqlite3
+import time
+from utils.http import http
+from utils.graph import GraphBatcher, GraphAPIError, next_page_params
+from utils.metrics import metrics
+from utils.ratelimit import instagram_limiter
+import config
+
+
+class InstagramClient:
+    """Async client for the Instagram Graph API"""
+
+    def __init__(self):
+        self.base_url = config.INSTAGRAM_GRAPH_URL
+        self.limiter = instagram_limiter
+        self.batcher = GraphBatcher(self.base_url, self.limiter)
+
+    async def _acquire(self, params, endpoint):
+        """Wait for the app, account (keyed by token) and endpoint-class rate limits"""
+        account = _account_key(params)
+        await self.limiter.acquire(account, endpoint)
+        return account
+
+    async def get(self, endpoint, params, endpoint_class='read'):
+        """GET an Instagram Graph endpoint and return the JSON body"""
+        account = await self._acquire(params, endpoint_class)
+        async with http.session.get(f"{self.base_url}/{endpoint}", params=params) as resp:
+            self.limiter.update_from_headers(resp.headers, account)
+            return await resp.json(content_type=None)
+
+    async def batch_get(self, endpoint, params, endpoint_class='read'):
+        """GET that is coalesced with concurrent reads into one batch call when enabled"""
+        if not config.INSTAGRAM_BATCH_REQUESTS:
+            return await self.get(endpoint, params, endpoint_class)
+        try:
+            return await self.batcher.get(endpoint, params, _account_key(params), endpoint_class)
+        except GraphAPIError as e:
+            return {"error": e.message, "status_code": e.status}
+
+    async def paginate(self, endpoint, params, page_size=25, fields=None, limit=None):
+        """Yield items from a cursor-paginated edge page by page; stop early after `limit` items"""
+        params = {**params, 'limit': min(page_size, limit) if limit else page_size}
+        if fields:
+            params['fields'] = fields
+
+        yielded = 0
+        while params is not None:
+            page = await self.get(endpoint, params)
+            if 'error' in page:
+                raise GraphAPIError(400, page)
+            for item in page.get('data', []):
+                yield item
+                yielded += 1
+                if limit and yielded >= limit:
+                    return
+            params = next_page_params(page, params)
+
+    async def post(self, endpoint, params, endpoint_class='publish'):
+        """POST form data to an Instagram Graph endpoint"""
+        account = await self._acquire(params, endpoint_class)
+        async with http.session.post(f"{self.base_url}/{endpoint}", data=params) as resp:
+            self.limiter.update_from_headers(resp.headers, account)
+            text = await resp.text()
+            try:
+                return await resp.json(content_type=None)
+            except ValueError:
+                return {"error": "invalid_json_response", "status_code": resp.status, "text": text}
+
+    async def delete(self, endpoint, params, endpoint_class='publish'):
+        """DELETE an Instagram Graph object"""
+        account = await self._acquire(params, endpoint_class)
+        async with http.session.delete(f"{self.base_url}/{endpoint}", params=params) as resp:
+            self.limiter.update_from_headers(resp.headers, account)
+            text = await resp.text()
+            return await resp.json(content_type=None) if text else {"status": "success"}
+
+
+def _account_key(params):
+    """Stable per-account rate-limit key that does not keep the raw token around"""
+    token = params.get('access_token')
+    return hashlib.sha256(token.encode()).hexdigest()[:16] if token else None
+
+
+class MediaContainerError(Exception):
+    """A media container failed processing, expired or timed out"""
+
+
+class ContainerTracker:
+    """Polls every in-flight media container from a single loop and publishes each one when it is ready"""
+
+    def __init__(self, client):
+        self.client = client
+        self._queue = []  # heap of (next_poll_at, seq, job)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+
+        metrics.gauge('instagram.containers_in_flight', lambda: len(self._queue))
+
+    def start(self):
+        """Start the polling loop"""
+        if not self._task:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Stop the polling loop; pending containers are failed"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for _, _, job in self._queue:
+            if not job['future'].done():
+                job['future'].set_exception(MediaContainerError('Bot is shutting down'))
+        self._queue = []
+
+    def track(self, creation_id, ig_id, token):
+        """Track a container; returns a future resolving to the media_publish response"""
+        now = time.monotonic()
+        job = {
+            'creation_id': creation_id,
+            'ig_id': ig_id,
+            'token': token,
+            'attempt': 0,
+            'started_at': now,
+            'deadline': now + config.INSTAGRAM_CONTAINER_TIMEOUT,
+            'future': asyncio.get_running_loop().create_future()
+        }
+        self._push(job, now + config.INSTAGRAM_CONTAINER_POLL_INITIAL)
+        return job['future']
+
+    def _push(self, job, poll_at):
+        heapq.heappush(self._queue, (poll_at, next(self._seq), job))
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+
+            now = time.monotonic()
+            due = []
+            while self._queue and self._queue[0][0] <= now:
+                due.append(heapq.heappop(self._queue)[2])
+            if due:
+                await asyncio.gather(*(self._poll(job) for job in due))
+
+            timeout = None
+            if self._queue:
+                timeout = max(self._queue[0][0] - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, job):
+        future = job['future']
+        try:
+            status = await self.client.get(job['creation_id'], {"fields": "status_code", "access_token": job['token']})
+            code = status.get("status_code")
+
+            if code == "FINISHED":
+                publish_resp = await self.client.post(
+                    f"{job['ig_id']}/media_publish",
+                    {"creation_id": job['creation_id'], "access_token": job['token']}
+                )
+                metrics.observe('instagram.container_ready_seconds', time.monotonic() - job['started_at'])
+                if "id" in publish_resp:
+                    future.set_result(publish_resp)
+                else:
+                    future.set_exception(MediaContainerError(f"Publish failed: {publish_resp}"))
+            elif code in ("ERROR", "EXPIRED"):
+                future.set_exception(MediaContainerError(f"Media processing {code.lower()}: {status}"))
+            elif time.monotonic() >= job['deadline']:
+                future.set_exception(MediaContainerError(
+                    f"Media not ready after {config.INSTAGRAM_CONTAINER_TIMEOUT}s (last status: {code})"
+                ))
+            else:
+                # Exponential backoff with jitter
+                job['attempt'] += 1
+                delay = min(
+                    config.INSTAGRAM_CONTAINER_POLL_INITIAL * 2 ** job['attempt'],
+                    config.INSTAGRAM_CONTAINER_POLL_MAX
+                )
+                self._push(job, time.monotonic() + delay * random.uniform(0.5, 1.0))
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+
+class UserStore:
+    """SQLite store for Instagram users, run off the event loop"""
+
+    def __init__(self, path=None):
+        self.path = path or config.INSTAGRAM_DB_PATH
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                discord_id TEXT NOT NULL UNIQUE,
+                username TEXT NOT NULL,
+                instagram_token TEXT NOT NULL,
+                instagram_id TEXT
+            );
+        ''')
+        conn.close()
+
+    def _insert_user(self, discord_id, username, token, instagram_id):
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO users (discord_id, username, instagram_token, instagram_id)
+                VALUES (?, ?, ?, ?)
+            ''', (discord_id, username, token, instagram_id))
+        conn.close()
+
+    def _remove_user(self, discord_id):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM users WHERE discord_id = ?', (discord_id,))
+        conn.close()
+
+    def _get_user(self, discord_id):
+        conn = self._connect()
+        row = conn.execute('SELECT * FROM users WHERE discord_id = ?', (str(discord_id),)).fetchone()
+        conn.close()
+        return row
+
+    def _all_users(self):
+        conn = self._connect()
+        rows = conn.execute('SELECT * FROM users').fetchall()
+        conn.close()
+        return rows
+
+    async def init_db(self):
+        """Create the users table if needed"""
+        await asyncio.to_thread(self._init_db)
+
+    async def insert_user(self, discord_id, username, token, instagram_id=None):
+        """Register or replace an Instagram user"""
+        await asyncio.to_thread(self._insert_user, discord_id, username, token, instagram_id)
+
+    async def remove_user(self, discord_id):
+        """Remove an Instagram user"""
+        await asyncio.to_thread(self._remove_user, discord_id)
+
+    async def get_user(self, discord_id):
+        """Get an Instagram user row by Discord ID"""
+        return await asyncio.to_thread(self._get_user, discord_id)
+
+    async def all_users(self):
+        """Get every registered Instagram user"""
+        return await asyncio.to_thread(self._all_users)
+
+
+# Global Instagram client, container tracker and user store
+instagram = InstagramClient()
+containers = ContainerTracker(instagram)
+users = UserStore()
@@ -0,0 +1,215 @@
+"""
+Image preprocessing before publishing
+Validates, resizes, recompresses and strips metadata in a process pool, cached by content hash in the media store
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import hashlib
+import io
+import mimetypes
+from utils.cache import TTLCache, SingleFlight
+from utils.http import http
+from utils.mediastore import store
+from utils.metrics import metrics
+import config
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, without it images are posted untouched
+    Image = None
+
+
+class MediaError(ValueError):
+    """The image can not be posted to the platform"""
+
+
+# What each platform accepts; still images are re-encoded as JPEG
+PROFILES = {
+    'facebook': {
+        'max_side': config.MEDIA_FACEBOOK_MAX_SIDE,
+        'min_side': 1,
+        'aspect': None
+    },
+    'instagram': {
+        'max_side': config.MEDIA_INSTAGRAM_MAX_SIDE,
+        'min_side': 320,
+        'aspect': (4 / 5, 1.91)  # Portrait 4:5 to landscape 1.91:1
+    }
+}
+INPUT_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF', 'BMP', 'TIFF', 'MPO'}
+
+
+def process_image(data, platform):
+    """Validate and re-encode one image (runs in a worker process)
+
+    Returns (image bytes, info). Raises MediaError for images the platform would reject.
+    """
+    profile = PROFILES[platform]
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception:
+        raise MediaError('Not a readable image')
+
+    if image.format not in INPUT_FORMATS:
+        raise MediaError(f'Unsupported image format {image.format}')
+    width, height = image.size
+    if width * height > config.MEDIA_MAX_PIXELS:
+        raise MediaError(f'Image is too large ({width}x{height})')
+    if min(width, height) < profile['min_side']:
+        raise MediaError(f'Image is too small ({width}x{height}), the shorter side must be at least {profile["min_side"]}px')
+    if getattr(image, 'is_animated', False):
+        if platform == 'instagram':
+            raise MediaError('Animated images are not supported')
+        # Re-encoding would drop the animation, Facebook gets the original file
+        return data, {'width': width, 'height': height, 'original_bytes': len(data), 'bytes': len(data),
+                      'content_type': f'image/{image.format.lower()}'}
+
+    # Apply the EXIF orientation before the metadata is dropped
+    image = ImageOps.exif_transpose(image)
+    width, height = image.size
+    if profile['aspect']:
+        low, high = profile['aspect']
+        if not low <= width / height <= high:
+            raise MediaError(f'Aspect ratio {width / height:.2f} is outside {low:.2f}-{high:.2f}')
+
+    if image.mode != 'RGB':
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    image.thumbnail((profile['max_side'], profile['max_side']), Image.LANCZOS)
+
+    # A fresh save without exif/icc/comments strips the metadata
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=config.MEDIA_JPEG_QUALITY, optimize=True, progressive=True)
+    return out.getvalue(), {
+        'width': image.width,
+        'height': image.height,
+        'original_bytes': len(data),
+        'bytes': out.tell(),
+        'content_type': 'image/jpeg'
+    }
+
+
+def upload_filename(image):
+    """Upload file name for a prepared image, with the extension of its actual format"""
+    extension = mimetypes.guess_extension(image.get('content_type') or '') or '.jpg'
+    return f"{image['hash'][:16]}{extension}"
+
+
+def meta_name(key):
+    """Media store metadata record for a (source hash, platform) key"""
+    source_hash, platform = key
+    return f'{source_hash}.{platform}'
+
+
+class MediaProcessor:
+    """Prepares images for publishing without blocking the event loop"""
+
+    def __init__(self):
+        self._executor = None
+        self._prepared = TTLCache('media.prepared', config.MEDIA_CACHE_SIZE, config.MEDIA_CACHE_TTL)  # (hash, platform) -> image info
+        self._urls = TTLCache('media.urls', config.MEDIA_CACHE_SIZE, config.MEDIA_CACHE_TTL)  # (url, platform) -> (hash, platform)
+        self._flight = SingleFlight('media')
+
+    @property
+    def available(self):
+        """Whether Pillow is installed"""
+        return Image is not None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=config.MEDIA_WORKERS or None)
+        return self._executor
+
+    def close(self):
+        """Stop the worker processes"""
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def download(self, url):
+        """Fetch an image, refusing anything over MEDIA_MAX_DOWNLOAD_BYTES; returns (data, content type)"""
+        async with http.session.get(url) as resp:
+            if resp.status >= 500:
+                resp.raise_for_status()  # Worth retrying later
+            if resp.status != 200:
+                raise MediaError(f'Could not download the image (HTTP {resp.status})')
+            if (resp.content_length or 0) > config.MEDIA_MAX_DOWNLOAD_BYTES:
+                raise MediaError('Image file is too large')
+            data = bytearray()
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                data += chunk
+                if len(data) > config.MEDIA_MAX_DOWNLOAD_BYTES:
+                    raise MediaError('Image file is too large')
+        return bytes(data), resp.content_type
+
+    async def prepare(self, url, platform):
+        """Get the image for `url` as a dict (data, hash, source_hash, content_type, width, height, ...)
+
+        Without Pillow the downloaded file is returned as-is (hash == source_hash).
+        Raises MediaError for invalid images.
+        """
+        key = self._urls.get((url, platform))
+        image = await self._load(key) if key else None
+        if image:
+            return image
+
+        data, content_type = await self.download(url)
+        key = (hashlib.sha256(data).hexdigest(), platform)
+        image = await self._load(key)
+        if not image:
+            image = await self._flight.do(key, lambda: self._process(data, content_type, key))
+        self._urls.set((url, platform), key)
+        return image
+
+    async def _load(self, key):
+        """Cached image for a (source hash, platform) key, with its bytes read back from the media store
+
+        Falls back to the store's metadata record, so images processed before a restart are not processed again.
+        """
+        info = self._prepared.get(key)
+        if not info:
+            info = await store.get_meta(meta_name(key))
+            if not info:
+                return None
+            self._prepared.set(key, info)
+        data = await store.get(info['hash'])
+        if data is None:
+            self._prepared.invalidate(key)
+            return None
+        return {**info, 'data': data}
+
+    async def _process(self, data, content_type, key):
+        if self.available:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            try:
+                data, info = await loop.run_in_executor(self.executor, process_image, data, key[1])
+            except MediaError:
+                metrics.incr('media.rejected')
+                raise
+            metrics.observe('media.process_seconds', loop.time() - started)
+            metrics.incr('media.saved_bytes', max(info['original_bytes'] - info['bytes'], 0))
+        else:
+            info = {'original_bytes': len(data), 'bytes': len(data), 'content_type': content_type}
+
+        # Only the metadata stays in memory, the bytes live in the on-disk store
+        info = {'hash': await store.put(data), 'source_hash': key[0], **info}
+        self._prepared.set(key, info)
+        await store.put_meta(meta_name(key), info)
+        return {**info, 'data': data}
+
+
+def photo_reuse_ratio():
+    """Share of Facebook photo posts that attached an already uploaded photo"""
+    reused = metrics.counters.get('media.photo_reused', 0)
+    uploaded = metrics.counters.get('media.photo_uploaded', 0)
+    return reused / (reused + uploaded) if reused + uploaded else 0.0
+
+
+# Global media processor
+media = MediaProcessor()
+metrics.gauge('media.photo_reuse_ratio', photo_reuse_ratio)
@@ -0,0 +1,164 @@
+"""
+Content-addressed media store on local disk
+Files are named by their SHA-256; the least recently used ones are deleted when over the size limit
+Small JSON metadata records (under meta/) describe how a source file was processed, so disk hits survive restarts;
+they share the LRU index and size limit with the files
+"""
+
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import os
+from utils.metrics import metrics
+import config
+
+
+class MediaStore:
+    """Size-bounded LRU blob store; file access runs in worker threads, off the event loop"""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()  # hash or 'meta/<name>' -> size, least recently used first
+        self._size = 0
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        metrics.gauge('media_store.bytes', lambda: self._size)
+        metrics.gauge('media_store.files', lambda: len(self._index))
+        metrics.gauge('media_store.hit_ratio', self.hit_ratio)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def meta_path(self, name):
+        return os.path.join(self.root, 'meta', f'{name}.json')
+
+    def _file(self, key):
+        """Path of an index key: a content hash, or a metadata record as 'meta/<name>'"""
+        if key.startswith('meta/'):
+            return self.meta_path(key[len('meta/'):])
+        return self.path(key)
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _scan(self):
+        """Files already on disk, least recently used first (access time is bumped on every read)"""
+        files = []
+        meta = os.path.join(self.root, 'meta')
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                stat = os.stat(os.path.join(folder, name))
+                key = f'meta/{name[:-len(".json")]}' if folder == meta else name
+                files.append((stat.st_mtime, key, stat.st_size))
+        return [(key, size) for _, key, size in sorted(files)]
+
+    async def _load(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            for key, size in await asyncio.to_thread(self._scan):
+                self._index[key] = size
+                self._size += size
+            # Only now, so concurrent callers wait for the scan instead of seeing an empty index
+            self._loaded = True
+            await self._evict()
+
+    def _write(self, key, data):
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a crash never leaves a truncated file under the final name
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _read(self, key):
+        path = self._file(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Recency survives restarts
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _remove(self, key):
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    async def _evict(self):
+        while self._size > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._size -= size
+            metrics.incr('media_store.evicted')
+            await asyncio.to_thread(self._remove, key)
+
+    async def put(self, data):
+        """Store bytes and return their SHA-256 hex digest"""
+        await self._load()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self._index:
+            self._index.move_to_end(digest)
+            return digest
+
+        await asyncio.to_thread(self._write, digest, data)
+        self._index[digest] = len(data)
+        self._size += len(data)
+        await self._evict()
+        return digest
+
+    async def get(self, digest):
+        """Bytes stored under a digest, or None"""
+        await self._load()
+        data = await asyncio.to_thread(self._read, digest) if digest in self._index else None
+        if data is None:
+            if digest in self._index:
+                self._size -= self._index.pop(digest)
+            self.misses += 1
+            metrics.incr('media_store.misses')
+            return None
+
+        self._index.move_to_end(digest)
+        self.hits += 1
+        metrics.incr('media_store.hits')
+        return data
+
+    async def put_meta(self, name, record):
+        """Save a small JSON record under a name"""
+        await self._load()
+        key = f'meta/{name}'
+        data = json.dumps(record).encode()
+        await asyncio.to_thread(self._write, key, data)
+        self._size += len(data) - self._index.pop(key, 0)
+        self._index[key] = len(data)
+        await self._evict()
+
+    async def get_meta(self, name):
+        """JSON record saved under a name, or None"""
+        await self._load()
+        key = f'meta/{name}'
+        data = await asyncio.to_thread(self._read, key) if key in self._index else None
+        if data is None:
+            if key in self._index:
+                self._size -= self._index.pop(key)
+            return None
+        self._index.move_to_end(key)
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+
+# Global media store
+store = MediaStore(config.MEDIA_STORE_PATH, config.MEDIA_STORE_MAX_BYTES)
@@ -0,0 +1,80 @@
+"""
+In-process metrics for the bot
+Counters, gauges and timing samples that cogs and utils can report into
+"""
+
+from collections import defaultdict, deque
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Simple registry of counters, gauges and timings"""
+
+    def __init__(self, max_samples=1000):
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self.timings = defaultdict(lambda: deque(maxlen=max_samples))
+
+    def incr(self, name, value=1):
+        """Increase a counter"""
+        self.counters[name] += value
+
+    def gauge(self, name, value):
+        """Set a gauge to a value, or to a callable evaluated on snapshot"""
+        self.gauges[name] = value
+
+    def observe(self, name, value):
+        """Record a timing/size sample (only the most recent ones are kept)"""
+        self.timings[name].append(value)
+
+    def snapshot(self):
+        """Get all current metric values"""
+        timings = {}
+        for name, samples in self.timings.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            timings[name] = {
+                'count': len(ordered),
+                'avg': sum(ordered) / len(ordered),
+                'p50': ordered[len(ordered) // 2],
+                'p95': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+                'max': ordered[-1]
+            }
+        return {
+            'counters': dict(self.counters),
+            'gauges': {name: value() if callable(value) else value for name, value in self.gauges.items()},
+            'timings': timings
+        }
+
+    def report(self):
+        """Snapshot as sorted 'name value' lines, for the logs and /bot-stats"""
+        snapshot = self.snapshot()
+        lines = [f'{name} {value}' for name, value in sorted(snapshot['counters'].items())]
+        for name, value in sorted(snapshot['gauges'].items()):
+            # Components like the HTTP pool report a dict of values as one gauge
+            values = {f'{name}.{key}': item for key, item in value.items()} if isinstance(value, dict) else {name: value}
+            lines += [f'{key} {_format(item)}' for key, item in values.items()]
+        for name, timing in sorted(snapshot['timings'].items()):
+            lines.append(
+                f"{name} count={timing['count']} avg={_format(timing['avg'])} p50={_format(timing['p50'])} "
+                f"p95={_format(timing['p95'])} max={_format(timing['max'])}"
+            )
+        return lines
+
+    async def log_every(self, interval):
+        """Log the report every `interval` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            logger.info('Metrics:\n' + '\n'.join(self.report()))
+
+
+def _format(value):
+    return f'{value:.3f}' if isinstance(value, float) else str(value)
+
+
+# Global metrics registry
+metrics = Metrics()
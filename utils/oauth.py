@@ -3,10 +3,10 @@ OAuth handler for Facebook Pages
 Manages Facebook authentication and token exchange
 """
 
-import aiohttp
 from urllib.parse import urlencode
 from aiohttp import web
 import asyncio
+from utils.http import http
 import config
 
 
@@ -41,14 +41,13 @@ class FacebookOAuth:
             'code': code
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(config.FACEBOOK_TOKEN_URL, params=params) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data.get('access_token')
-                else:
-                    error = await resp.text()
-                    raise Exception(f"Token exchange failed: {error}")
+        async with http.session.get(config.FACEBOOK_TOKEN_URL, params=params) as resp:
+            if resp.status == 200:
+                data = await resp.json()
+                return data.get('access_token')
+            else:
+                error = await resp.text()
+                raise Exception(f"Token exchange failed: {error}")
     
     async def get_long_lived_token(self, short_token):
         """Get long-lived user token (60 days)"""
@@ -59,12 +58,11 @@ class FacebookOAuth:
             'fb_exchange_token': short_token
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(config.FACEBOOK_TOKEN_URL, params=params) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data.get('access_token')
-                return short_token  # Return original if exchange fails
+        async with http.session.get(config.FACEBOOK_TOKEN_URL, params=params) as resp:
+            if resp.status == 200:
+                data = await resp.json()
+                return data.get('access_token')
+            return short_token  # Return original if exchange fails
     
     async def get_user_pages(self, user_token):
         """Get list of pages user manages"""
@@ -74,13 +72,12 @@ class FacebookOAuth:
             'fields': 'id,name,access_token,tasks'
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                else:
-                    error = await resp.text()
-                    raise Exception(f"Failed to get pages: {error}")
+        async with http.session.get(url, params=params) as resp:
+            if resp.status == 200:
+                return await resp.json()
+            else:
+                error = await resp.text()
+                raise Exception(f"Failed to get pages: {error}")
     
     async def handle_callback(self, request):
         """Handle OAuth callback from Facebook"""
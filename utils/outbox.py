@@ -0,0 +1,123 @@
+"""
+Durable publish outbox for Facebook posts
+Every publish is a facebook_posts job run by the scheduler, retried with backoff or dead-lettered
+"""
+
+from datetime import datetime, timedelta
+import asyncio
+import random
+import aiohttp
+from utils.graph import GraphAPIError
+from utils.metrics import metrics
+import config
+
+
+def is_retryable(error):
+    """Transient Graph errors, throttling and network failures are retried; anything else is permanent"""
+    if isinstance(error, GraphAPIError):
+        return error.retryable
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError))
+
+
+def backoff(attempt):
+    """Exponential backoff with jitter, in seconds"""
+    delay = min(config.OUTBOX_BACKOFF_INITIAL * 2 ** (attempt - 1), config.OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class Outbox:
+    """Publish queue on top of facebook_posts and the post scheduler"""
+
+    def __init__(self):
+        self.db = None
+        self.scheduler = None
+        self.publisher = None
+        self._waiters = {}  # post _id -> future for callers waiting on the outcome
+
+    def setup(self, db, scheduler, publisher):
+        """Publish jobs with `publisher(post) -> fb_post_id`; the scheduler runs and leases the jobs"""
+        self.db = db
+        self.scheduler = scheduler
+        self.publisher = publisher
+        scheduler.set_facebook_callback(self.process)
+
+    async def enqueue(self, post, wait=None):
+        """Store a publish job (due now unless scheduled_at is set)
+
+        With `wait`, wait up to that many seconds and return the Facebook post ID, or None if the
+        job is still queued (e.g. waiting for a retry). Raises the error if the job is dead-lettered.
+        """
+        post.setdefault('scheduled_at', datetime.utcnow())
+        post['status'] = 'scheduled'
+        await self.db.save_facebook_post(post)
+        metrics.incr('outbox.enqueued')
+
+        future = None
+        if wait:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[post['_id']] = future
+        self.scheduler.notify(post)
+        if not future:
+            return None
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), wait)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiters.pop(post['_id'], None)
+
+    async def process(self, post):
+        """Scheduler callback for a leased job: publish, then mark it published, retry or dead-letter"""
+        fb_post_id = post.get('fb_post_id')
+        if fb_post_id:
+            # A previous holder published it but lost its lease before marking it published
+            metrics.incr('outbox.already_published')
+        else:
+            try:
+                fb_post_id = await self.publisher(post)
+            except Exception as e:
+                await self.fail(post, e)
+                return
+            await self.db.record_facebook_post_id(post['_id'], post.get('lease_owner'), fb_post_id)
+
+        await self.db.update_facebook_post_status(post['_id'], 'published', fb_post_id, owner=post.get('lease_owner'))
+        metrics.incr('outbox.published')
+        self._resolve(post['_id'], fb_post_id)
+
+    async def fail(self, post, error):
+        attempts = post.get('attempts', 1)
+        retryable = is_retryable(error)
+        if retryable and attempts < config.OUTBOX_MAX_ATTEMPTS:
+            delay = backoff(attempts)
+            retry_at = datetime.utcnow() + timedelta(seconds=delay)
+            if await self.db.retry_facebook_post(post['_id'], post.get('lease_owner'), retry_at, str(error)):
+                self.scheduler.requeue({**post, 'status': 'scheduled', 'scheduled_at': retry_at})
+            metrics.incr('outbox.retries')
+            print(f'🔁 Post {post["_id"]} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}')
+            return
+
+        await self.db.dead_letter_facebook_post(post, str(error), retryable)
+        metrics.incr('outbox.dead_letters')
+        print(f'❌ Post {post["_id"]} dead-lettered after {attempts} attempts: {error}')
+        self._resolve(post['_id'], error=error)
+
+    async def replay(self, letter_id, server_id):
+        """Requeue a dead-lettered post; returns (letter, post) as replay_dead_letter does"""
+        letter, post = await self.db.replay_dead_letter(letter_id, server_id)
+        if post:
+            metrics.incr('outbox.replayed')
+            self.scheduler.notify(post)
+        return letter, post
+
+    def _resolve(self, post_id, result=None, error=None):
+        future = self._waiters.pop(post_id, None)
+        if future and not future.done():
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+# Global publish outbox
+outbox = Outbox()
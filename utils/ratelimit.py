@@ -0,0 +1,160 @@
+"""
+Rate limiting for Graph API calls
+Token buckets per app, per page/account and per endpoint class, tuned by Graph usage headers
+"""
+
+import asyncio
+import json
+import time
+from utils.metrics import metrics
+import config
+
+
+class TokenBucket:
+    """O(1) token bucket; waiters are served one at a time in FIFO order"""
+
+    def __init__(self, max_calls, window, burst=0):
+        self.base_rate = max_calls / window  # tokens per second
+        self.rate = self.base_rate
+        # Without a burst limit the bucket holds a whole window, like the old sliding window did
+        self.capacity = max(1, min(burst or max_calls, max_calls))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        # asyncio.Lock wakes waiters in order, so only the head of the queue sleeps on the bucket
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait for a token"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                metrics.observe('ratelimit.wait_seconds', wait)
+                await asyncio.sleep(wait)
+
+    def can_spare(self, calls, reserve):
+        """Whether `calls` tokens are free right now while keeping `reserve` (a share of capacity) for others
+
+        Never true while anyone is waiting, so a background caller does not queue ahead of them.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if self.blocked_until > now or self._lock.locked():
+            return False
+        kept = reserve * self.capacity
+        return self.tokens - min(calls, self.capacity - kept) >= kept
+
+    def adapt(self, usage_percent, regain_seconds=0):
+        """Slow down as reported usage approaches 100%, pause when it is reached"""
+        now = time.monotonic()
+        self._refill(now)
+        threshold = config.GRAPH_USAGE_THROTTLE_PERCENT
+        if usage_percent >= 100 or regain_seconds > 0:
+            pause = regain_seconds or config.GRAPH_USAGE_BACKOFF_SECONDS
+            self.blocked_until = max(self.blocked_until, now + pause)
+            self.tokens = 0
+            print(f'⚠️ Graph API usage at {usage_percent}%, pausing calls for {pause:.0f}s')
+        elif usage_percent >= threshold:
+            factor = (100 - usage_percent) / (100 - threshold)
+            self.rate = self.base_rate * max(factor, 0.05)
+        else:
+            self.rate = self.base_rate
+
+
+class GraphRateLimiter:
+    """Rate limiter for one Graph API app, keyed per page/account and per endpoint class"""
+
+    def __init__(self, name, app_max_calls, page_max_calls, endpoint_max_calls, window):
+        self.name = name
+        self.window = window
+        self.page_max_calls = page_max_calls
+        self.endpoint_max_calls = endpoint_max_calls
+        self.app = TokenBucket(app_max_calls, window, config.RATE_LIMIT_BURST)
+        self.pages = {}  # page/account id -> TokenBucket
+        self.endpoints = {}  # endpoint class -> TokenBucket
+
+    def _page(self, page_id):
+        if page_id not in self.pages:
+            self.pages[page_id] = TokenBucket(self.page_max_calls, self.window, config.RATE_LIMIT_BURST)
+        return self.pages[page_id]
+
+    def _endpoint(self, endpoint):
+        if endpoint not in self.endpoints:
+            max_calls = self.endpoint_max_calls.get(endpoint, self.page_max_calls)
+            self.endpoints[endpoint] = TokenBucket(max_calls, self.window, config.RATE_LIMIT_BURST)
+        return self.endpoints[endpoint]
+
+    async def acquire(self, page_id=None, endpoint='read'):
+        """Wait until the app, the page and the endpoint class all allow another call"""
+        metrics.incr(f'{self.name}.calls')
+        await self.app.acquire()
+        if page_id:
+            await self._page(page_id).acquire()
+        await self._endpoint(endpoint).acquire()
+
+    def can_spare(self, calls, page_id=None, endpoint='read', reserve=0.0):
+        """Whether low-priority work can make `calls` calls now without eating into the reserve"""
+        buckets = [self.app, self._endpoint(endpoint)]
+        if page_id:
+            buckets.append(self._page(page_id))
+        return all(bucket.can_spare(calls, reserve) for bucket in buckets)
+
+    def update_from_headers(self, headers, page_id=None):
+        """Adapt rates from X-App-Usage, X-Page-Usage and X-Business-Use-Case-Usage"""
+        app_usage = _parse_usage(headers.get('X-App-Usage'))
+        if app_usage is not None:
+            self.app.adapt(_usage_percent(app_usage))
+
+        if page_id:
+            page_usage = _parse_usage(headers.get('X-Page-Usage'))
+            if page_usage is not None:
+                self._page(page_id).adapt(_usage_percent(page_usage))
+
+            buc_usage = _parse_usage(headers.get('X-Business-Use-Case-Usage')) or {}
+            entries = [entry for group in buc_usage.values() for entry in group]
+            if entries:
+                self._page(page_id).adapt(
+                    max(_usage_percent(entry) for entry in entries),
+                    max(entry.get('estimated_time_to_regain_access', 0) for entry in entries) * 60
+                )
+
+
+def _parse_usage(header):
+    if not header:
+        return None
+    try:
+        return json.loads(header)
+    except ValueError:
+        return None
+
+
+def _usage_percent(usage):
+    return max(usage.get('call_count', 0), usage.get('total_time', 0), usage.get('total_cputime', 0))
+
+
+# Global limiters
+facebook_limiter = GraphRateLimiter(
+    'facebook',
+    config.FACEBOOK_MAX_CALLS,
+    config.FACEBOOK_PAGE_MAX_CALLS,
+    config.FACEBOOK_ENDPOINT_MAX_CALLS,
+    config.RATE_LIMIT_WINDOW
+)
+instagram_limiter = GraphRateLimiter(
+    'instagram',
+    config.INSTAGRAM_MAX_CALLS,
+    config.INSTAGRAM_ACCOUNT_MAX_CALLS,
+    config.INSTAGRAM_ENDPOINT_MAX_CALLS,
+    config.RATE_LIMIT_WINDOW
+)
@@ -1,71 +1,223 @@
 """
 Post scheduler for scheduled Facebook posts
-Uses APScheduler to check and publish scheduled posts
+Keeps upcoming posts in an in-memory heap and publishes them when due
 """
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
 import asyncio
+import heapq
+import itertools
+import os
+import socket
+import uuid
+from utils.metrics import metrics
+import config
 
 
 class PostScheduler:
     """Scheduler for Facebook posts"""
-    
+
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
         self.facebook_callback = None
         self.is_running = False
-    
+        self.db = None
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'  # lease owner id for this instance
+        self._queue = []  # heap of (scheduled_at, seq, post)
+        self._queued = set()  # _ids in the heap or waiting for a worker
+        self._inflight = set()  # _ids being published right now
+        self._pending = OrderedDict()  # server_id -> deque of due posts, in round-robin order
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._ready = None
+        self._tasks = []
+
+        metrics.gauge('scheduler.queue_depth', lambda: len(self._queue))
+        metrics.gauge('scheduler.due_depth', lambda: sum(len(posts) for posts in self._pending.values()))
+        metrics.gauge('scheduler.inflight', lambda: len(self._inflight))
+
     def start(self):
         """Start the scheduler"""
         if not self.is_running:
             self.scheduler.start()
+            self._wakeup = asyncio.Event()
+            self._ready = asyncio.Condition()
+            self._tasks = [asyncio.create_task(self._run())]
+            self._tasks += [
+                asyncio.create_task(self._worker())
+                for _ in range(config.SCHEDULER_PUBLISH_CONCURRENCY)
+            ]
             self.is_running = True
-            print('✅ Post scheduler started')
-    
+            print(f'✅ Post scheduler started ({config.SCHEDULER_PUBLISH_CONCURRENCY} publish workers)')
+
     def stop(self):
         """Stop the scheduler"""
         if self.is_running:
             self.scheduler.shutdown()
+            for task in self._tasks:
+                task.cancel()
+            self._tasks = []
             self.is_running = False
             print('✅ Post scheduler stopped')
-    
+
     def set_facebook_callback(self, callback):
         """Set the function to call when publishing Facebook posts"""
         self.facebook_callback = callback
         print('✅ Facebook callback registered')
-    
-    async def check_scheduled_posts(self, db):
-        """Check for Facebook posts that need to be published"""
+
+    def horizon(self):
+        """Latest due time kept in memory; later posts wait for a reconcile"""
+        return datetime.utcnow() + timedelta(seconds=config.SCHEDULER_RECONCILE_INTERVAL * 2)
+
+    def notify(self, post):
+        """Queue a newly scheduled post and wake the dispatcher"""
+        if post['scheduled_at'] <= self.horizon() and self._push(post):
+            self._wake()
+
+    def requeue(self, post):
+        """Queue a post again from its own publish callback (retries)"""
+        self._inflight.discard(post['_id'])
+        self.notify(post)
+
+    def notify_many(self, posts):
+        """Queue a batch of newly scheduled posts and wake the dispatcher once"""
+        horizon = self.horizon()
+        added = sum(1 for post in posts if post['scheduled_at'] <= horizon and self._push(post))
+        if added:
+            self._wake()
+
+    def _push(self, post):
+        """Add a post to the heap unless it is already queued or publishing"""
+        if post['_id'] in self._queued or post['_id'] in self._inflight:
+            return False
+        self._queued.add(post['_id'])
+        heapq.heappush(self._queue, (post['scheduled_at'], next(self._seq), post))
+        return True
+
+    def _wake(self):
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def reconcile(self, db):
+        """Load posts due before the horizon from the database"""
+        try:
+            posts = await db.get_facebook_scheduled_posts(
+                until=self.horizon(),
+                limit=config.SCHEDULER_LOAD_LIMIT
+            )
+            added = sum(1 for post in posts if self._push(post))
+            if added:
+                print(f'📅 Queued {added} upcoming scheduled posts')
+                self._wake()
+        except Exception as e:
+            print(f'❌ Error loading scheduled posts: {e}')
+
+    async def _run(self):
+        """Sleep until the next post is due, then hand it to the workers"""
+        while True:
+            self._wakeup.clear()
+
+            now = datetime.utcnow()
+            due = []
+            while self._queue and self._queue[0][0] <= now:
+                due.append(heapq.heappop(self._queue)[2])
+            if due:
+                async with self._ready:
+                    for post in due:
+                        self._pending.setdefault(post.get('server_id'), deque()).append(post)
+                    self._ready.notify(len(due))
+
+            timeout = None
+            if self._queue:
+                timeout = max((self._queue[0][0] - datetime.utcnow()).total_seconds(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _next_post(self):
+        """Take the next due post, rotating across servers so none is starved"""
+        async with self._ready:
+            await self._ready.wait_for(lambda: self._pending)
+            server_id, posts = self._pending.popitem(last=False)
+            post = posts.popleft()
+            if posts:
+                self._pending[server_id] = posts
+            self._queued.discard(post['_id'])
+            self._inflight.add(post['_id'])
+            return post
+
+    async def _worker(self):
+        while True:
+            post = await self._next_post()
+            try:
+                await self._publish(post)
+            finally:
+                self._inflight.discard(post['_id'])
+
+    async def _publish(self, post):
         if not self.facebook_callback:
             return
-        
         try:
-            posts = db.get_facebook_scheduled_posts()
-            
-            if posts:
-                print(f'📅 Found {len(posts)} scheduled posts to publish')
-            
-            for post in posts:
-                try:
-                    await self.facebook_callback(post)
-                except Exception as e:
-                    print(f'❌ Error publishing scheduled post {post.get("_id")}: {e}')
+            # Lease the post so no other instance (or overlapping run) publishes it too
+            claimed = await self.db.claim_facebook_post(post['_id'], self.owner, config.SCHEDULER_LEASE_SECONDS)
+            if not claimed:
+                metrics.incr('scheduler.claims_lost')
+                return
         except Exception as e:
-            print(f'❌ Error checking scheduled posts: {e}')
-    
+            print(f'❌ Error claiming scheduled post {post.get("_id")}: {e}')
+            return
+
+        lag = (datetime.utcnow() - claimed['scheduled_at']).total_seconds()
+        metrics.observe('scheduler.publish_lag_seconds', lag)
+        # The callback may wait on the rate limiter for a long time, so the lease is renewed meanwhile
+        publish = asyncio.ensure_future(self.facebook_callback(claimed))
+        heartbeat = asyncio.create_task(self._keep_lease(claimed['_id'], publish))
+        try:
+            await publish
+            metrics.incr('scheduler.published')
+        except asyncio.CancelledError:
+            if not heartbeat.done():
+                raise
+            print(f'⚠️ Lost the lease on post {post.get("_id")}, left it to the instance that took it over')
+        except Exception as e:
+            metrics.incr('scheduler.publish_errors')
+            print(f'❌ Error publishing scheduled post {post.get("_id")} (lag {lag:.1f}s): {e}')
+        finally:
+            heartbeat.cancel()
+
+    async def _keep_lease(self, post_id, publish):
+        """Renew a lease every third of its length; cancel `publish` if it was lost anyway"""
+        while True:
+            await asyncio.sleep(config.SCHEDULER_LEASE_SECONDS / 3)
+            try:
+                renewed = await self.db.renew_facebook_post_lease(post_id, self.owner, config.SCHEDULER_LEASE_SECONDS)
+            except Exception as e:
+                print(f'❌ Error renewing lease on post {post_id}: {e}')
+                continue
+            if not renewed:
+                metrics.incr('scheduler.leases_lost')
+                publish.cancel()
+                return
+
     def schedule_check(self, db):
-        """Schedule periodic checks for posts"""
+        """Schedule periodic reconciliation with the database"""
+        self.db = db
         if not self.scheduler.get_job('check_facebook_posts'):
             self.scheduler.add_job(
-                self.check_scheduled_posts,
+                self.reconcile,
                 'interval',
-                minutes=1,
+                seconds=config.SCHEDULER_RECONCILE_INTERVAL,
                 args=[db],
                 id='check_facebook_posts',
-                name='Check Facebook Scheduled Posts'
+                name='Reconcile Facebook Scheduled Posts',
+                next_run_time=datetime.now(),
+                max_instances=1,
+                coalesce=True
             )
-            print('✅ Scheduled post checker configured (runs every 1 minute)')
+            print(f'✅ Scheduled post reconciler configured (runs every {config.SCHEDULER_RECONCILE_INTERVAL}s)')
 
 
 # Global scheduler
@@ -0,0 +1,207 @@
+"""
+Streaming media uploads
+Pipes files from the Discord CDN to the Graph upload endpoints in fixed-size chunks
+"""
+
+import asyncio
+import random
+import aiohttp
+from aiohttp.payload import AsyncIterablePayload
+from utils.graph import graph, graph_video
+from utils.http import http
+from utils.instagram import instagram
+from utils.metrics import metrics
+from utils.outbox import is_retryable
+import config
+
+
+class UploadError(Exception):
+    """An upload could not be started or completed"""
+
+
+class StreamSource:
+    """Downloads a remote file ahead of the uploader, keeping at most UPLOAD_READ_AHEAD chunks in memory"""
+
+    def __init__(self, url):
+        self.url = url
+        self._queue = asyncio.Queue(maxsize=config.UPLOAD_READ_AHEAD)
+        self._buffer = b''
+        self._task = None
+        self._resp = None
+
+    async def __aenter__(self):
+        # No total timeout: big files may take longer than a normal API call, only stalls should fail
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=config.HTTP_TOTAL_TIMEOUT)
+        self._resp = await http.session.get(self.url, timeout=timeout)
+        try:
+            self._resp.raise_for_status()
+        except aiohttp.ClientResponseError:
+            # __aexit__ does not run when __aenter__ raises, so give the connection back here
+            self._resp.release()
+            raise
+        self._task = asyncio.create_task(self._pump())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        self._resp.release()
+
+    async def _pump(self):
+        try:
+            async for chunk in self._resp.content.iter_chunked(config.UPLOAD_CHUNK_SIZE):
+                await self._queue.put(chunk)
+        except Exception as e:
+            await self._queue.put(e)
+            return
+        await self._queue.put(None)
+
+    async def read(self, size):
+        """Next `size` bytes (fewer only at the end of the file)"""
+        while len(self._buffer) < size:
+            chunk = await self._queue.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        metrics.incr('upload.bytes_read', len(data))
+        return data
+
+    async def chunks(self):
+        """Yield the rest of the file in UPLOAD_CHUNK_SIZE pieces"""
+        while True:
+            data = await self.read(config.UPLOAD_CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+
+async def with_retries(send, what):
+    """Call `send()` again on retryable failures, with exponential backoff and jitter"""
+    for attempt in range(1, config.UPLOAD_CHUNK_RETRIES + 1):
+        try:
+            return await send()
+        except Exception as e:
+            if attempt == config.UPLOAD_CHUNK_RETRIES or not is_retryable(e):
+                raise
+            metrics.incr('upload.chunk_retries')
+            delay = min(2 ** attempt, 30) * random.uniform(0.5, 1.0)
+            print(f'🔁 {what} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}')
+            await asyncio.sleep(delay)
+
+
+async def upload_facebook_photo(page_id, access_token, url, filename, content_type, caption=None):
+    """Stream an image into a multipart `source` upload; the whole request is retried on failure"""
+    async def send():
+        async with StreamSource(url) as source:
+            with aiohttp.MultipartWriter('form-data') as form:
+                part = form.append_payload(AsyncIterablePayload(source.chunks(), content_type=content_type))
+                part.set_content_disposition('form-data', name='source', filename=filename)
+                params = {'access_token': access_token}
+                if caption:
+                    params['caption'] = caption
+                return await graph.request('POST', f"{page_id}/photos", params=params, data=form,
+                                           page_id=page_id, endpoint='publish')
+
+    data = await with_retries(send, 'Photo upload')
+    return data['id']
+
+
+async def upload_facebook_photo_data(page_id, access_token, data, filename, content_type, caption=None, published=True):
+    """Upload an image already in memory (e.g. a preprocessed one) as a multipart `source`
+
+    With `published=False` the photo is only stored, to be attached to posts by its ID.
+    """
+    async def send():
+        form = aiohttp.FormData()
+        form.add_field('access_token', access_token)
+        if caption:
+            form.add_field('caption', caption)
+        if not published:
+            form.add_field('published', 'false')
+        form.add_field('source', data, filename=filename, content_type=content_type)
+        return await graph.request('POST', f"{page_id}/photos", data=form, page_id=page_id, endpoint='publish')
+
+    result = await with_retries(send, 'Photo upload')
+    return result['id']
+
+
+async def upload_facebook_video(page_id, access_token, url, size, description=None):
+    """Resumable (start / transfer / finish) page video upload
+
+    Facebook decides each chunk's offsets, so chunks go one after another; the next chunk is
+    downloaded while the current one uploads, and a failed chunk is resent from memory.
+    """
+    path = f"{page_id}/videos"
+    start = await graph_video.post(path, {
+        'upload_phase': 'start',
+        'file_size': size,
+        'access_token': access_token
+    }, page_id=page_id)
+    session_id = start['upload_session_id']
+    start_offset, end_offset = int(start['start_offset']), int(start['end_offset'])
+
+    async with StreamSource(url) as source:
+        while start_offset < end_offset:
+            chunk = await source.read(end_offset - start_offset)
+            if not chunk:
+                raise UploadError(f'File ended at byte {start_offset} of {size}')
+
+            async def send(chunk=chunk, offset=start_offset):
+                form = aiohttp.FormData()
+                form.add_field('upload_phase', 'transfer')
+                form.add_field('upload_session_id', session_id)
+                form.add_field('start_offset', str(offset))
+                form.add_field('access_token', access_token)
+                form.add_field('video_file_chunk', chunk, filename='chunk', content_type='application/octet-stream')
+                return await graph_video.request('POST', path, data=form, page_id=page_id, endpoint='publish')
+
+            transfer = await with_retries(send, f'Video chunk at byte {start_offset}')
+            metrics.incr('upload.chunks')
+            start_offset, end_offset = int(transfer['start_offset']), int(transfer['end_offset'])
+
+    params = {'upload_phase': 'finish', 'upload_session_id': session_id, 'access_token': access_token}
+    if description:
+        params['description'] = description
+    await graph_video.post(path, params, page_id=page_id)
+    return start['video_id']
+
+
+async def upload_instagram_video(ig_id, access_token, url, size, caption=None, media_type='REELS'):
+    """Create a resumable video container and upload the file to it in chunks; returns the container ID"""
+    params = {"media_type": media_type, "upload_type": "resumable", "access_token": access_token}
+    if caption:
+        params["caption"] = caption
+    container = await instagram.post(f"{ig_id}/media", params)
+    if "id" not in container or "uri" not in container:
+        raise UploadError(f"Failed to create upload container: {container}")
+
+    offset = 0
+    async with StreamSource(url) as source:
+        async for chunk in source.chunks():
+            async def send(chunk=chunk, offset=offset):
+                headers = {
+                    'Authorization': f'OAuth {access_token}',
+                    'offset': str(offset),
+                    'file_size': str(size)
+                }
+                async with http.session.post(container["uri"], headers=headers, data=chunk) as resp:
+                    if resp.status >= 500:
+                        # Server side, worth resending the chunk; the body may well not be JSON
+                        resp.raise_for_status()
+                    try:
+                        body = await resp.json(content_type=None)
+                    except ValueError:
+                        body = await resp.text()
+                    if resp.status != 200:
+                        raise UploadError(f"Upload rejected: {body}")
+                    return body
+
+            await with_retries(send, f'Reel chunk at byte {offset}')
+            metrics.incr('upload.chunks')
+            offset += len(chunk)
+
+    if offset != size:
+        raise UploadError(f'Uploaded {offset} of {size} bytes')
+    return container["id"]
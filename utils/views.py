@@ -0,0 +1,70 @@
+"""
+Registry for live Discord UI views
+Bounds how many interactive views are kept in memory and for how long
+"""
+
+from collections import OrderedDict
+import asyncio
+from discord import ui
+from utils.metrics import metrics
+import config
+
+
+class ViewRegistry:
+    """Tracks live views; the least recently used one is stopped when `maxsize` is exceeded"""
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize or config.VIEW_REGISTRY_MAX_LIVE
+        self._views = OrderedDict()  # id(view) -> view
+        self._closing = set()  # on_timeout tasks of evicted views, kept so they are not garbage-collected
+
+        metrics.gauge('views.live', lambda: len(self._views))
+
+    def register(self, view):
+        """Start tracking a view, evicting the oldest idle ones if over the limit"""
+        self._views[id(view)] = view
+        while len(self._views) > self.maxsize:
+            _, oldest = self._views.popitem(last=False)
+            metrics.incr('views.evicted')
+            oldest.stop()
+            task = asyncio.create_task(oldest.on_timeout())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    def touch(self, view):
+        """Mark a view as recently used"""
+        if id(view) in self._views:
+            self._views.move_to_end(id(view))
+
+    def discard(self, view):
+        """Stop tracking a view"""
+        self._views.pop(id(view), None)
+
+    def __len__(self):
+        return len(self._views)
+
+
+class RegisteredView(ui.View):
+    """View with a bounded lifetime that is tracked in the view registry
+
+    Subclasses overriding `on_timeout` must call `super().on_timeout()`.
+    """
+
+    def __init__(self, timeout=None):
+        super().__init__(timeout=timeout or config.VIEW_TIMEOUT)
+        views.register(self)
+
+    async def interaction_check(self, interaction):
+        views.touch(self)
+        return True
+
+    def stop(self):
+        views.discard(self)
+        super().stop()
+
+    async def on_timeout(self):
+        views.discard(self)
+
+
+# Global view registry
+views = ViewRegistry()